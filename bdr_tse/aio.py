@@ -0,0 +1,486 @@
+"""Talking to the TSE from :mod:`asyncio` code.
+
+:class:`AsyncTseConnector` offers the commands of :class:`~bdr_tse.TseConnector`
+as coroutines::
+
+    async with AsyncTseConnector("/mnt/tse") as tse:
+        started = await tse.start_transaction("POS-1", b"", "")
+
+The blocking I/O with the TSE is done in a dedicated I/O thread, one per
+connector. While waiting for the TSE to answer, the I/O thread is idle and the
+event loop sleeps with :func:`asyncio.sleep`, so polling the TSE does not block
+the event loop. Commands sent concurrently are queued and sent to the TSE one
+after the other.
+
+Cancelling a command while its response is read in fragments aborts the
+fragmented read on the TSE. If a command is cancelled before the TSE has
+answered, its response is discarded.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, List, Mapping, Optional
+import asyncio
+import functools
+import time
+
+from bdr_tse import exceptions
+from bdr_tse.backends import TransportBackend
+from bdr_tse.device_info import DeviceInfoCache
+from bdr_tse.export import (
+    ExportCheckpoint,
+    ExportFile,
+    PagedExport,
+    export_data_params,
+)
+from bdr_tse.metrics import TransportMetrics
+from bdr_tse.msc_transport import PollingProfile
+from bdr_tse.tracing import Span, TransportHook
+from bdr_tse.transport import (
+    TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ,
+    TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ,
+    ResponseStream,
+    Transport,
+    TransportCommand,
+    TransportDataTupleType,
+    _param_size,
+)
+from bdr_tse.transport_errors import TransportErrorNoDataAvailable
+from bdr_tse.tse_connector import TseConnector
+
+
+def _advance(steps):
+    """Advance a generator. Returns whether it is exhausted, and the value it
+    yielded or returned. StopIteration cannot be passed through futures."""
+    try:
+        return False, next(steps)
+    except StopIteration as e:
+        return True, e.value
+
+
+class AsyncTransport:
+    """Sends commands with a :class:`~bdr_tse.transport.Transport`, doing its I/O
+    in a dedicated I/O thread.
+
+    Backends that provide ``read_steps`` like
+    :meth:`~bdr_tse.msc_transport.MscTransport.read_steps` are polled from the
+    event loop, other backends wait for the response in the I/O thread.
+    """
+
+    def __init__(self, transport: Transport):
+        """
+        :param transport: The transport to send commands with. Its metrics and
+            hooks are used as well.
+        """
+        self.transport = transport
+        self._backend = transport._transport
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="bdr-tse-io"
+        )
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _io(self, func: Callable, *args) -> asyncio.Future:
+        """Call ``func`` in the I/O thread. It is queued immediately."""
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _read(self, cmd) -> bytes:
+        read_steps = getattr(self._backend, "read_steps", None)
+        if read_steps is None:
+            return await self._io(functools.partial(self._backend.read, command=cmd))
+        steps = read_steps(command=cmd)
+        while True:
+            done, value = await self._io(_advance, steps)
+            if done:
+                return value
+            await asyncio.sleep(value)
+
+    async def _continue(self, cmd) -> bytes:
+        await self._io(self._backend.write, TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ)
+        return await self._read(cmd)
+
+    def _abort(self) -> asyncio.Future:
+        return self._io(self._backend.write, TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ)
+
+    async def send(self, cmd, params: List[TransportDataTupleType] = []):
+        """Like :meth:`~bdr_tse.transport.Transport.send`."""
+        stream = await self.send_stream(cmd, params)
+        async with stream:
+            fragments = [fragment async for fragment in stream]
+        return self.transport._result(stream._stream, b"".join(fragments))
+
+    async def send_stream(
+        self, cmd, params: List[TransportDataTupleType] = []
+    ) -> "AsyncResponseStream":
+        """Like :meth:`~bdr_tse.transport.Transport.send_stream`.
+
+        No other command is sent until the stream is complete or closed, so it
+        should be used as an asynchronous context manager.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        await self._lock.acquire()
+        try:
+            transport = self.transport
+            if transport.metrics is not None or transport._hooks:
+                stream = await self._send_stream_observed(cmd, params)
+            else:
+                await self._io(self._backend.write, transport._encode(cmd, params))
+                stream = transport._response_stream(cmd, await self._read(cmd))
+        except BaseException:
+            self._lock.release()
+            raise
+
+        async_stream = AsyncResponseStream(self, stream)
+        async_stream._release = self._lock.release
+        if stream.complete:
+            async_stream._finish()
+        return async_stream
+
+    async def _send_stream_observed(
+        self, cmd, params: List[TransportDataTupleType]
+    ) -> ResponseStream:
+        """Like :meth:`~bdr_tse.transport.Transport._send_stream_observed`."""
+        transport = self.transport
+        metrics = transport.metrics
+        span = None
+        if transport._hooks:
+            span = Span(cmd, [_param_size(p) for p in params])
+            transport._call_hooks("on_start", span)
+        start = time.perf_counter()
+        try:
+            command_data = transport._encode(cmd, params)
+            encoded = time.perf_counter()
+            await self._io(self._backend.write, command_data)
+            written = time.perf_counter()
+            raw_response = await self._read(cmd)
+            if metrics is not None:
+                metrics.observe(cmd, "encode", encoded - start)
+                metrics.observe(cmd, "write", written - encoded)
+                transport._observe_read(cmd, time.perf_counter() - written)
+            if span is not None:
+                span.command_size = len(command_data)
+            stream = transport._response_stream(cmd, raw_response)
+        except BaseException as e:
+            if metrics is not None:
+                metrics.observe(cmd, "total", time.perf_counter() - start)
+            if span is not None:
+                span.error = e
+                transport._end_span(span)
+            raise
+
+        stream._start = start
+        stream._span = span
+        stream._on_finish = transport._finish_stream
+        return stream
+
+    async def aclose(self):
+        """Close the backend and stop the I/O thread."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            await self._io(self._backend.close)
+        self._executor.shutdown(wait=False)
+
+
+class AsyncResponseStream:
+    """Asynchronous iterator over the fragments of the response data of a
+    command, as returned by :meth:`AsyncTransport.send_stream`. Behaves like
+    :class:`~bdr_tse.transport.ResponseStream`, including aborting the
+    fragmented read if it is closed early. Cancelling the task that iterates over
+    the stream aborts the fragmented read as well.
+    """
+
+    def __init__(self, transport: AsyncTransport, stream: ResponseStream):
+        self._transport = transport
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = None
+
+    @property
+    def command(self):
+        return self._stream.command
+
+    @property
+    def total_length(self) -> int:
+        """The length of the complete response data, as announced by the TSE"""
+        return self._stream.total_length
+
+    @property
+    def received_length(self) -> int:
+        """The length of the response data read from the TSE so far"""
+        return self._stream.received_length
+
+    @property
+    def fragment_count(self) -> int:
+        return self._stream.fragment_count
+
+    @property
+    def is_export_data_response(self) -> bool:
+        return self._stream.is_export_data_response
+
+    @property
+    def complete(self) -> bool:
+        """Whether all fragments have been read from the TSE."""
+        return self._stream.complete
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        stream = self._stream
+        if stream._next_fragment is not None:
+            fragment, stream._next_fragment = stream._next_fragment, None
+            return fragment
+        if stream._closed or stream.complete:
+            self._finish()
+            raise StopAsyncIteration
+
+        try:
+            fragment = await self._transport._continue(stream.command)
+        except asyncio.CancelledError:
+            # Queued in the I/O thread behind the read that was interrupted
+            stream._closed = True
+            self._transport._abort()
+            self._finish()
+            raise
+        except exceptions.BdrTseException as e:
+            stream._closed = True
+            try:
+                await asyncio.shield(self._transport._abort())
+            finally:
+                self._finish(e)
+            raise
+        stream.received_length += len(fragment)
+        stream.fragment_count += 1
+        return fragment
+
+    def _finish(self, error: Optional[BaseException] = None):
+        self._stream._finish(error)
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+
+    async def aclose(self):
+        """Stop reading the response, aborting the fragmented read on the TSE if
+        it is not complete yet."""
+        stream = self._stream
+        stream._next_fragment = None
+        try:
+            if not stream._closed and not stream.complete:
+                stream._closed = True
+                await asyncio.shield(self._transport._abort())
+        finally:
+            stream._closed = True
+            self._finish()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+
+async def _run_command(transport: AsyncTransport, command):
+    """Like :func:`~bdr_tse.tse_connector._run_command`, but sends the commands
+    with an :class:`AsyncTransport`."""
+    try:
+        request = next(command)
+        while True:
+            try:
+                response = await transport.send(*request)
+            except BaseException as e:
+                request = command.throw(e)
+            else:
+                request = command.send(response)
+    except StopIteration as e:
+        return e.value
+
+
+def _async_command(method):
+    """Turn a command method of :class:`~bdr_tse.TseConnector` into a coroutine
+    method of :class:`AsyncTseConnector`."""
+    command = method.__wrapped__
+
+    @functools.wraps(command)
+    async def wrapper(self, *args, **kwargs):
+        return await _run_command(self._transport, command(self, *args, **kwargs))
+
+    return wrapper
+
+
+class AsyncTseConnector:
+    """The commands of :class:`~bdr_tse.TseConnector`, as coroutines.
+
+    Use it as an asynchronous context manager, or call :meth:`aclose` when done.
+    """
+
+    AuthenticationResult = TseConnector.AuthenticationResult
+    UserId = TseConnector.UserId
+
+    def __init__(
+        self,
+        tse_path=None,
+        polling_profiles: Optional[Mapping[TransportCommand, PollingProfile]] = None,
+        backend: Optional[TransportBackend] = None,
+        metrics: Optional[TransportMetrics] = None,
+        device_info: Optional[DeviceInfoCache] = None,
+    ):
+        """Takes the same parameters as :class:`~bdr_tse.TseConnector`.
+
+        Opening the TSE takes a single command, which is sent from the calling
+        thread.
+        """
+        self._transport = AsyncTransport(
+            Transport(
+                tse_path,
+                polling_profiles=polling_profiles,
+                backend=backend,
+                metrics=metrics,
+            )
+        )
+        #: The :class:`~bdr_tse.device_info.DeviceInfoCache` of the TSE
+        self.device_info = device_info if device_info is not None else DeviceInfoCache()
+
+    @property
+    def metrics(self) -> Optional[TransportMetrics]:
+        """The metrics that the latency of commands is recorded into, if any."""
+        return self._transport.transport.metrics
+
+    def add_hook(self, hook: TransportHook):
+        """Register a :class:`~bdr_tse.tracing.TransportHook` that is called for
+        every command sent to the TSE. Hooks are called in the event loop."""
+        self._transport.transport.add_hook(hook)
+
+    def remove_hook(self, hook: TransportHook):
+        """Unregister a hook registered with :func:`~AsyncTseConnector.add_hook`."""
+        self._transport.transport.remove_hook(hook)
+
+    async def aclose(self):
+        """Suspend and close the connection to the TSE."""
+        await self._transport.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    start = _async_command(TseConnector.start)
+    get_pin_status = _async_command(TseConnector.get_pin_status)
+    initialize_pin_values = _async_command(TseConnector.initialize_pin_values)
+    factory_reset = _async_command(TseConnector.factory_reset)
+    authenticate_user = _async_command(TseConnector.authenticate_user)
+    unblock_user = _async_command(TseConnector.unblock_user)
+    update_time = _async_command(TseConnector.update_time)
+    logout = _async_command(TseConnector.logout)
+    initialize = _async_command(TseConnector.initialize)
+    get_serial_number = _async_command(TseConnector.get_serial_number)
+    get_certificates = _async_command(TseConnector.get_certificates)
+    start_transaction = _async_command(TseConnector.start_transaction)
+    update_transaction = _async_command(TseConnector.update_transaction)
+    finish_transaction = _async_command(TseConnector.finish_transaction)
+    map_ers_to_key = _async_command(TseConnector.map_ers_to_key)
+    export_data = _async_command(TseConnector.export_data)
+    export_more_data = _async_command(TseConnector.export_more_data)
+    get_config_data = _async_command(TseConnector.get_config_data)
+    get_time_sync_interval = _async_command(TseConnector.get_time_sync_interval)
+    get_max_keys = _async_command(TseConnector.get_max_keys)
+    get_max_clients = _async_command(TseConnector.get_max_clients)
+    get_max_transactions = _async_command(TseConnector.get_max_transactions)
+    get_signature_algorithm = _async_command(TseConnector.get_signature_algorithm)
+    get_certification_id = _async_command(TseConnector.get_certification_id)
+
+    async def export_data_iter(
+        self,
+        client_id: str = None,
+        transaction_number: int = None,
+        start_transaction_number: int = None,
+        end_transaction_number: int = None,
+        start_date: int = None,
+        end_date: int = None,
+        max_records: int = None,
+        progress: Callable[[int, int], None] = None,
+    ) -> AsyncIterator[bytes]:
+        """Like :func:`~bdr_tse.TseConnector.export_data_iter`.
+
+        If the iterator is closed before it is exhausted, e.g. with
+        :func:`contextlib.aclosing`, or the consuming task is cancelled, the
+        export is aborted. No other command is sent until then.
+        """
+        stream = await self._transport.send_stream(
+            TransportCommand.ExportData,
+            export_data_params(
+                client_id=client_id,
+                transaction_number=transaction_number,
+                start_transaction_number=start_transaction_number,
+                end_transaction_number=end_transaction_number,
+                start_date=start_date,
+                end_date=end_date,
+                max_records=max_records,
+            ),
+        )
+        async with stream:
+            async for fragment in stream:
+                if progress:
+                    progress(stream.received_length, stream.total_length)
+                yield fragment
+
+    async def export_to_file(
+        self,
+        path,
+        client_id: str = None,
+        transaction_number: int = None,
+        start_transaction_number: int = None,
+        end_transaction_number: int = None,
+        start_date: int = None,
+        end_date: int = None,
+        max_records: int = None,
+        progress: Callable[[int, int], None] = None,
+    ):
+        """Like :func:`~bdr_tse.TseConnector.export_to_file`. The file is written
+        in the I/O thread."""
+        io = self._transport._io
+        export = ExportFile(path)
+        await io(export.open)
+        try:
+            stream = await self._transport.send_stream(
+                TransportCommand.ExportData,
+                export_data_params(
+                    client_id=client_id,
+                    transaction_number=transaction_number,
+                    start_transaction_number=start_transaction_number,
+                    end_transaction_number=end_transaction_number,
+                    start_date=start_date,
+                    end_date=end_date,
+                    max_records=max_records,
+                ),
+            )
+            async with stream:
+                await io(export.preallocate, stream.total_length)
+                async for fragment in stream:
+                    await io(export.write, fragment)
+                    if progress:
+                        progress(stream.received_length, stream.total_length)
+            await io(export.commit)
+        except BaseException:
+            export.abort()
+            raise
+        return export.result()
+
+    async def export_data_paged(
+        self, checkpoint: ExportCheckpoint = None, page_size: int = 1000
+    ) -> AsyncIterator[bytes]:
+        """Like :func:`~bdr_tse.TseConnector.export_data_paged`."""
+        pages = PagedExport(checkpoint, page_size)
+        key_serial_number = await self.get_serial_number()
+
+        while not pages.done:
+            try:
+                page = await self.export_more_data(
+                    key_serial_number,
+                    pages.checkpoint.last_signature_counter,
+                    max_records=page_size,
+                )
+            except TransportErrorNoDataAvailable:
+                return
+            if pages.add(page):
+                yield page
+                pages.processed()
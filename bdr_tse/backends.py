@@ -0,0 +1,254 @@
+"""Backends that :class:`~bdr_tse.transport.Transport` exchanges command and
+response data through.
+
+The default backend is :class:`~bdr_tse.msc_transport.MscTransport`, which talks
+to a TSE mounted as a mass storage device. Any object that implements
+:class:`TransportBackend` can be used instead, by passing it as the ``backend``
+of :class:`~bdr_tse.TseConnector`.
+
+Sessions with a backend can be captured to a file with :class:`RecordingBackend`
+and replayed later without a device with :class:`ReplayBackend`.
+"""
+
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Iterator, Optional, Protocol
+import time
+
+from bdr_tse.capture import (
+    RECORD_READ,
+    RECORD_READ_BLOCK,
+    RECORD_TIMEOUT,
+    RECORD_WRITE,
+    RECORD_WRITE_BLOCK,
+    CaptureRecord,
+    iter_capture,
+    write_capture_header,
+    write_capture_record,
+)
+from bdr_tse.exceptions import ProtocolError, TimeoutException
+from bdr_tse.msc_transport import (
+    DEFAULT_TIMEOUT,
+    POLL_HISTORY_LENGTH,
+    MscFrameCodec,
+    _COMMAND_DATA_OFFSET,
+    _LENGTH_OFFSET,
+    _RESPONSE_DATA_OFFSET,
+)
+
+
+class TransportBackend(Protocol):
+    """The interface of a transport backend."""
+
+    def write(self, command_data: bytes):
+        """Send command data to the TSE."""
+
+    def read(self, timeout=DEFAULT_TIMEOUT, command=None) -> bytes:
+        """Wait for the response to the last command and return its response
+        data.
+
+        :param timeout: The time in seconds to wait for the response before
+            raising a :class:`~bdr_tse.exceptions.TimeoutException`.
+        :param command: The command that the response belongs to.
+        """
+
+    def set_suspend(self, suspend: bool, timeout=DEFAULT_TIMEOUT):
+        """Set the suspend mode of the TSE."""
+
+    def close(self):
+        """Suspend and close the connection to the TSE."""
+
+
+def _poll_counts() -> Dict[Any, Deque[int]]:
+    return defaultdict(lambda: deque(maxlen=POLL_HISTORY_LENGTH))
+
+
+class MemoryBackend:
+    """A backend that passes command data directly to a
+    :class:`~bdr_tse.emulator.TseEmulator`, without MSC framing or polling.
+
+    The latency configured in the emulator is slept. A command that the emulator
+    does not answer times out immediately.
+    """
+
+    def __init__(self, emulator=None):
+        """
+        :param emulator: The :class:`~bdr_tse.emulator.TseEmulator` to talk to. A
+            new one is created if ``None``.
+        """
+        if emulator is None:
+            from bdr_tse.emulator import TseEmulator
+
+            emulator = TseEmulator()
+        self.emulator = emulator
+        self.poll_counts = _poll_counts()
+        self._response: Optional[bytes] = None
+        self._latency = 0.0
+
+    def write(self, command_data: bytes):
+        self._response, self._latency = self.emulator.handle(bytes(command_data))
+
+    def read(self, timeout=DEFAULT_TIMEOUT, command=None) -> bytes:
+        if self._response is None:
+            raise TimeoutException
+        if self._latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutException
+        if self._latency:
+            time.sleep(self._latency)
+        if command is not None:
+            self.poll_counts[command].append(1)
+        response, self._response = self._response, None
+        return response
+
+    def set_suspend(self, suspend: bool, timeout=DEFAULT_TIMEOUT):
+        pass
+
+    def close(self):
+        pass
+
+
+class RecordingBackend:
+    """A backend that forwards to another backend and captures the exchanged
+    command and response data to a file, to be replayed by
+    :class:`ReplayBackend`."""
+
+    def __init__(self, backend: TransportBackend, path):
+        """
+        :param backend: The backend to forward to.
+        :param path: The path of the capture file to write.
+        """
+        self.backend = backend
+        self._file = open(path, "wb")
+        write_capture_header(self._file)
+        self._start = time.monotonic()
+
+    @property
+    def poll_counts(self) -> Dict[Any, Deque[int]]:
+        return getattr(self.backend, "poll_counts", {})
+
+    def _record(self, record_type: int, data: bytes):
+        write_capture_record(
+            self._file,
+            CaptureRecord(time.monotonic() - self._start, record_type, bytes(data)),
+        )
+
+    def write(self, command_data: bytes):
+        self._record(RECORD_WRITE, command_data)
+        self.backend.write(command_data)
+
+    def read(self, timeout=DEFAULT_TIMEOUT, command=None) -> bytes:
+        try:
+            response = self.backend.read(timeout=timeout, command=command)
+        except TimeoutException:
+            self._record(RECORD_TIMEOUT, b"")
+            raise
+        self._record(RECORD_READ, response)
+        return response
+
+    def set_suspend(self, suspend: bool, timeout=DEFAULT_TIMEOUT):
+        self.backend.set_suspend(suspend, timeout=timeout)
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            self.backend.close()
+        finally:
+            self._file.close()
+
+
+def _payload_records(records: Iterator[CaptureRecord]) -> Iterator[CaptureRecord]:
+    """Translate the MSC blocks in a capture to the command and response data
+    they carry, skipping the blocks that enable or disable suspend mode. A capture
+    ring may have dropped the command that its oldest records respond to, so
+    records before the first command are skipped as well."""
+    started = False
+    skip_response = False
+    for record in records:
+        if record.record_type in (RECORD_WRITE, RECORD_WRITE_BLOCK):
+            started = True
+        elif not started:
+            continue
+
+        if record.record_type == RECORD_WRITE_BLOCK:
+            data = memoryview(record.data)
+            if data[_RESPONSE_DATA_OFFSET]:
+                # Suspend blocks carry a command instead of padding here
+                skip_response = True
+                continue
+            length = int.from_bytes(data[_LENGTH_OFFSET:_RESPONSE_DATA_OFFSET], "big")
+            command_data = data[_COMMAND_DATA_OFFSET : _COMMAND_DATA_OFFSET + length]
+            yield record._replace(record_type=RECORD_WRITE, data=bytes(command_data))
+        elif record.record_type == RECORD_READ_BLOCK:
+            if skip_response:
+                skip_response = False
+                continue
+            _, response_data = MscFrameCodec.parse_response(record.data)
+            yield record._replace(record_type=RECORD_READ, data=bytes(response_data))
+        else:
+            yield record
+
+
+class ReplayBackend:
+    """A backend that replays a session captured by :class:`RecordingBackend` or
+    a :class:`~bdr_tse.capture.CaptureRing`.
+
+    Written command data is checked against the capture, and reads return the
+    captured responses. This allows profiling the code above the transport
+    without a device.
+    """
+
+    def __init__(self, path, speed: Optional[float] = 1.0, strict: bool = True):
+        """
+        :param path: The path of the capture file.
+        :param speed: Replay the responses this many times faster than they were
+            captured. With ``None``, responses are returned immediately.
+        :param strict: Raise a :class:`~bdr_tse.exceptions.ProtocolError` if
+            written command data differs from the capture.
+        """
+        self.speed = speed
+        self.strict = strict
+        self.poll_counts = _poll_counts()
+        self._file = open(path, "rb")
+        self._records = _payload_records(iter_capture(self._file))
+        # Monotonic time at which the capture started, scaled by speed
+        self._start: Optional[float] = None
+
+    def _next_record(self) -> CaptureRecord:
+        record = next(self._records, None)
+        if record is None:
+            raise ProtocolError("Replay reached the end of the capture")
+        if self._start is None:
+            self._start = time.monotonic() - self._scale(record.timestamp)
+        return record
+
+    def _scale(self, timestamp: float) -> float:
+        return timestamp / self.speed if self.speed else 0.0
+
+    def write(self, command_data: bytes):
+        record = self._next_record()
+        if record.record_type != RECORD_WRITE:
+            raise ProtocolError("Replay expected a read, got a write")
+        if self.strict and record.data != bytes(command_data):
+            raise ProtocolError(
+                "Replay diverged from the capture at {:.6f}s".format(record.timestamp)
+            )
+
+    def read(self, timeout=DEFAULT_TIMEOUT, command=None) -> bytes:
+        record = self._next_record()
+        if record.record_type == RECORD_WRITE:
+            raise ProtocolError("Replay expected a write, got a read")
+        delay = self._start + self._scale(record.timestamp) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if record.record_type == RECORD_TIMEOUT:
+            raise TimeoutException
+        if command is not None:
+            self.poll_counts[command].append(1)
+        return record.data
+
+    def set_suspend(self, suspend: bool, timeout=DEFAULT_TIMEOUT):
+        pass
+
+    def close(self):
+        self._file.close()
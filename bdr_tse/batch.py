@@ -0,0 +1,93 @@
+"""Running many commands in one process.
+
+``bdr-tse batch`` reads commands as JSON lines from stdin and writes a result for
+each of them to stdout, sending all commands through the same
+:class:`~bdr_tse.TseConnector`. Scripts that send many commands thus start Python
+and open the TSE only once::
+
+    $ bdr-tse --tse_path /media/tse batch <<EOF
+    {"id": 1, "method": "start_transaction", "params": ["POS-1", "", ""]}
+    {"id": 2, "method": "get_serial_number"}
+    EOF
+    {"id":1,"result":{"transaction_number":1,...}}
+    {"id":2,"result":"5f8c..."}
+
+Each command is an object with the ``method`` to call, one of the commands of
+:class:`~bdr_tse.TseConnector`, and its ``params``, either a list or an object.
+The ``id`` is optional and copied to the result. Bytes are given and returned as
+hex strings, enums as their value. Failed commands are answered with an
+``error`` with the ``type`` and ``message`` of the exception, like in
+:mod:`bdr_tse.daemon`.
+
+Each result is written as soon as its command is done, so the commands can be
+piped in one at a time.
+"""
+
+from typing import IO, Iterable
+import binascii
+import enum
+import json
+import logging
+
+from bdr_tse import exceptions
+from bdr_tse.daemon import call_command
+from bdr_tse.tse_connector import TseConnector
+
+logger = logging.getLogger(__name__)
+
+
+def _default(o):
+    if isinstance(o, (bytes, bytearray, memoryview)):
+        return bytes(o).hex()
+    if isinstance(o, enum.Enum):
+        return o.value
+    raise TypeError("Cannot encode {!r}".format(o))
+
+
+def _decode_bytes(value) -> bytes:
+    if not isinstance(value, str):
+        raise TypeError("Bytes must be given as hex strings")
+    return binascii.unhexlify(value)
+
+
+def run_command_line(tse: TseConnector, line: str) -> dict:
+    """Run the command of a single line and return the result."""
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get("id")
+        result = call_command(
+            tse, request["method"], request.get("params", []), _decode_bytes
+        )
+    except Exception as e:
+        if not isinstance(e, exceptions.BdrTseException):
+            logger.debug("Command failed: %r", e)
+        return {
+            "id": request_id,
+            "error": {"type": type(e).__name__, "message": str(e)},
+        }
+    return {"id": request_id, "result": result}
+
+
+def run_batch(
+    tse: TseConnector, lines: Iterable[str], output: IO[str], stop_on_error=False
+) -> int:
+    """Run the commands of ``lines`` and write their results to ``output``.
+    Empty lines are skipped.
+
+    :param stop_on_error: Stop at the first command that fails.
+    :return: The number of failed commands.
+    """
+    errors = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        response = run_command_line(tse, line)
+        output.write(json.dumps(response, default=_default, separators=(",", ":")))
+        output.write("\n")
+        output.flush()
+        if "error" in response:
+            errors += 1
+            if stop_on_error:
+                break
+    return errors
@@ -0,0 +1,139 @@
+"""Capturing the data exchanged with the TSE.
+
+Captures are stored in a simple binary file format: :data:`CAPTURE_MAGIC`,
+followed by records of a header (seconds since the start of the capture, record
+type, data length) and the data. Captures are written by
+:class:`~bdr_tse.backends.RecordingBackend`, which records command and response
+data, and by :class:`CaptureRing`, which records the raw MSC blocks. Both can be
+replayed with :class:`~bdr_tse.backends.ReplayBackend`.
+"""
+
+from collections import deque
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+import logging
+import struct
+import time
+
+from bdr_tse.exceptions import ProtocolError
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_MAGIC = b"BDRTSE\x00\x01"
+_RECORD_HEADER = struct.Struct(">dBI")
+
+#: Record types: command data written to the TSE
+RECORD_WRITE = 1
+#: Response data read from the TSE
+RECORD_READ = 2
+#: A read that timed out
+RECORD_TIMEOUT = 3
+#: An MSC block written to the TSE, up to the end of its command data
+RECORD_WRITE_BLOCK = 4
+#: An MSC block read from the TSE once it was ready, up to the end of its
+#: response data
+RECORD_READ_BLOCK = 5
+
+#: Default number of records kept by a :class:`CaptureRing`
+CAPTURE_RING_CAPACITY = 256
+
+
+class CaptureRecord(NamedTuple):
+    """A record of a capture file."""
+
+    #: Seconds since the start of the capture
+    timestamp: float
+    #: One of the ``RECORD_*`` types
+    record_type: int
+    data: bytes
+
+
+def write_capture_header(f: BinaryIO):
+    f.write(CAPTURE_MAGIC)
+
+
+def write_capture_record(f: BinaryIO, record: CaptureRecord):
+    f.write(_RECORD_HEADER.pack(record.timestamp, record.record_type, len(record.data)))
+    f.write(record.data)
+
+
+def iter_capture(f: BinaryIO) -> Iterator[CaptureRecord]:
+    """Iterate over the records of a capture file.
+
+    :param f: The capture file, opened in binary mode.
+    """
+    if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+        raise ProtocolError("Not a capture file")
+    while True:
+        header = f.read(_RECORD_HEADER.size)
+        if not header:
+            return
+        if len(header) < _RECORD_HEADER.size:
+            raise ProtocolError("Truncated capture file")
+        timestamp, record_type, length = _RECORD_HEADER.unpack(header)
+        data = f.read(length)
+        if len(data) < length:
+            raise ProtocolError("Truncated capture file")
+        yield CaptureRecord(timestamp, record_type, data)
+
+
+class CaptureRing:
+    """Keeps the most recent MSC blocks exchanged with the TSE in memory, with
+    the time they were exchanged at, so that they can be dumped to a capture file
+    when something goes wrong.
+
+    Pass it as the ``capture`` of a :class:`~bdr_tse.msc_transport.MscTransport`.
+    Without a capture ring, the transport does not record anything.
+    """
+
+    def __init__(self, capacity: int = CAPTURE_RING_CAPACITY, dump_path=None):
+        """
+        :param capacity: The number of records to keep. Each record is at most a
+            block of 8 KiB.
+        :param dump_path: If given, the ring is dumped to this path whenever the
+            transport fails, see :meth:`on_error`. ``{timestamp}`` in the path is
+            replaced with the current UNIX time.
+        """
+        self._records = deque(maxlen=capacity)
+        self.dump_path = dump_path
+
+    def record(self, record_type: int, data):
+        """Record a block. ``data`` is copied."""
+        self._records.append((time.monotonic(), record_type, bytes(data)))
+
+    def __len__(self):
+        return len(self._records)
+
+    def clear(self):
+        self._records.clear()
+
+    def records(self) -> List[CaptureRecord]:
+        """The recorded blocks, oldest first, timed relative to the oldest."""
+        records = list(self._records)
+        if not records:
+            return []
+        start = records[0][0]
+        return [CaptureRecord(t - start, r, data) for t, r, data in records]
+
+    def dump(self, path):
+        """Write the recorded blocks to a capture file."""
+        with open(path, "wb") as f:
+            write_capture_header(f)
+            for record in self.records():
+                write_capture_record(f, record)
+
+    def on_error(self, error: BaseException) -> Optional[str]:
+        """Called by the transport when it fails. Dumps the ring to
+        ``dump_path``, if set.
+
+        :return: The path the ring was dumped to.
+        """
+        if self.dump_path is None:
+            return None
+        path = str(self.dump_path).format(timestamp=int(time.time()))
+        try:
+            self.dump(path)
+        except OSError:
+            logger.exception("Failed to dump capture to %s", path)
+            return None
+        logger.warning("Dumped capture of %r to %s", error, path)
+        return path
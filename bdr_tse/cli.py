@@ -1,5 +1,6 @@
 import binascii
 from datetime import datetime
+import functools
 import logging
 import time
 import sys
@@ -9,18 +10,63 @@ import click
 from bdr_tse.tse_connector import TseConnector
 
 
+class LazyConnector:
+    """Opens the TSE when a command first needs it, so that ``--help`` and usage
+    errors return without touching the TSE."""
+
+    def __init__(self, ctx: click.Context, tse_path, record=None):
+        self._ctx = ctx
+        self._tse_path = tse_path
+        self._record = record
+        self._connector: TseConnector = None
+
+    def get(self) -> TseConnector:
+        if self._connector is None:
+            backend = None
+            if self._record:
+                from bdr_tse.backends import RecordingBackend
+                from bdr_tse.msc_transport import MscTransport
+                from bdr_tse.transport import DEFAULT_POLLING_PROFILES
+
+                backend = RecordingBackend(
+                    MscTransport(
+                        self._tse_path, polling_profiles=DEFAULT_POLLING_PROFILES
+                    ),
+                    self._record,
+                )
+                self._ctx.call_on_close(backend.close)
+            self._connector = TseConnector(self._tse_path, backend=backend)
+        return self._connector
+
+
+def pass_tse(f):
+    """Like :func:`click.pass_obj`, but passes the :class:`TseConnector`, opening
+    the TSE if that has not happened yet."""
+
+    @click.pass_context
+    def new_func(ctx, *args, **kwargs):
+        return ctx.invoke(f, ctx.find_object(LazyConnector).get(), *args, **kwargs)
+
+    return functools.update_wrapper(new_func, f)
+
+
 @click.group()
 @click.pass_context
 @click.option("--tse_path", required=True, help="Path where the TSE is mounted")
 @click.option("--debug", is_flag=True, help="Enable debug logging")
-def cli(ctx, tse_path, debug):
-    ctx.obj = TseConnector(tse_path)
+@click.option(
+    "--record",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Capture the session with the TSE to this file, for replaying it later",
+)
+def cli(ctx, tse_path, debug, record):
+    ctx.obj = LazyConnector(ctx, tse_path, record)
     if debug:
         logging.basicConfig(level=logging.DEBUG)
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 def start(tse):
     response = tse.start()
     response["serial"] = response["serial"].hex()
@@ -28,7 +74,7 @@ def start(tse):
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 @click.option("--admin_puk", required=True, type=click.STRING)
 @click.option("--admin_pin", required=True, type=click.STRING)
 @click.option("--time_admin_puk", required=True, type=click.STRING)
@@ -43,19 +89,19 @@ def initialize_pin_values(tse, admin_puk, admin_pin, time_admin_puk, time_admin_
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 def factory_reset(tse):
     tse.factory_reset()
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 def get_pin_status(tse):
     click.echo(tse.get_pin_status())
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 @click.option("--admin", is_flag=True, type=click.BOOL)
 @click.option("--time_admin", is_flag=True, type=click.BOOL)
 @click.option("--pin", required=True, type=click.STRING)
@@ -67,7 +113,7 @@ def authenticate_user(tse: TseConnector, admin, time_admin, pin: str):
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 @click.option("--admin", is_flag=True, type=click.BOOL)
 @click.option("--time_admin", is_flag=True, type=click.BOOL)
 @click.option("--puk", required=True, type=click.STRING)
@@ -81,7 +127,7 @@ def unblock_user(tse: TseConnector, admin, time_admin, puk: str, new_pin):
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 @click.option("--admin", is_flag=True, type=click.BOOL)
 @click.option("--time_admin", is_flag=True, type=click.BOOL)
 def logout(tse: TseConnector, admin, time_admin):
@@ -90,7 +136,7 @@ def logout(tse: TseConnector, admin, time_admin):
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 @click.option("--time", "time_", type=click.INT)
 def update_time(tse: TseConnector, time_):
     if not time_:
@@ -99,19 +145,19 @@ def update_time(tse: TseConnector, time_):
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 def initialize(tse: TseConnector):
     tse.initialize()
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 def get_serial_number(tse: TseConnector):
     click.echo(tse.get_serial_number().hex())
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 @click.option("--client_id", required=True, type=click.STRING)
 @click.option("--process_data", required=True, type=click.STRING)
 @click.option("--process_type", required=True, type=click.STRING)
@@ -128,7 +174,28 @@ def start_transaction(tse: TseConnector, client_id, process_data, process_type):
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
+@click.option("--transaction_number", required=True, type=click.INT)
+@click.option("--client_id", required=True, type=click.STRING)
+@click.option("--process_data", required=True, type=click.STRING)
+@click.option("--process_type", required=True, type=click.STRING)
+def update_transaction(
+    tse: TseConnector, transaction_number, client_id, process_data, process_type
+):
+    response = tse.update_transaction(
+        transaction_number=transaction_number,
+        client_id=client_id,
+        process_data=process_data.encode("ascii"),
+        process_type=process_type,
+    )
+    response["signature_value"] = response["signature_value"].hex()
+    response["serial_number"] = response["serial_number"].hex()
+    response["log_time"] = datetime.fromtimestamp(response["log_time"]).isoformat()
+    click.echo(response)
+
+
+@click.command()
+@pass_tse
 @click.option("--transaction_number", required=True, type=click.INT)
 @click.option("--client_id", required=True, type=click.STRING)
 @click.option("--process_data", required=True, type=click.STRING)
@@ -149,7 +216,7 @@ def finish_transaction(
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 @click.option("--client_id", required=True, type=click.STRING)
 @click.option("--key_serial_number", required=True, type=click.STRING)
 def map_ers_to_key(tse: TseConnector, client_id, key_serial_number):
@@ -159,19 +226,99 @@ def map_ers_to_key(tse: TseConnector, client_id, key_serial_number):
 
 
 @click.command()
-@click.pass_obj
-def export_data(tse: TseConnector):
+@pass_tse
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the exported data to this file instead of stdout",
+)
+def export_data(tse: TseConnector, output):
     """Exports all data from the TSE and writes it to stdout. The exported data is
-    a tar archive."""
-    sys.stdout.buffer.write(tse.export_data())
+    a tar archive.
+
+    With --output, the data is written to the given file as it is read from the
+    TSE, and the size, SHA-256 hash and export rate are printed."""
+    if output:
+        click.echo(tse.export_to_file(output))
+    else:
+        for fragment in tse.export_data_iter():
+            sys.stdout.buffer.write(fragment)
 
 
 @click.command()
-@click.pass_obj
+@pass_tse
 def get_time_sync_interval(tse: TseConnector):
     click.echo(tse.get_time_sync_interval())
 
 
+def _parse_mode(ctx, param, value: str) -> int:
+    try:
+        mode = int(value, 8)
+    except ValueError:
+        mode = -1
+    if not 0 <= mode <= 0o777:
+        raise click.BadParameter("{!r} is not an octal mode like 600".format(value))
+    return mode
+
+
+@click.command()
+@pass_tse
+@click.option(
+    "--socket",
+    "socket_path",
+    required=True,
+    type=click.Path(dir_okay=False),
+    help="Path of the Unix domain socket to listen on",
+)
+@click.option(
+    "--socket_mode",
+    default="600",
+    callback=_parse_mode,
+    help="Permissions of the socket in octal, by default only for the user",
+)
+@click.option(
+    "--allow_admin_commands",
+    is_flag=True,
+    help="Also serve the commands that reset or reconfigure the TSE",
+)
+def serve(tse: TseConnector, socket_path, socket_mode, allow_admin_commands):
+    """Keeps the TSE open and serves its commands to local clients over a Unix
+    domain socket until interrupted. See bdr_tse.daemon for the protocol."""
+    from bdr_tse.daemon import COMMANDS, DEFAULT_COMMANDS, TseServer
+    from bdr_tse.worker import DeviceWorker
+
+    commands = COMMANDS if allow_admin_commands else DEFAULT_COMMANDS
+    worker = DeviceWorker(tse._transport)
+    try:
+        with TseServer(
+            socket_path, worker, commands=commands, mode=socket_mode
+        ) as server:
+            click.echo("Serving on {}".format(socket_path), err=True)
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.close()
+
+
+@click.command()
+@pass_tse
+@click.option(
+    "--stop_on_error", is_flag=True, help="Stop at the first command that fails"
+)
+def batch(tse: TseConnector, stop_on_error):
+    """Reads commands as JSON lines from stdin and writes their results as JSON
+    lines to stdout, sending all of them through the same connection to the TSE.
+    Bytes are hex encoded. See bdr_tse.batch for the format.
+
+    Exits with status 1 if any command failed."""
+    from bdr_tse.batch import run_batch
+
+    errors = run_batch(tse, sys.stdin, sys.stdout, stop_on_error=stop_on_error)
+    if errors:
+        sys.exit(1)
+
+
 cli.add_command(start)
 cli.add_command(initialize_pin_values)
 cli.add_command(factory_reset)
@@ -182,10 +329,13 @@ cli.add_command(logout)
 cli.add_command(initialize)
 cli.add_command(update_time)
 cli.add_command(start_transaction)
+cli.add_command(update_transaction)
 cli.add_command(get_serial_number)
 cli.add_command(map_ers_to_key)
 cli.add_command(export_data)
 cli.add_command(get_time_sync_interval)
+cli.add_command(serve)
+cli.add_command(batch)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,300 @@
+"""A daemon that keeps the TSE open and serves its commands to local clients.
+
+Opening the TSE takes a round trip to the TSE, which short-lived processes would
+pay on every start. ``bdr-tse serve`` keeps the TSE open instead and serves the
+commands of :class:`~bdr_tse.TseConnector` over a Unix domain socket, so that a
+command only takes a round trip through the socket on top of the time the TSE
+takes. Clients connect with :class:`TseClient`::
+
+    with TseClient("/run/bdr-tse.sock") as tse:
+        started = tse.start_transaction("POS-1", b"", "")
+
+The protocol is JSON lines. Each request is an object with an ``id``, the
+``method`` to call and its ``params``, either a list or an object::
+
+    {"id": 1, "method": "start_transaction", "params": ["POS-1", {"$b": ""}, ""]}
+
+The response carries the same ``id`` and either the ``result`` or an ``error``
+with the ``type`` and ``message`` of the exception::
+
+    {"id": 1, "error": {"type": "TransportErrorNoTransaction", "message": ""}}
+
+Bytes are sent as ``{"$b": <base64>}`` and enums as their value. Requests of a
+connection are answered in order, connections are served concurrently and their
+commands sent to the TSE one after the other by a
+:class:`~bdr_tse.worker.DeviceWorker`.
+
+Anyone who can connect to the socket can send commands to the TSE. The socket is
+therefore only accessible to the user running the daemon, unless another
+``mode`` is given, and the :data:`ADMIN_COMMANDS` that reset or reconfigure the
+TSE are not served unless they are allowed explicitly.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import base64
+import enum
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import threading
+
+from bdr_tse import exceptions, transport_errors
+from bdr_tse.tse_connector import TseConnector
+from bdr_tse.worker import DeviceWorker
+
+logger = logging.getLogger(__name__)
+
+#: The methods of :class:`~bdr_tse.TseConnector` that the daemon serves
+COMMANDS = frozenset(
+    name
+    for name, method in vars(TseConnector).items()
+    if hasattr(method, "__wrapped__")
+)
+
+#: The commands that reset or reconfigure the TSE, not served by default
+ADMIN_COMMANDS = frozenset(
+    {"factory_reset", "initialize", "initialize_pin_values", "unblock_user"}
+)
+
+#: The commands that :class:`TseServer` serves by default
+DEFAULT_COMMANDS = COMMANDS - ADMIN_COMMANDS
+
+_SIGNATURES = {
+    name: inspect.signature(getattr(TseConnector, name)) for name in COMMANDS
+}
+# Parameters of the commands that take enums, which are sent as their value
+_ENUM_PARAMS: Dict[str, Dict[str, type]] = {
+    name: {
+        param.name: param.annotation
+        for param in signature.parameters.values()
+        if isinstance(param.annotation, type)
+        and issubclass(param.annotation, enum.Enum)
+    }
+    for name, signature in _SIGNATURES.items()
+}
+# Parameters of the commands that take bytes
+_BYTES_PARAMS: Dict[str, List[str]] = {
+    name: [
+        param.name
+        for param in signature.parameters.values()
+        if param.annotation is bytes
+    ]
+    for name, signature in _SIGNATURES.items()
+}
+
+
+def call_command(
+    connector: TseConnector,
+    method: str,
+    params,
+    decode_bytes: Optional[Callable[[Any], bytes]] = None,
+):
+    """Call one of the :data:`COMMANDS` of ``connector``.
+
+    :param params: The arguments, either a list or a dict. Enums are given as
+        their value.
+    :param decode_bytes: If given, applied to the arguments that are bytes.
+    :raises ValueError: If ``method`` is not one of the :data:`COMMANDS`.
+    :raises TypeError: If ``params`` do not match the method.
+    """
+    if method not in COMMANDS:
+        raise ValueError("Unknown method {!r}".format(method))
+    if isinstance(params, dict):
+        bound = _SIGNATURES[method].bind(connector, **params)
+    else:
+        bound = _SIGNATURES[method].bind(connector, *params)
+    for name, enum_class in _ENUM_PARAMS[method].items():
+        if name in bound.arguments:
+            bound.arguments[name] = enum_class(bound.arguments[name])
+    if decode_bytes is not None:
+        for name in _BYTES_PARAMS[method]:
+            if name in bound.arguments:
+                bound.arguments[name] = decode_bytes(bound.arguments[name])
+    return getattr(TseConnector, method)(*bound.args, **bound.kwargs)
+
+
+def _default(o):
+    if isinstance(o, (bytes, bytearray, memoryview)):
+        return {"$b": base64.b64encode(o).decode("ascii")}
+    if isinstance(o, enum.Enum):
+        return o.value
+    raise TypeError("Cannot encode {!r}".format(o))
+
+
+def _object_hook(o: dict):
+    if len(o) == 1 and "$b" in o:
+        return base64.b64decode(o["$b"])
+    return o
+
+
+def encode_message(message: dict) -> bytes:
+    """Encode a request or response as a line of JSON."""
+    return json.dumps(message, default=_default, separators=(",", ":")).encode() + b"\n"
+
+
+def decode_message(line: bytes) -> dict:
+    """Decode a request or response from a line of JSON."""
+    return json.loads(line, object_hook=_object_hook)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: "TseServer"
+
+    def handle(self):
+        for line in self.rfile:
+            response = self.server.handle_request_line(line)
+            self.wfile.write(encode_message(response))
+            self.wfile.flush()
+
+
+class TseServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves the commands of a TSE over a Unix domain socket."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        path,
+        worker: DeviceWorker,
+        commands: Iterable[str] = DEFAULT_COMMANDS,
+        mode: int = 0o600,
+    ):
+        """
+        :param path: The path of the socket. A stale socket at this path is
+            replaced.
+        :param worker: The worker that owns the TSE.
+        :param commands: The commands that clients may call, out of
+            :data:`COMMANDS`. By default, all but the :data:`ADMIN_COMMANDS`.
+        :param mode: The permissions of the socket. By default, only the user
+            running the server can connect.
+        """
+        unknown = set(commands) - COMMANDS
+        if unknown:
+            raise ValueError("Unknown commands {}".format(sorted(unknown)))
+        self.path = path
+        self.commands = frozenset(commands)
+        self.mode = mode
+        self.connector = worker.connector()
+        try:
+            if stat.S_ISSOCK(os.stat(path).st_mode):
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+        super().__init__(path, _RequestHandler)
+
+    def server_bind(self):
+        super().server_bind()
+        # Before listening, so that no client can connect with the default mode
+        os.chmod(self.path, self.mode)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def handle_request_line(self, line: bytes) -> dict:
+        """Handle a single request and return the response."""
+        request_id = None
+        try:
+            request = decode_message(line)
+            request_id = request.get("id")
+            if request["method"] in COMMANDS - self.commands:
+                raise PermissionError(
+                    "Method {!r} is not allowed".format(request["method"])
+                )
+            result = call_command(
+                self.connector, request["method"], request.get("params", [])
+            )
+        except Exception as e:
+            if not isinstance(e, exceptions.BdrTseException):
+                logger.warning("Request failed: %r", e)
+            return {
+                "id": request_id,
+                "error": {"type": type(e).__name__, "message": str(e)},
+            }
+        return {"id": request_id, "result": result}
+
+
+def _exception_class(name: str):
+    for module in (transport_errors, exceptions):
+        cls = getattr(module, name, None)
+        if isinstance(cls, type) and issubclass(cls, exceptions.BdrTseException):
+            return cls
+    return None
+
+
+class TseClient:
+    """Sends commands to a :class:`TseServer`.
+
+    Offers the commands of :class:`~bdr_tse.TseConnector` as methods, e.g.
+    ``client.start_transaction(...)``. Enums in results, like the
+    ``authentication_result`` of ``authenticate_user``, are returned as their
+    value. Errors of the TSE are raised as the same exceptions as with a
+    :class:`~bdr_tse.TseConnector`, other errors as
+    :class:`~bdr_tse.exceptions.RemoteError`.
+
+    A client can be shared between threads, but requests of a client are sent
+    one after the other.
+    """
+
+    def __init__(self, path, timeout=None):
+        """
+        :param path: The path of the socket of the daemon.
+        :param timeout: The timeout for a request in seconds.
+        """
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(path)
+        self._file = self._socket.makefile("rwb")
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def call(self, method: str, *args, **kwargs) -> Any:
+        """Call a method of the :class:`~bdr_tse.TseConnector` of the daemon."""
+        if args and kwargs:
+            raise TypeError("Pass either positional or keyword arguments")
+        request_id = next(self._ids)
+        request = encode_message(
+            {"id": request_id, "method": method, "params": kwargs or list(args)}
+        )
+        with self._lock:
+            self._file.write(request)
+            self._file.flush()
+            line = self._file.readline()
+        if not line:
+            raise exceptions.RemoteError("Connection closed by the daemon")
+        response = decode_message(line)
+        if response.get("id") != request_id:
+            raise exceptions.ProtocolError("Response to the wrong request")
+        if "error" in response:
+            error = response["error"]
+            cls = _exception_class(error["type"])
+            if cls is None:
+                raise exceptions.RemoteError(
+                    "{}: {}".format(error["type"], error["message"])
+                )
+            raise cls(*([error["message"]] if error["message"] else []))
+        return response["result"]
+
+    def __getattr__(self, name: str):
+        if name in COMMANDS:
+            return functools.partial(self.call, name)
+        raise AttributeError(name)
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
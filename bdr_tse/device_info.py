@@ -0,0 +1,120 @@
+"""Caching the information about a TSE that does not change.
+
+The serial number of the signing key and the configuration data of a TSE stay
+the same for the lifetime of the device, yet reading them takes a round trip to
+the TSE. :class:`DeviceInfoCache` keeps them in memory, and optionally in a file
+so that they survive restarts::
+
+    tse = TseConnector("/media/tse", device_info=DeviceInfoCache("tse-info.json"))
+    tse.start()
+    tse.get_serial_number()  # Read from the file after the first run
+
+The file holds the information of any number of TSEs, keyed by the serial
+number that :func:`~bdr_tse.TseConnector.start` returns. Until ``start`` was
+called, the connector does not know which TSE it talks to and the cache is only
+kept in memory.
+
+The cache is cleared when the TSE is initialized or reset to factory state, and
+when ``start`` returns another version than before, e.g. after a firmware
+update. Use :meth:`DeviceInfoCache.invalidate` if the information changes in
+other ways.
+"""
+
+from typing import Any, Dict, Optional
+import json
+import os
+import threading
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return {"$b": value.hex()}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict) and "$b" in value:
+        return bytes.fromhex(value["$b"])
+    return value
+
+
+class DeviceInfoCache:
+    """Caches the information about a TSE that does not change.
+
+    The cache can be used from several threads, but only for a single TSE at a
+    time.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: The file to persist the information in. If ``None``, the
+            information is only kept in memory.
+        """
+        self.path = path
+        #: The serial number of the TSE the cached information belongs to, once
+        #: known
+        self.serial: Optional[bytes] = None
+        self._values: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        """The cached value of ``name``, or ``None``."""
+        with self._lock:
+            return self._values.get(name)
+
+    def set(self, name: str, value: Any):
+        """Cache ``value`` for ``name``, persisting it if the TSE is known."""
+        with self._lock:
+            self._values[name] = value
+            self._save()
+
+    def bind(self, serial: bytes, version: Any):
+        """Associate the cache with the TSE with ``serial``, as returned by
+        :func:`~bdr_tse.TseConnector.start`, loading its persisted information.
+        The information is dropped if it was persisted with another ``version``.
+        """
+        with self._lock:
+            if serial != self.serial:
+                entry = self._load().get(serial.hex(), {})
+                values = {name: _decode(value) for name, value in entry.items()}
+                if self.serial is None:
+                    # Values read before the TSE was known belong to it as well
+                    values.update(self._values)
+                self._values = values
+                self.serial = serial
+            if self._values.get("version", version) != version:
+                self._values = {}
+            self._values["version"] = version
+            self._save()
+
+    def invalidate(self):
+        """Drop the cached information, e.g. after a firmware update. The TSE
+        stays bound to the cache."""
+        with self._lock:
+            version = self._values.get("version")
+            self._values = {} if version is None else {"version": version}
+            self._save()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save(self):
+        if self.path is None or self.serial is None:
+            return
+        entries = self._load()
+        entries[self.serial.hex()] = {
+            name: _encode(value) for name, value in self._values.items()
+        }
+        # Atomically replace the file, like ExportCheckpoint.save
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
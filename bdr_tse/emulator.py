@@ -0,0 +1,715 @@
+"""A software emulation of the TSE, for developing and testing without a device.
+
+:class:`TseEmulator` implements the TLV command protocol of the TSE on top of an
+in-memory state: users and PINs, transaction numbers, signature counters and the
+log messages that transactions and system operations produce, which can be
+exported as a TAR archive like from the device. :class:`EmulatorTransport` puts
+it behind the MSC framing, so that a :class:`~bdr_tse.TseConnector` runs
+unchanged against it::
+
+    tse = TseConnector(backend=EmulatorTransport())
+
+Signatures are not real ECDSA signatures unless a ``sign`` function is passed to
+the emulator.
+"""
+
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+import hashlib
+import io
+import tarfile
+import time
+
+from bdr_tse import msc_transport, transport_errors
+from bdr_tse.exceptions import ProtocolError
+from bdr_tse.log_messages import (
+    SYSTEM_LOG_OID,
+    TRANSACTION_LOG_OID,
+    LogMessage,
+    _encode_oid,
+)
+from bdr_tse.msc_transport import (
+    BLOCK_SIZE,
+    HEADER,
+    TOKEN,
+    _COMMAND_DATA_OFFSET,
+    _LENGTH_OFFSET,
+    _RESPONSE_DATA_OFFSET,
+    _TOKEN_OFFSET,
+)
+from bdr_tse.transport import (
+    TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ,
+    TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ,
+    TRANSPORT_ERROR_CODES,
+    GetConfigDataID,
+    TransportCommand,
+    TransportDataType,
+    decode_transport_result,
+)
+
+# The maximum number of response bytes that fit into one block
+MAX_FRAGMENT_LENGTH = BLOCK_SIZE - _RESPONSE_DATA_OFFSET
+
+# Hash of the ecdsa-plain-signature that log messages claim to be signed with
+ECDSA_PLAIN_SHA384_OID = "0.4.0.127.0.7.1.1.4.1.4"
+
+_ERROR_CODES = {error: code for code, error in TRANSPORT_ERROR_CODES.items()}
+
+# First byte after the length of the blocks that enable or disable suspend mode
+_SUSPEND_COMMAND = 0x53
+# The random token that the emulator answers with
+_RESPONSE_TOKEN = bytes([0x52, 0x4E, 0x44, 0x4D])
+
+
+def _encode_result(params) -> bytes:
+    """Encode response parameters, the inverse of
+    :func:`~bdr_tse.transport.decode_transport_result`.
+
+    :param params: Tuples of data type and value.
+    """
+    result = bytearray()
+    for data_type, value in params:
+        if data_type == TransportDataType.BYTE:
+            value = bytes([value])
+        elif data_type == TransportDataType.SHORT:
+            value = value.to_bytes(2, "big")
+        elif data_type == TransportDataType.STRING:
+            value = value.encode("ascii")
+        result.append(data_type)
+        result += len(value).to_bytes(2, "big")
+        result += value
+    return bytes(result)
+
+
+def _fake_signature(signed_data: bytes) -> bytes:
+    digest = hashlib.sha384(signed_data).digest()
+    return digest + digest
+
+
+class _Fault:
+    __slots__ = ("error", "count")
+
+    def __init__(self, error, count):
+        self.error = error
+        self.count = count
+
+
+class TseEmulator:
+    """Emulates the command processing of a TSE.
+
+    Commands are passed to :meth:`handle` as the command data of an MSC block, and
+    the response data for the MSC block is returned. All emulated state is kept
+    in memory.
+    """
+
+    #: PINs and PUKs of an initialized emulator
+    DEFAULT_ADMIN_PIN = b"12345"
+    DEFAULT_ADMIN_PUK = b"1234567890"
+    DEFAULT_TIME_ADMIN_PIN = b"12345"
+    DEFAULT_TIME_ADMIN_PUK = b"12345678"
+
+    #: Number of failed authentication attempts after which a PIN is blocked
+    MAX_RETRIES = 3
+
+    #: The items reported by ``GetConfigData``, except for the time sync interval
+    DEFAULT_CONFIG_DATA = {
+        GetConfigDataID.Version: (TransportDataType.STRING, "Emulator"),
+        GetConfigDataID.SignatureAlgorithm: (
+            TransportDataType.BYTE_ARRAY,
+            _encode_oid(ECDSA_PLAIN_SHA384_OID),
+        ),
+        GetConfigDataID.SupportedUpdateVariants: (TransportDataType.BYTE, 0),
+        GetConfigDataID.MaxKeys: (TransportDataType.BYTE_ARRAY, bytes([0, 0, 0, 1])),
+        GetConfigDataID.MaxClients: (
+            TransportDataType.BYTE_ARRAY,
+            (100).to_bytes(4, "big"),
+        ),
+        GetConfigDataID.MaxTransactions: (
+            TransportDataType.BYTE_ARRAY,
+            (512).to_bytes(4, "big"),
+        ),
+        GetConfigDataID.SupportedTimeFormats: (TransportDataType.BYTE, 0),
+        GetConfigDataID.CertificationId: (
+            TransportDataType.STRING,
+            "BSI-K-TR-0000-0000",
+        ),
+    }
+
+    def __init__(
+        self,
+        latency: Optional[Mapping[TransportCommand, float]] = None,
+        default_latency: float = 0.0,
+        initialized: bool = True,
+        time_set: bool = True,
+        serial_number: bytes = bytes(range(32)),
+        certificates: bytes = b"",
+        sign: Callable[[bytes], bytes] = None,
+        clock: Callable[[], float] = time.time,
+        fragment_length: int = MAX_FRAGMENT_LENGTH,
+        time_sync_interval: int = 1800,
+        config_data: Optional[Mapping[GetConfigDataID, Tuple[int, object]]] = None,
+    ):
+        """
+        :param latency: The time in seconds that the emulator takes to answer
+            each command.
+        :param default_latency: The time taken to answer commands that have no
+            entry in ``latency``, and to answer requests for further fragments.
+        :param initialized: Whether the PINs are set and the TSE is initialized
+            already. The PINs are then the ``DEFAULT_*`` PINs and PUKs.
+        :param time_set: Whether the time of the TSE is set already.
+        :param serial_number: The serial number of the signing key.
+        :param certificates: The data returned by ``GetCertificates``.
+        :param sign: Computes the signature value of a log message from the data
+            it signs. Defaults to a fake signature based on a hash of the data.
+        :param clock: Returns the current UNIX time.
+        :param fragment_length: The maximum number of response bytes sent per
+            fragment.
+        :param time_sync_interval: The time sync interval reported by
+            ``GetConfigData``.
+        :param config_data: Overrides for the other items reported by
+            ``GetConfigData``, as tuples of data type and value, see
+            :data:`DEFAULT_CONFIG_DATA`.
+        """
+        self.latency = dict(latency or {})
+        self.default_latency = default_latency
+        self.serial_number = serial_number
+        self.certificates = certificates
+        self.sign = sign or _fake_signature
+        self.clock = clock
+        self.fragment_length = fragment_length
+        self.time_sync_interval = time_sync_interval
+        self.config_data = {**self.DEFAULT_CONFIG_DATA, **(config_data or {})}
+        # The number of times each command was received
+        self.command_counts: Dict[int, int] = {}
+
+        self._faults: Dict[int, _Fault] = {}
+        self._pending = memoryview(b"")
+        self._reset(initialized, time_set)
+
+    def _reset(self, initialized: bool, time_set: bool):
+        self.initialized = initialized
+        self.time_offset: Optional[float] = 0.0 if time_set else None
+        if initialized:
+            self.pins: Optional[Dict[str, bytes]] = {
+                "Admin": self.DEFAULT_ADMIN_PIN,
+                "TimeAdmin": self.DEFAULT_TIME_ADMIN_PIN,
+            }
+            self.puks: Optional[Dict[str, bytes]] = {
+                "Admin": self.DEFAULT_ADMIN_PUK,
+                "TimeAdmin": self.DEFAULT_TIME_ADMIN_PUK,
+            }
+        else:
+            self.pins = None
+            self.puks = None
+        self.retries = {"Admin": self.MAX_RETRIES, "TimeAdmin": self.MAX_RETRIES}
+        self.authenticated = set()
+        self.ers_mappings: Dict[str, bytes] = {}
+        self.transaction_number = 0
+        self.signature_counter = 0
+        # Open transactions, by transaction number
+        self.open_transactions: Dict[int, str] = {}
+        # Log messages in the order of their signature counters, with file names
+        self.log_messages: List[Tuple[str, LogMessage]] = []
+
+    def inject_fault(self, command: TransportCommand, error=None, count: int = 1):
+        """Make the emulator fail the next ``count`` times that it receives
+        ``command``.
+
+        :param command: The command to fail.
+        :param error: The :class:`~bdr_tse.exceptions.TransportError` subclass or
+            error code to answer with. If ``None``, the command is never answered
+            and the transport times out.
+        :param count: The number of times to fail.
+        """
+        self._faults[command] = _Fault(_ERROR_CODES.get(error, error), count)
+
+    def now(self) -> int:
+        """The current time of the TSE as a UNIX timestamp."""
+        if self.time_offset is None:
+            raise transport_errors.TransportErrorTimeNotSet
+        return int(self.clock() + self.time_offset)
+
+    def handle(self, command_data: bytes) -> Tuple[Optional[bytes], float]:
+        """Process a command.
+
+        :param command_data: The command data of the MSC block.
+        :return: A tuple of the response data of the MSC block, or ``None`` if the
+            command is not answered, and the time in seconds that the emulator
+            takes to answer it.
+        """
+        if command_data == TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ:
+            return self._next_fragment(), self.default_latency
+        if command_data == TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ:
+            self._pending = memoryview(b"")
+            return None, 0.0
+        self._pending = memoryview(b"")
+
+        if len(command_data) < 6 or command_data[:2] != bytes([0x5C, 0x54]):
+            return self._error(transport_errors.TransportErrorTSECommandDataInvalid)
+        command = int.from_bytes(command_data[2:4], "big")
+        length = int.from_bytes(command_data[4:6], "big")
+        self.command_counts[command] = self.command_counts.get(command, 0) + 1
+        latency = self.latency.get(command, self.default_latency)
+
+        fault = self._faults.get(command)
+        if fault is not None:
+            fault.count -= 1
+            if fault.count <= 0:
+                del self._faults[command]
+            if fault.error is None:
+                return None, latency
+            return fault.error.to_bytes(2, "big"), latency
+
+        handler = self._HANDLERS.get(command)
+        params = [p.data for p in decode_transport_result(command_data[6 : 6 + length])]
+        if handler is None:
+            return self._error(transport_errors.TransportErrorTSECommandDataInvalid)
+        try:
+            response = handler(self, *params)
+        except TypeError:
+            # Wrong number of parameters
+            return self._error(transport_errors.TransportErrorTSECommandDataInvalid)
+        except transport_errors.TransportError as e:
+            return _ERROR_CODES[type(e)].to_bytes(2, "big"), latency
+
+        self._pending = memoryview(response)
+        return self._next_fragment(), latency
+
+    def _error(self, error) -> Tuple[bytes, float]:
+        return _ERROR_CODES[error].to_bytes(2, "big"), self.default_latency
+
+    def _next_fragment(self) -> Optional[bytes]:
+        if not self._pending:
+            return None
+        fragment = bytes(self._pending[: self.fragment_length])
+        self._pending = self._pending[self.fragment_length :]
+        return fragment
+
+    # Command handlers. They take the decoded parameters of the command and
+    # return the complete response, raising a TransportError to fail.
+
+    @staticmethod
+    def _response(*params) -> bytes:
+        result = _encode_result(params)
+        return len(result).to_bytes(2, "big") + result
+
+    @staticmethod
+    def _export_response(data: bytes) -> bytes:
+        return bytes([0x90, 0x00]) + len(data).to_bytes(8, "big") + data
+
+    def _require_user(self, *user_ids):
+        if not self.authenticated.intersection(user_ids):
+            raise transport_errors.TransportErrorUserNotAuthenticated
+
+    def _require_initialized(self):
+        if not self.initialized:
+            raise transport_errors.TransportErrorSeApiNotInitialized
+
+    def _start(self) -> bytes:
+        return self._response(
+            (TransportDataType.STRING, "Emulator"),
+            (TransportDataType.BYTE_ARRAY, self.serial_number),
+        )
+
+    def _get_pin_states(self) -> bytes:
+        transport_state = 1 if self.pins is None else 0
+        return self._response(
+            (TransportDataType.BYTE_ARRAY, bytes([transport_state] * 4))
+        )
+
+    def _initialize_pins(self, admin_puk, admin_pin, time_admin_puk, time_admin_pin):
+        if self.pins is not None:
+            raise transport_errors.TransportErrorUserNotAuthorized
+        self.pins = {"Admin": admin_pin, "TimeAdmin": time_admin_pin}
+        self.puks = {"Admin": admin_puk, "TimeAdmin": time_admin_puk}
+        return self._response()
+
+    def _authenticate_user(self, user_id: str, pin: bytes) -> bytes:
+        # Values of TseConnector.AuthenticationResult
+        if user_id not in self.retries:
+            result = 3
+        elif self.pins is None:
+            result = 4
+        elif self.retries[user_id] <= 0:
+            result = 2
+        elif self.pins[user_id] == pin:
+            self.retries[user_id] = self.MAX_RETRIES
+            self.authenticated.add(user_id)
+            result = 0
+        else:
+            self.retries[user_id] -= 1
+            result = 1 if self.retries[user_id] else 2
+        return self._response(
+            (TransportDataType.BYTE, result),
+            (TransportDataType.SHORT, self.retries.get(user_id, 0)),
+        )
+
+    def _unblock_user(self, user_id: str, puk: bytes, new_pin: bytes) -> bytes:
+        if user_id not in self.retries:
+            result = 3
+        elif self.puks is None or self.puks[user_id] != puk:
+            result = 1
+        else:
+            self.pins[user_id] = new_pin
+            self.retries[user_id] = self.MAX_RETRIES
+            result = 0
+        return self._response((TransportDataType.BYTE, result))
+
+    def _logout(self, user_id: str) -> bytes:
+        if user_id not in self.retries:
+            raise transport_errors.TransportErrorUserIdNotManaged
+        self.authenticated.discard(user_id)
+        return self._response()
+
+    def _initialize(self) -> bytes:
+        self._require_user("Admin")
+        self.initialized = True
+        self._log_system_operation("Initialize")
+        return self._response()
+
+    def _update_time(self, new_time: bytes) -> bytes:
+        self._require_user("Admin", "TimeAdmin")
+        self.time_offset = int.from_bytes(new_time, "big") - self.clock()
+        self._log_system_operation("UpdateTime")
+        return self._response()
+
+    def _get_serial_numbers(self) -> bytes:
+        # ASN.1 SEQUENCE OF SEQUENCE { OCTET STRING serialNumber }
+        data = bytes([0x30, 0x24, 0x30, 0x22, 0x04, 0x20]) + self.serial_number
+        return self._response((TransportDataType.BYTE_ARRAY, data))
+
+    def _get_certificates(self) -> bytes:
+        return self._response((TransportDataType.BYTE_ARRAY, self.certificates))
+
+    def _map_ers_to_key(self, client_id: str, key_serial_number: bytes) -> bytes:
+        self._require_user("Admin")
+        if key_serial_number != self.serial_number:
+            raise transport_errors.TransportErrorNoKey
+        self.ers_mappings[client_id] = key_serial_number
+        return self._response()
+
+    def _start_transaction(
+        self,
+        client_id: str,
+        process_data: bytes,
+        process_type: str,
+        additional_data: bytes = b"",
+    ) -> bytes:
+        self._require_initialized()
+        self.transaction_number += 1
+        self.open_transactions[self.transaction_number] = client_id
+        message = self._log_transaction(
+            "Start",
+            self.transaction_number,
+            client_id,
+            process_data,
+            process_type,
+            additional_data,
+        )
+        return self._response(
+            (TransportDataType.BYTE_ARRAY, self.transaction_number.to_bytes(4, "big")),
+            (
+                TransportDataType.BYTE_ARRAY,
+                message.signature_counter.to_bytes(4, "big"),
+            ),
+            (TransportDataType.BYTE_ARRAY, message.log_time.to_bytes(8, "big")),
+            (TransportDataType.BYTE_ARRAY, message.signature_value),
+            (TransportDataType.BYTE_ARRAY, self.serial_number),
+        )
+
+    def _update_transaction(
+        self,
+        transaction_number: bytes,
+        client_id: str,
+        process_data: bytes,
+        process_type: str,
+    ) -> bytes:
+        return self._continue_transaction(
+            "Update", transaction_number, client_id, process_data, process_type
+        )
+
+    def _finish_transaction(
+        self,
+        transaction_number: bytes,
+        client_id: str,
+        process_data: bytes,
+        process_type: str,
+        additional_data: bytes = b"",
+    ) -> bytes:
+        response = self._continue_transaction(
+            "Finish",
+            transaction_number,
+            client_id,
+            process_data,
+            process_type,
+            additional_data,
+        )
+        del self.open_transactions[int.from_bytes(transaction_number, "big")]
+        return response
+
+    def _continue_transaction(
+        self,
+        operation: str,
+        transaction_number: bytes,
+        client_id: str,
+        process_data: bytes,
+        process_type: str,
+        additional_data: bytes = b"",
+    ) -> bytes:
+        self._require_initialized()
+        transaction_number = int.from_bytes(transaction_number, "big")
+        if self.open_transactions.get(transaction_number) != client_id:
+            raise transport_errors.TransportErrorNoTransaction
+        message = self._log_transaction(
+            operation,
+            transaction_number,
+            client_id,
+            process_data,
+            process_type,
+            additional_data,
+        )
+        return self._response(
+            (
+                TransportDataType.BYTE_ARRAY,
+                message.signature_counter.to_bytes(4, "big"),
+            ),
+            (TransportDataType.BYTE_ARRAY, message.log_time.to_bytes(8, "big")),
+            (TransportDataType.BYTE_ARRAY, message.signature_value),
+            (TransportDataType.BYTE_ARRAY, self.serial_number),
+        )
+
+    def _export_data(
+        self,
+        client_id: str,
+        transaction_number: bytes,
+        start_transaction_number: bytes,
+        end_transaction_number: bytes,
+        start_date: bytes,
+        end_date: bytes,
+        max_records: bytes,
+    ) -> bytes:
+        transaction_number = int.from_bytes(transaction_number, "big")
+        start_transaction_number = int.from_bytes(start_transaction_number, "big")
+        end_transaction_number = int.from_bytes(end_transaction_number, "big")
+        start_date = int.from_bytes(start_date, "big")
+        end_date = int.from_bytes(end_date, "big")
+        max_records = int.from_bytes(max_records, "big")
+        # Filtering by transaction selects transaction logs only
+        by_transaction = (
+            client_id
+            or transaction_number != 0xFFFFFFFF
+            or start_transaction_number != 0
+            or end_transaction_number != 0xFFFFFFFF
+        )
+
+        selected = []
+        for filename, message in self.log_messages:
+            if not start_date <= message.log_time <= end_date:
+                continue
+            if by_transaction:
+                if message.transaction_number is None:
+                    continue
+                if client_id and message.client_id != client_id:
+                    continue
+                if transaction_number != 0xFFFFFFFF:
+                    if message.transaction_number != transaction_number:
+                        continue
+                elif not (
+                    start_transaction_number
+                    <= message.transaction_number
+                    <= end_transaction_number
+                ):
+                    continue
+            selected.append((filename, message))
+
+        if max_records != 0xFFFFFFFF and len(selected) > max_records:
+            raise transport_errors.TransportErrorTooManyRecords
+        return self._export_response(self._build_tar(selected))
+
+    def _export_more_data(
+        self,
+        key_serial_number: bytes,
+        previous_signature_counter: bytes,
+        max_records: bytes,
+    ) -> bytes:
+        if key_serial_number != self.serial_number:
+            raise transport_errors.TransportErrorNoKey
+        previous_signature_counter = int.from_bytes(previous_signature_counter, "big")
+        max_records = int.from_bytes(max_records, "big")
+        # Signature counters start at 1 and are consecutive
+        selected = self.log_messages[
+            previous_signature_counter : previous_signature_counter + max_records
+        ]
+        if not selected:
+            raise transport_errors.TransportErrorNoDataAvailable
+        return self._export_response(self._build_tar(selected))
+
+    def _get_config_data(self, config_id: int) -> bytes:
+        if config_id == GetConfigDataID.TimeSyncInterval:
+            return self._response(
+                (
+                    TransportDataType.BYTE_ARRAY,
+                    self.time_sync_interval.to_bytes(4, "big"),
+                )
+            )
+        if config_id not in self.config_data:
+            raise transport_errors.TransportErrorParameterMismatch
+        return self._response(self.config_data[config_id])
+
+    def _factory_reset(self, data: bytes) -> bytes:
+        self._reset(initialized=False, time_set=False)
+        return self._response()
+
+    _HANDLERS = {
+        TransportCommand.Start: _start,
+        TransportCommand.GetPinStates: _get_pin_states,
+        TransportCommand.InitializePins: _initialize_pins,
+        TransportCommand.AuthenticateUser: _authenticate_user,
+        TransportCommand.UnblockUser: _unblock_user,
+        TransportCommand.Logout: _logout,
+        TransportCommand.Initialize: _initialize,
+        TransportCommand.UpdateTime: _update_time,
+        TransportCommand.GetSerialNumbers: _get_serial_numbers,
+        TransportCommand.GetCertificates: _get_certificates,
+        TransportCommand.MapERStoKey: _map_ers_to_key,
+        TransportCommand.StartTransaction: _start_transaction,
+        TransportCommand.UpdateTransaction: _update_transaction,
+        TransportCommand.FinishTransaction: _finish_transaction,
+        TransportCommand.ExportData: _export_data,
+        TransportCommand.ExportMoreData: _export_more_data,
+        TransportCommand.GetConfigData: _get_config_data,
+        TransportCommand.FactoryReset: _factory_reset,
+    }
+
+    # Log messages
+
+    def _new_log_message(self, certified_data_type: str) -> LogMessage:
+        message = LogMessage()
+        message.version = 2
+        message.certified_data_type = certified_data_type
+        message.serial_number = self.serial_number
+        message.signature_algorithm = ECDSA_PLAIN_SHA384_OID
+        return message
+
+    def _sign(self, message: LogMessage, filename_format: str) -> LogMessage:
+        """Assign the next signature counter to the log message, sign it and
+        store it."""
+        message.log_time = self.now()
+        self.signature_counter += 1
+        message.signature_counter = self.signature_counter
+        # The signed data is the encoded log message up to the log time, encode it
+        # once without the signature to get it
+        message.signature_value = b""
+        message.signature_value = self.sign(
+            LogMessage.decode(message.encode()).signed_data
+        )
+        message.raw = message.encode()
+        filename = filename_format.format(
+            log_time=message.log_time, signature_counter=message.signature_counter
+        )
+        self.log_messages.append((filename, message))
+        return message
+
+    def _log_transaction(
+        self,
+        operation: str,
+        transaction_number: int,
+        client_id: str,
+        process_data: bytes,
+        process_type: str,
+        additional_data: bytes,
+    ) -> LogMessage:
+        message = self._new_log_message(TRANSACTION_LOG_OID)
+        message.operation_type = operation + "Transaction"
+        message.client_id = client_id
+        message.process_data = process_data
+        message.process_type = process_type
+        message.additional_external_data = additional_data or None
+        message.transaction_number = transaction_number
+        return self._sign(
+            message,
+            "Unixt_{{log_time}}_Sig-{{signature_counter}}_Log-Tra_No-{}_{}"
+            "_Client-{}.log".format(transaction_number, operation, client_id),
+        )
+
+    def _log_system_operation(self, operation: str) -> LogMessage:
+        message = self._new_log_message(SYSTEM_LOG_OID)
+        message.operation_type = operation
+        message.system_operation_data = bytes([0x30, 0x00])
+        return self._sign(
+            message,
+            "Unixt_{{log_time}}_Sig-{{signature_counter}}_Log-Sys_{}.log".format(
+                operation
+            ),
+        )
+
+    def _build_tar(self, log_messages: List[Tuple[str, LogMessage]]) -> bytes:
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode="w", format=tarfile.USTAR_FORMAT) as tar:
+            files = [("info.csv", b'description:,"Emulator"\n', 0)]
+            files += [(f, m.raw, m.log_time) for f, m in log_messages]
+            files.append(
+                ("{}_X509.cer".format(self.serial_number.hex()), self.certificates, 0)
+            )
+            for name, data, mtime in files:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = mtime
+                tar.addfile(info, io.BytesIO(data))
+        return buf.getvalue()
+
+
+class EmulatorTransport(msc_transport.MscTransport):
+    """An :class:`~bdr_tse.msc_transport.MscTransport` that exchanges its blocks
+    with a :class:`TseEmulator` instead of a TSE. Use it as the ``backend`` of a
+    :class:`~bdr_tse.TseConnector`.
+
+    While the emulator is processing a command, reads return busy blocks, so the
+    polling of the transport is exercised as with a TSE.
+    """
+
+    def __init__(self, emulator: TseEmulator = None, **kwargs):
+        """
+        :param emulator: The emulator to talk to. A new one is created if
+            ``None``.
+
+        The other keyword arguments are passed to
+        :class:`~bdr_tse.msc_transport.MscTransport`.
+        """
+        self.emulator = emulator or TseEmulator()
+        self._response: Optional[bytes] = None
+        self._ready_at = 0.0
+        super().__init__(None, **kwargs)
+
+    def _open_device(self) -> int:
+        return -1
+
+    def _close_device(self):
+        pass
+
+    def _write_block(self, data):
+        block = memoryview(data)
+        if (
+            block[:_TOKEN_OFFSET] != HEADER
+            or block[_TOKEN_OFFSET:_LENGTH_OFFSET] != TOKEN
+        ):
+            raise ProtocolError("Invalid command block")
+        if block[_RESPONSE_DATA_OFFSET] == _SUSPEND_COMMAND:
+            self._response, latency = b"", 0.0
+        else:
+            length = int.from_bytes(block[_LENGTH_OFFSET:_RESPONSE_DATA_OFFSET], "big")
+            self._response, latency = self.emulator.handle(
+                bytes(block[_COMMAND_DATA_OFFSET : _COMMAND_DATA_OFFSET + length])
+            )
+        self._ready_at = time.monotonic() + latency
+
+    def _read_block(self, length: int = BLOCK_SIZE) -> memoryview:
+        block = self._aligned_view
+        block[:_TOKEN_OFFSET] = HEADER
+        if self._response is None or time.monotonic() < self._ready_at:
+            block[_TOKEN_OFFSET:_RESPONSE_DATA_OFFSET] = TOKEN + bytes([0xFF, 0xFF])
+        else:
+            length_bytes = len(self._response).to_bytes(2, "big")
+            block[_TOKEN_OFFSET:_RESPONSE_DATA_OFFSET] = _RESPONSE_TOKEN + length_bytes
+            end = _RESPONSE_DATA_OFFSET + len(self._response)
+            block[_RESPONSE_DATA_OFFSET:end] = self._response
+        return block[:length]
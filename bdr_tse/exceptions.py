@@ -8,3 +8,15 @@ class TimeoutException(BdrTseException):
 
 class TransportError(BdrTseException):
     pass
+
+
+class ProtocolError(BdrTseException):
+    pass
+
+
+class RemoteError(BdrTseException):
+    pass
+
+
+class NoHealthyDeviceError(BdrTseException):
+    pass
@@ -0,0 +1,308 @@
+"""Helpers for working with the TAR archives exported from the TSE.
+
+:class:`ExportFile` and :class:`PagedExport` hold the logic of the exports of
+:class:`~bdr_tse.TseConnector` that is independent of how the data is read from
+the TSE, so that :class:`~bdr_tse.aio.AsyncTseConnector` shares it.
+"""
+
+from typing import Iterable, List, NamedTuple, Optional
+import hashlib
+import io
+import json
+import os
+import re
+import time
+
+from bdr_tse.transport import TransportDataTupleType, TransportDataType
+
+# File names of log messages as defined in BSI TR-03151, e.g.
+# Unixt_1564038420_Sig-63_Log-Tra_No-3_Start_Client-XYZ.log
+LOG_FILENAME_RE = re.compile(
+    r"^(?P<time_format>Unixt|Gent|Utc)_(?P<log_time>[^_]+)"
+    r"_Sig-(?P<signature_counter>\d+)"
+    r"_Log-(?:"
+    r"(?P<transaction_log>Tra)_No-(?P<transaction_number>\d+)"
+    r"_(?P<operation>Start|Update|Finish)_Client-(?P<client_id>.+?)"
+    r"|(?P<other_log>Sys|Aud)(?:_(?P<event_type>[^_.]+))?"
+    r")(?:_Fc-(?P<file_counter>\d+))?\.log$"
+)
+
+
+class LogFileName(NamedTuple):
+    """The information encoded in the file name of an exported log message."""
+
+    time_format: str
+    log_time: str
+    signature_counter: int
+    log_type: str
+    transaction_number: Optional[int]
+    operation: Optional[str]
+    client_id: Optional[str]
+
+
+def parse_log_filename(name: str) -> Optional[LogFileName]:
+    """Parse the file name of an exported log message.
+
+    :param name: The name of the TAR member.
+    :return: A :class:`LogFileName`, or ``None`` if ``name`` is not the name of a
+        log message.
+    """
+    match = LOG_FILENAME_RE.match(os.path.basename(name))
+    if not match:
+        return None
+    transaction_number = match.group("transaction_number")
+    return LogFileName(
+        time_format=match.group("time_format"),
+        log_time=match.group("log_time"),
+        signature_counter=int(match.group("signature_counter")),
+        log_type=match.group("transaction_log") or match.group("other_log"),
+        transaction_number=int(transaction_number) if transaction_number else None,
+        operation=match.group("operation"),
+        client_id=match.group("client_id"),
+    )
+
+
+def iter_log_filenames(data: bytes) -> Iterable[LogFileName]:
+    """Iterate over the log messages in an exported TAR archive, by file name."""
+    # Imported here as it is slow to import and only needed for paged exports
+    import tarfile
+
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:") as tar:
+        for member in tar:
+            log_filename = parse_log_filename(member.name)
+            if log_filename:
+                yield log_filename
+
+
+def export_data_params(
+    client_id: Optional[str] = None,
+    transaction_number: Optional[int] = None,
+    start_transaction_number: Optional[int] = None,
+    end_transaction_number: Optional[int] = None,
+    start_date: Optional[int] = None,
+    end_date: Optional[int] = None,
+    max_records: Optional[int] = None,
+) -> List[TransportDataTupleType]:
+    """The parameters of an ``ExportData`` command, see
+    :func:`~bdr_tse.TseConnector.export_data`. Filters that are ``None`` do not
+    restrict the export."""
+    return [
+        (TransportDataType.STRING, client_id or ""),
+        (
+            TransportDataType.BYTE_ARRAY,
+            (transaction_number or 0xFFFFFFFF).to_bytes(4, "big"),
+        ),
+        (
+            TransportDataType.BYTE_ARRAY,
+            (start_transaction_number or 0x00000000).to_bytes(4, "big"),
+        ),
+        (
+            TransportDataType.BYTE_ARRAY,
+            (end_transaction_number or 0xFFFFFFFF).to_bytes(4, "big"),
+        ),
+        (
+            TransportDataType.BYTE_ARRAY,
+            (start_date or 0x0000000000000000).to_bytes(8, "big"),
+        ),
+        (
+            TransportDataType.BYTE_ARRAY,
+            (end_date or 0xFFFFFFFFFFFFFFFF).to_bytes(8, "big"),
+        ),
+        (
+            TransportDataType.BYTE_ARRAY,
+            (max_records or 0xFFFFFFFF).to_bytes(4, "big"),
+        ),
+    ]
+
+
+class ExportFile:
+    """Writes exported data to a file, see
+    :func:`~bdr_tse.TseConnector.export_to_file`.
+
+    The data is written to a temporary file next to ``path``, which replaces
+    ``path`` on :meth:`commit`. The methods do blocking I/O.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The path of the file to write the exported data to.
+        """
+        self.path = path
+        self.tmp_path = "{}.tmp".format(path)
+        #: The number of bytes written
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._file = None
+        self._start_time = time.monotonic()
+
+    def open(self):
+        """Create the temporary file."""
+        self._file = open(self.tmp_path, "wb")
+
+    def preallocate(self, size: int):
+        """Reserve ``size`` bytes of disk space for the file, if supported."""
+        if not size or not hasattr(os, "posix_fallocate"):
+            return
+        try:
+            os.posix_fallocate(self._file.fileno(), 0, size)
+        except OSError:
+            # Not supported by the file system, the file will just grow as it's
+            # written
+            pass
+
+    def write(self, fragment: bytes):
+        """Append a fragment of the exported data."""
+        self._file.write(fragment)
+        self._sha256.update(fragment)
+        self.size += len(fragment)
+
+    def commit(self):
+        """Complete the file and replace ``path`` with it."""
+        with self._file as f:
+            # In case the TSE sent less data than it announced
+            f.truncate(self.size)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Remove the temporary file, if it was created. ``path`` is left as it
+        was."""
+        if self._file is None:
+            return
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+    def result(self) -> dict:
+        """The result of :func:`~bdr_tse.TseConnector.export_to_file`."""
+        duration = time.monotonic() - self._start_time
+        return {
+            "size": self.size,
+            "sha256": self._sha256.hexdigest(),
+            "duration": duration,
+            "bytes_per_second": self.size / duration if duration else 0,
+        }
+
+
+class ExportCheckpoint:
+    """Remembers how far data has been exported from the TSE, so that an export
+    can be resumed later. See :func:`~bdr_tse.TseConnector.export_data_paged`."""
+
+    def __init__(
+        self,
+        path=None,
+        last_signature_counter: int = 0,
+        last_transaction_number: int = 0,
+    ):
+        """
+        :param path: The file to persist the checkpoint in. If ``None``, the
+            checkpoint is only kept in memory.
+        :param last_signature_counter: The signature counter of the last exported
+            log message.
+        :param last_transaction_number: The highest exported transaction number.
+        """
+        self.path = path
+        self.last_signature_counter = last_signature_counter
+        self.last_transaction_number = last_transaction_number
+
+    @classmethod
+    def load(cls, path) -> "ExportCheckpoint":
+        """Load a checkpoint from ``path``. If the file does not exist, a new
+        checkpoint starting from the beginning is returned."""
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return cls(path)
+        return cls(
+            path,
+            last_signature_counter=state["last_signature_counter"],
+            last_transaction_number=state["last_transaction_number"],
+        )
+
+    def save(self):
+        """Persist the checkpoint, atomically replacing the previous one."""
+        if self.path is None:
+            return
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "last_signature_counter": self.last_signature_counter,
+                    "last_transaction_number": self.last_transaction_number,
+                },
+                f,
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def update(self, log_filenames: Iterable[LogFileName]):
+        """Advance the checkpoint past the given exported log messages."""
+        for log_filename in log_filenames:
+            self.last_signature_counter = max(
+                self.last_signature_counter, log_filename.signature_counter
+            )
+            if log_filename.transaction_number is not None:
+                self.last_transaction_number = max(
+                    self.last_transaction_number, log_filename.transaction_number
+                )
+
+    def __repr__(self):
+        return (
+            "ExportCheckpoint(last_signature_counter={}, "
+            "last_transaction_number={})".format(
+                self.last_signature_counter, self.last_transaction_number
+            )
+        )
+
+
+class PagedExport:
+    """The progress of an export in pages, see
+    :func:`~bdr_tse.TseConnector.export_data_paged`::
+
+        pages = PagedExport(checkpoint, page_size)
+        while not pages.done:
+            page = tse.export_more_data(
+                key_serial_number,
+                pages.checkpoint.last_signature_counter,
+                max_records=pages.page_size,
+            )
+            if pages.add(page):
+                process(page)
+                pages.processed()
+    """
+
+    def __init__(
+        self, checkpoint: Optional[ExportCheckpoint] = None, page_size: int = 1000
+    ):
+        """
+        :param checkpoint: The checkpoint to resume from. If ``None``, all data
+            is exported.
+        :param page_size: The maximum number of log messages per page.
+        """
+        self.checkpoint = ExportCheckpoint() if checkpoint is None else checkpoint
+        self.page_size = page_size
+        #: Whether all pages were exported
+        self.done = False
+        self._log_filenames: List[LogFileName] = []
+
+    def add(self, page: bytes) -> bool:
+        """Take the next page exported from the TSE.
+
+        :return: Whether the page holds log messages to process.
+        """
+        self._log_filenames = list(iter_log_filenames(page))
+        if not self._log_filenames:
+            self.done = True
+        return not self.done
+
+    def processed(self):
+        """Advance the checkpoint past the last page and save it."""
+        self.checkpoint.update(self._log_filenames)
+        self.checkpoint.save()
+        if len(self._log_filenames) < self.page_size:
+            self.done = True
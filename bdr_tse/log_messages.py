@@ -0,0 +1,522 @@
+"""Decoding and indexing of the log messages exported from the TSE.
+
+The exported data is a tar archive that contains one file per log message. Each
+log message is a DER-encoded ``LogMessage`` structure as defined in BSI TR-03151,
+carrying either transaction data, system operation data or audit data as
+defined in BSI TR-03153.
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+import calendar
+import io
+import os
+import tarfile
+
+from bdr_tse.exceptions import ProtocolError
+
+# Object identifiers of the certified data types, from BSI TR-03151
+TRANSACTION_LOG_OID = "0.4.0.127.0.7.3.7.1.1"
+SYSTEM_LOG_OID = "0.4.0.127.0.7.3.7.1.2"
+AUDIT_LOG_OID = "0.4.0.127.0.7.3.7.1.3"
+
+LOG_TYPES = {
+    TRANSACTION_LOG_OID: "Tra",
+    SYSTEM_LOG_OID: "Sys",
+    AUDIT_LOG_OID: "Aud",
+}
+
+_TAG_INTEGER = 0x02
+_TAG_OCTET_STRING = 0x04
+_TAG_OID = 0x06
+_TAG_UTC_TIME = 0x17
+_TAG_GENERALIZED_TIME = 0x18
+_TAG_SEQUENCE = 0x30
+_TAG_CONTEXT = 0x80
+
+# Context-specific tags of the certified data fields, by certified data type
+_TRANSACTION_FIELDS = {
+    0x80: "operation_type",
+    0x81: "client_id",
+    0x82: "process_data",
+    0x83: "process_type",
+    0x84: "additional_external_data",
+    0x85: "transaction_number",
+    0x86: "additional_internal_data",
+}
+_SYSTEM_FIELDS = {
+    0x80: "operation_type",
+    0x81: "system_operation_data",
+    0x82: "additional_internal_data",
+}
+_STRING_FIELDS = {"operation_type", "client_id", "process_type"}
+_INTEGER_FIELDS = {"transaction_number"}
+
+DataSource = Union[bytes, str, os.PathLike, BinaryIO, Iterable[bytes]]
+
+
+def _read_tlv(data: memoryview, offset: int) -> Tuple[int, int, int]:
+    """Read the DER element at ``offset``.
+
+    :return: The tag, and the start and end offsets of the content.
+    """
+    try:
+        tag = data[offset]
+        length = data[offset + 1]
+    except IndexError:
+        raise ProtocolError("Truncated DER element at offset {}".format(offset))
+    if tag & 0x1F == 0x1F:
+        raise ProtocolError("Unsupported DER tag at offset {}".format(offset))
+    start = offset + 2
+    if length & 0x80:
+        length_size = length & 0x7F
+        length = int.from_bytes(data[start : start + length_size], "big")
+        start += length_size
+    end = start + length
+    if end > len(data):
+        raise ProtocolError("Truncated DER element at offset {}".format(offset))
+    return tag, start, end
+
+
+def _read_elements(
+    data: memoryview, start: int, end: int
+) -> List[Tuple[int, int, int]]:
+    elements = []
+    offset = start
+    while offset < end:
+        element = _read_tlv(data, offset)
+        elements.append(element)
+        offset = element[2]
+    return elements
+
+
+def decode_oid(content: bytes) -> str:
+    """Decode the content of a DER encoded OBJECT IDENTIFIER, without its tag
+    and length, into its dotted form, e.g. ``"0.4.0.127.0.7.1.1.4.1.4"``."""
+    arcs = []
+    value = 0
+    for byte in content:
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            arcs.append(value)
+            value = 0
+    first = min(arcs[0] // 40, 2)
+    return ".".join(str(arc) for arc in [first, arcs[0] - 40 * first] + arcs[1:])
+
+
+def _decode_integer(content: memoryview) -> int:
+    return int.from_bytes(content, "big", signed=True)
+
+
+def _encode_tlv(tag: int, content: bytes) -> bytes:
+    length = len(content)
+    if length < 0x80:
+        return bytes([tag, length]) + content
+    length_bytes = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes([tag, 0x80 | len(length_bytes)]) + length_bytes + content
+
+
+def _encode_integer(value: int) -> bytes:
+    return value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True)
+
+
+def _encode_oid(oid: str) -> bytes:
+    arcs = [int(arc) for arc in oid.split(".")]
+    content = bytearray()
+    for arc in [40 * arcs[0] + arcs[1]] + arcs[2:]:
+        chunk = [arc & 0x7F]
+        arc >>= 7
+        while arc:
+            chunk.append(0x80 | (arc & 0x7F))
+            arc >>= 7
+        content.extend(reversed(chunk))
+    return bytes(content)
+
+
+def _decode_time(tag: int, content: memoryview) -> int:
+    if tag == _TAG_INTEGER:
+        return _decode_integer(content)
+    text = str(content, "ascii").rstrip("Z").split(".")[0]
+    time_format = "%y%m%d%H%M%S" if tag == _TAG_UTC_TIME else "%Y%m%d%H%M%S"
+    return calendar.timegm(datetime.strptime(text, time_format).timetuple())
+
+
+class LogMessage:
+    """A decoded log message.
+
+    Fields that do not occur in a log message of the given type are ``None``.
+    """
+
+    __slots__ = (
+        "raw",
+        "version",
+        "certified_data_type",
+        "operation_type",
+        "client_id",
+        "process_data",
+        "process_type",
+        "additional_external_data",
+        "transaction_number",
+        "additional_internal_data",
+        "system_operation_data",
+        "serial_number",
+        "signature_algorithm",
+        "se_audit_data",
+        "signature_counter",
+        "log_time",
+        "signature_value",
+        "signed_data",
+        "filename",
+        "archive_offset",
+    )
+
+    def __init__(self, raw: bytes = None):
+        for name in self.__slots__:
+            setattr(self, name, None)
+        self.raw = raw
+
+    @property
+    def log_type(self) -> Optional[str]:
+        """``Tra``, ``Sys`` or ``Aud``, as in the exported file names."""
+        return LOG_TYPES.get(self.certified_data_type)
+
+    @classmethod
+    def decode(cls, raw: bytes) -> "LogMessage":
+        """Decode a DER-encoded log message."""
+        message = cls(raw)
+        data = memoryview(raw)
+        tag, start, end = _read_tlv(data, 0)
+        if tag != _TAG_SEQUENCE:
+            raise ProtocolError("Log message is not a SEQUENCE")
+        elements = _read_elements(data, start, end)
+        if len(elements) < 5:
+            raise ProtocolError("Log message has too few elements")
+
+        (version_tag, s, e), (oid_tag, oid_s, oid_e) = elements[:2]
+        if version_tag != _TAG_INTEGER or oid_tag != _TAG_OID:
+            raise ProtocolError("Log message does not start with version and type")
+        message.version = _decode_integer(data[s:e])
+        message.certified_data_type = decode_oid(data[oid_s:oid_e])
+
+        # Certified data, up to the serial number
+        fields = (
+            _TRANSACTION_FIELDS
+            if message.certified_data_type == TRANSACTION_LOG_OID
+            else _SYSTEM_FIELDS
+        )
+        i = 2
+        while i < len(elements) and elements[i][0] & 0xC0 == _TAG_CONTEXT:
+            tag, s, e = elements[i]
+            name = fields.get(tag)
+            if name in _STRING_FIELDS:
+                setattr(message, name, str(data[s:e], "ascii"))
+            elif name in _INTEGER_FIELDS:
+                setattr(message, name, _decode_integer(data[s:e]))
+            elif name:
+                setattr(message, name, bytes(data[s:e]))
+            i += 1
+
+        # The signature value is always last, the other fields are determined by
+        # their position after the certified data.
+        rest = elements[i:-1]
+        tag, s, e = elements[-1]
+        if tag != _TAG_OCTET_STRING or len(rest) < 3:
+            raise ProtocolError("Log message has no signature")
+        message.signature_value = bytes(data[s:e])
+        # The signature covers all elements from the version to the log time
+        message.signed_data = bytes(data[start : rest[-1][2]])
+
+        tag, s, e = rest.pop(0)
+        if tag != _TAG_OCTET_STRING:
+            raise ProtocolError("Log message has no serial number")
+        message.serial_number = bytes(data[s:e])
+
+        tag, s, e = rest.pop(0)
+        if tag != _TAG_SEQUENCE:
+            raise ProtocolError("Log message has no signature algorithm")
+        algorithm = _read_elements(data, s, e)
+        if not algorithm or algorithm[0][0] != _TAG_OID:
+            raise ProtocolError("Invalid signature algorithm")
+        message.signature_algorithm = decode_oid(
+            data[algorithm[0][1] : algorithm[0][2]]
+        )
+
+        if rest and rest[0][0] == _TAG_OCTET_STRING:
+            tag, s, e = rest.pop(0)
+            message.se_audit_data = bytes(data[s:e])
+        if len(rest) == 2 and rest[0][0] == _TAG_INTEGER:
+            tag, s, e = rest.pop(0)
+            message.signature_counter = _decode_integer(data[s:e])
+        if len(rest) != 1 or rest[0][0] not in (
+            _TAG_INTEGER,
+            _TAG_UTC_TIME,
+            _TAG_GENERALIZED_TIME,
+        ):
+            raise ProtocolError("Log message has no log time")
+        tag, s, e = rest[0]
+        message.log_time = _decode_time(tag, data[s:e])
+
+        return message
+
+    def encode(self) -> bytes:
+        """DER-encode the log message from its fields. The log time is encoded as
+        a UNIX timestamp."""
+        fields = (
+            _TRANSACTION_FIELDS
+            if self.certified_data_type == TRANSACTION_LOG_OID
+            else _SYSTEM_FIELDS
+        )
+        elements = [
+            _encode_tlv(_TAG_INTEGER, _encode_integer(self.version or 2)),
+            _encode_tlv(_TAG_OID, _encode_oid(self.certified_data_type)),
+        ]
+        for tag, name in fields.items():
+            value = getattr(self, name)
+            if value is None:
+                continue
+            if name in _STRING_FIELDS:
+                value = value.encode("ascii")
+            elif name in _INTEGER_FIELDS:
+                value = _encode_integer(value)
+            elements.append(_encode_tlv(tag, value))
+        elements.append(_encode_tlv(_TAG_OCTET_STRING, self.serial_number))
+        elements.append(
+            _encode_tlv(
+                _TAG_SEQUENCE,
+                _encode_tlv(_TAG_OID, _encode_oid(self.signature_algorithm)),
+            )
+        )
+        if self.se_audit_data is not None:
+            elements.append(_encode_tlv(_TAG_OCTET_STRING, self.se_audit_data))
+        if self.signature_counter is not None:
+            elements.append(
+                _encode_tlv(_TAG_INTEGER, _encode_integer(self.signature_counter))
+            )
+        elements.append(_encode_tlv(_TAG_INTEGER, _encode_integer(self.log_time)))
+        elements.append(_encode_tlv(_TAG_OCTET_STRING, self.signature_value))
+        return _encode_tlv(_TAG_SEQUENCE, b"".join(elements))
+
+    def __repr__(self):
+        return (
+            "LogMessage(log_type={!r}, signature_counter={}, transaction_number={}, "
+            "operation_type={!r}, client_id={!r}, log_time={})".format(
+                self.log_type,
+                self.signature_counter,
+                self.transaction_number,
+                self.operation_type,
+                self.client_id,
+                self.log_time,
+            )
+        )
+
+
+class _FragmentReader(io.RawIOBase):
+    """File-like object reading from an iterable of fragments."""
+
+    def __init__(self, fragments: Iterable[bytes]):
+        self._fragments = iter(fragments)
+        self._buf = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buf:
+            try:
+                self._buf = memoryview(next(self._fragments))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def _open_source(source: DataSource) -> BinaryIO:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb")
+    if hasattr(source, "read"):
+        return source
+    return io.BufferedReader(_FragmentReader(source))
+
+
+def iter_log_messages(source: DataSource) -> Iterator[LogMessage]:
+    """Iterate over the log messages in exported data, decoding them one by one
+    while reading the archive. The archive is never held in memory as a whole.
+
+    :param source: The exported tar archive, as bytes, a path, a binary file
+        object or an iterable of fragments such as
+        :func:`~bdr_tse.TseConnector.export_data_iter`.
+    """
+    f = _open_source(source)
+    try:
+        with tarfile.open(fileobj=f, mode="r|") as tar:
+            for member in tar:
+                if not member.isfile() or not member.name.endswith(".log"):
+                    continue
+                message = LogMessage.decode(tar.extractfile(member).read())
+                message.filename = member.name
+                message.archive_offset = member.offset_data
+                yield message
+    finally:
+        if f is not source:
+            f.close()
+
+
+class IndexEntry(NamedTuple):
+    """An entry of a :class:`LogIndex`."""
+
+    signature_counter: int
+    log_time: int
+    log_type: str
+    transaction_number: Optional[int]
+    operation_type: Optional[str]
+    client_id: Optional[str]
+    filename: str
+    archive_offset: int
+    size: int
+
+    @classmethod
+    def from_log_message(cls, message: LogMessage) -> "IndexEntry":
+        return cls(
+            signature_counter=message.signature_counter,
+            log_time=message.log_time,
+            log_type=message.log_type,
+            transaction_number=message.transaction_number,
+            operation_type=message.operation_type,
+            client_id=message.client_id,
+            filename=message.filename,
+            archive_offset=message.archive_offset,
+            size=len(message.raw),
+        )
+
+
+class LogIndex:
+    """A compact index of the log messages in exported data.
+
+    The index only keeps the fields needed to find log messages. The complete
+    log message can be read from the archive with :meth:`read_log_message`.
+    """
+
+    def __init__(self, entries: Iterable[IndexEntry] = ()):
+        self._entries: List[IndexEntry] = []
+        self._signature_counters: List[int] = []
+        self._by_transaction_number: List[Tuple[int, int]] = []
+        self._by_log_time: List[Tuple[int, int]] = []
+        self._by_client_id: Dict[str, List[int]] = defaultdict(list)
+        self._dirty = False
+        for entry in entries:
+            self.add(entry)
+
+    @classmethod
+    def build(cls, source: DataSource) -> "LogIndex":
+        """Build an index of the log messages in ``source``, see
+        :func:`iter_log_messages`."""
+        return cls(IndexEntry.from_log_message(m) for m in iter_log_messages(source))
+
+    def add(self, entry: IndexEntry):
+        self._entries.append(entry)
+        self._dirty = True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[IndexEntry]:
+        self._sort()
+        return iter(self._entries)
+
+    def _sort(self):
+        if not self._dirty:
+            return
+        self._entries.sort(key=lambda entry: entry.signature_counter or 0)
+        self._signature_counters = [
+            entry.signature_counter or 0 for entry in self._entries
+        ]
+        self._by_transaction_number = sorted(
+            (entry.transaction_number, i)
+            for i, entry in enumerate(self._entries)
+            if entry.transaction_number is not None
+        )
+        self._by_log_time = sorted(
+            (entry.log_time, i) for i, entry in enumerate(self._entries)
+        )
+        self._by_client_id = defaultdict(list)
+        for i, entry in enumerate(self._entries):
+            if entry.client_id is not None:
+                self._by_client_id[entry.client_id].append(i)
+        self._dirty = False
+
+    def _range(self, keys: List[Tuple[int, int]], start, end) -> List[IndexEntry]:
+        low = 0 if start is None else bisect_left(keys, (start,))
+        high = len(keys) if end is None else bisect_right(keys, (end, len(keys)))
+        return sorted(
+            (self._entries[i] for _, i in keys[low:high]),
+            key=lambda entry: entry.signature_counter or 0,
+        )
+
+    def by_signature_counter(
+        self, start: int = None, end: int = None
+    ) -> List[IndexEntry]:
+        """The log messages with a signature counter between ``start`` and ``end``,
+        inclusive."""
+        self._sort()
+        counters = self._signature_counters
+        low = 0 if start is None else bisect_left(counters, start)
+        high = len(counters) if end is None else bisect_right(counters, end)
+        return self._entries[low:high]
+
+    def by_transaction_number(
+        self, start: int = None, end: int = None
+    ) -> List[IndexEntry]:
+        """The transaction log messages with a transaction number between ``start``
+        and ``end``, inclusive."""
+        self._sort()
+        return self._range(self._by_transaction_number, start, end)
+
+    def by_log_time(self, start: int = None, end: int = None) -> List[IndexEntry]:
+        """The log messages with a log time between ``start`` and ``end``,
+        inclusive, as UNIX timestamps."""
+        self._sort()
+        return self._range(self._by_log_time, start, end)
+
+    def by_client_id(
+        self, client_id: str, start_time: int = None, end_time: int = None
+    ) -> List[IndexEntry]:
+        """The transaction log messages of a client, optionally restricted to a
+        range of log times."""
+        self._sort()
+        return [
+            self._entries[i]
+            for i in self._by_client_id.get(client_id, [])
+            if (start_time is None or self._entries[i].log_time >= start_time)
+            and (end_time is None or self._entries[i].log_time <= end_time)
+        ]
+
+    @staticmethod
+    def read_log_message(archive: Union[str, os.PathLike, BinaryIO], entry: IndexEntry):
+        """Read and decode the log message of ``entry`` from the archive it was
+        indexed from."""
+        f = open(archive, "rb") if isinstance(archive, (str, os.PathLike)) else archive
+        try:
+            f.seek(entry.archive_offset)
+            message = LogMessage.decode(f.read(entry.size))
+        finally:
+            if f is not archive:
+                f.close()
+        message.filename = entry.filename
+        message.archive_offset = entry.archive_offset
+        return message
@@ -0,0 +1,214 @@
+"""A persistent local store of the log messages exported from a TSE."""
+
+from datetime import date, datetime, time, timedelta, tzinfo
+from typing import Iterable, List, Optional
+import logging
+import sqlite3
+
+from bdr_tse.export import ExportCheckpoint
+from bdr_tse.log_messages import DataSource, LogMessage, iter_log_messages
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_messages (
+    signature_counter INTEGER PRIMARY KEY,
+    log_type TEXT NOT NULL,
+    transaction_number INTEGER,
+    operation_type TEXT,
+    client_id TEXT,
+    log_time INTEGER NOT NULL,
+    filename TEXT,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS log_messages_client_id_log_time
+    ON log_messages (client_id, log_time);
+CREATE INDEX IF NOT EXISTS log_messages_transaction_number
+    ON log_messages (transaction_number);
+CREATE INDEX IF NOT EXISTS log_messages_log_time ON log_messages (log_time);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+logger = logging.getLogger(__name__)
+
+# Number of log messages inserted per transaction when ingesting
+_INGEST_BATCH_SIZE = 1000
+
+
+class LogStore:
+    """Stores the log messages exported from a TSE in an SQLite database, so that
+    they can be queried without exporting them from the TSE again.
+
+    Log messages are deduplicated by their signature counter, so a store must
+    only hold the log messages of a single TSE. :meth:`sync` only exports the log
+    messages that are not in the store yet.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The path of the SQLite database, created if it does not exist.
+        """
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _get_state(self, key: str) -> int:
+        row = self._db.execute(
+            "SELECT value FROM sync_state WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    @property
+    def last_signature_counter(self) -> int:
+        """The highest signature counter in the store."""
+        return self._get_state("last_signature_counter")
+
+    @property
+    def last_transaction_number(self) -> int:
+        """The highest transaction number in the store."""
+        return self._get_state("last_transaction_number")
+
+    def ingest(self, source: DataSource) -> int:
+        """Add the log messages in exported data to the store. Log messages that
+        are already in the store are skipped, as are log messages without a
+        signature counter, which cannot be deduplicated.
+
+        :param source: The exported data, see
+            :func:`~bdr_tse.log_messages.iter_log_messages`.
+        :return: The number of log messages that were added.
+        """
+        added = 0
+        batch = []
+        for message in iter_log_messages(source):
+            if message.signature_counter is None:
+                logger.warning("Skipping log message without a signature counter")
+                continue
+            batch.append(message)
+            if len(batch) >= _INGEST_BATCH_SIZE:
+                added += self._insert(batch)
+                batch = []
+        if batch:
+            added += self._insert(batch)
+        return added
+
+    def _insert(self, messages: List[LogMessage]) -> int:
+        with self._db:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO log_messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        m.signature_counter,
+                        m.log_type,
+                        m.transaction_number,
+                        m.operation_type,
+                        m.client_id,
+                        m.log_time,
+                        m.filename,
+                        m.raw,
+                    )
+                    for m in messages
+                ),
+            )
+            added = self._db.total_changes - before
+            for key, value in (
+                ("last_signature_counter", max(m.signature_counter for m in messages)),
+                (
+                    "last_transaction_number",
+                    max(m.transaction_number or 0 for m in messages),
+                ),
+            ):
+                self._db.execute(
+                    "INSERT INTO sync_state VALUES (?, ?) ON CONFLICT (key) "
+                    "DO UPDATE SET value = max(value, excluded.value)",
+                    (key, value),
+                )
+        return added
+
+    def sync(self, tse, page_size: int = 1000) -> int:
+        """Export the log messages that are not in the store yet from the TSE and
+        add them.
+
+        :param tse: The :class:`~bdr_tse.TseConnector` to export from.
+        :param page_size: The maximum number of log messages exported at once.
+        :return: The number of log messages that were added.
+        """
+        checkpoint = ExportCheckpoint(
+            last_signature_counter=self.last_signature_counter,
+            last_transaction_number=self.last_transaction_number,
+        )
+        return sum(
+            self.ingest(page)
+            for page in tse.export_data_paged(checkpoint, page_size=page_size)
+        )
+
+    def _query(self, where: str, params: Iterable) -> List[LogMessage]:
+        rows = self._db.execute(
+            "SELECT filename, data FROM log_messages WHERE {} "
+            "ORDER BY signature_counter".format(where),
+            tuple(params),
+        )
+        messages = []
+        for filename, data in rows:
+            message = LogMessage.decode(data)
+            message.filename = filename
+            messages.append(message)
+        return messages
+
+    def find(
+        self,
+        client_id: str = None,
+        transaction_number: int = None,
+        start_time: int = None,
+        end_time: int = None,
+        log_type: str = None,
+    ) -> List[LogMessage]:
+        """Find log messages, ordered by signature counter.
+
+        :param client_id: Only log messages of this client.
+        :param transaction_number: Only log messages of this transaction.
+        :param start_time: Only log messages logged at or after this UNIX timestamp.
+        :param end_time: Only log messages logged before this UNIX timestamp.
+        :param log_type: Only log messages of this type (``Tra``, ``Sys`` or
+            ``Aud``).
+        """
+        conditions = ["1"]
+        params = []
+        for condition, value in (
+            ("client_id = ?", client_id),
+            ("transaction_number = ?", transaction_number),
+            ("log_time >= ?", start_time),
+            ("log_time < ?", end_time),
+            ("log_type = ?", log_type),
+        ):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+        return self._query(" AND ".join(conditions), params)
+
+    def find_transactions(
+        self, client_id: str, day: date, tz: Optional[tzinfo] = None
+    ) -> List[LogMessage]:
+        """Find the transaction log messages of a client on a given day.
+
+        :param client_id: The client ID.
+        :param day: The day.
+        :param tz: The time zone that ``day`` is in. Defaults to local time.
+        """
+        start = datetime.combine(day, time.min, tzinfo=tz)
+        end = start + timedelta(days=1)
+        return self.find(
+            client_id=client_id,
+            start_time=int(start.timestamp()),
+            end_time=int(end.timestamp()),
+            log_type="Tra",
+        )
@@ -0,0 +1,208 @@
+"""Latency metrics of the commands sent to the TSE.
+
+Pass a :class:`TransportMetrics` to :class:`~bdr_tse.TseConnector` to record, for
+every command, how long each stage of the command took:
+
+* ``encode``: Encoding the command.
+* ``write``: Writing the command to the TSE.
+* ``ready``: Polling the TSE until the response was ready.
+* ``read``: Reading the response once it was ready.
+* ``parse``: Decoding the response.
+* ``total``: The whole exchange with the TSE, from encoding the command until
+  the last fragment of the response was read.
+
+as well as the number of ``polls`` and response ``fragments`` that it needed.
+Stages that a backend does not report, e.g. ``ready`` for backends that do not
+poll, are not recorded.
+
+The values are counted into histograms with fixed buckets, so recording is
+cheap and the memory used does not grow over time.
+"""
+
+from bisect import bisect_left
+from typing import Dict, List, Sequence
+import enum
+
+#: Upper bounds of the buckets of duration histograms, in seconds
+DURATION_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+#: Upper bounds of the buckets of count histograms
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 1000, 10000, 100000, 1000000)
+
+DURATION_STAGES = ("encode", "write", "ready", "read", "parse", "total")
+COUNT_STAGES = ("polls", "fragments")
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    """A histogram with fixed buckets, like a Prometheus histogram."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        """
+        :param buckets: The upper bounds of the buckets, in ascending order. An
+            additional bucket catches all values above the last bound.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating linearly within the bucket that it
+        falls into, like Prometheus' ``histogram_quantile``. Quantiles in the
+        overflow bucket are estimated as the last bucket bound."""
+        if not self.count:
+            return float("nan")
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        """The state of the histogram and estimates of its :data:`QUANTILES`."""
+        snapshot = {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(zip(self.buckets + (float("inf"),), self.counts)),
+        }
+        for q in QUANTILES:
+            snapshot["p{:g}".format(q * 100)] = self.quantile(q)
+        return snapshot
+
+
+class CommandMetrics:
+    """The histograms of a single command."""
+
+    __slots__ = ("histograms",)
+
+    def __init__(self):
+        self.histograms: Dict[str, Histogram] = {}
+        for stage in DURATION_STAGES:
+            self.histograms[stage] = Histogram(DURATION_BUCKETS)
+        for stage in COUNT_STAGES:
+            self.histograms[stage] = Histogram(COUNT_BUCKETS)
+
+
+def _command_name(command) -> str:
+    return command.name if isinstance(command, enum.Enum) else str(command)
+
+
+class TransportMetrics:
+    """Collects per-command metrics of a :class:`~bdr_tse.transport.Transport`.
+
+    Values are expected to be recorded from a single thread, but snapshots may
+    be taken from any thread.
+    """
+
+    def __init__(self):
+        self.commands: Dict[str, CommandMetrics] = {}
+
+    def observe(self, command, stage: str, value: float):
+        """Record a value.
+
+        :param command: The :class:`~bdr_tse.transport.TransportCommand`.
+        :param stage: One of :data:`DURATION_STAGES` or :data:`COUNT_STAGES`.
+        :param value: The duration in seconds, or the count.
+        """
+        name = _command_name(command)
+        metrics = self.commands.get(name)
+        if metrics is None:
+            metrics = self.commands[name] = CommandMetrics()
+        metrics.histograms[stage].observe(value)
+
+    def reset(self):
+        self.commands = {}
+
+    def snapshot(self) -> Dict[str, Dict[str, dict]]:
+        """The state of all histograms, by command name and stage, see
+        :meth:`Histogram.snapshot`. Stages without values are omitted."""
+        return {
+            name: {
+                stage: histogram.snapshot()
+                for stage, histogram in list(metrics.histograms.items())
+                if histogram.count
+            }
+            for name, metrics in list(self.commands.items())
+        }
+
+    def to_prometheus(self, prefix: str = "bdr_tse") -> str:
+        """Render the histograms in the Prometheus text exposition format."""
+        lines: List[str] = []
+        families = (
+            (
+                "command_duration_seconds",
+                DURATION_STAGES,
+                "Duration of the stages of TSE commands.",
+            ),
+            ("command_polls", ("polls",), "Number of polls until the TSE answered."),
+            (
+                "command_fragments",
+                ("fragments",),
+                "Number of fragments of the responses of the TSE.",
+            ),
+        )
+        commands = list(self.commands.items())
+        for family, stages, help_text in families:
+            metric = "{}_{}".format(prefix, family)
+            lines.append("# HELP {} {}".format(metric, help_text))
+            lines.append("# TYPE {} histogram".format(metric))
+            for name, metrics in commands:
+                for stage in stages:
+                    histogram = metrics.histograms[stage]
+                    if not histogram.count:
+                        continue
+                    labels = 'command="{}"'.format(name)
+                    if family == "command_duration_seconds":
+                        labels += ',stage="{}"'.format(stage)
+                    cumulative = 0
+                    for bound, count in zip(
+                        histogram.buckets + (float("inf"),), histogram.counts
+                    ):
+                        cumulative += count
+                        lines.append(
+                            '{}_bucket{{{},le="{}"}} {}'.format(
+                                metric,
+                                labels,
+                                "+Inf" if bound == float("inf") else repr(bound),
+                                cumulative,
+                            )
+                        )
+                    lines.append(
+                        "{}_sum{{{}}} {!r}".format(metric, labels, histogram.sum)
+                    )
+                    lines.append(
+                        "{}_count{{{}}} {}".format(metric, labels, histogram.count)
+                    )
+        return "\n".join(lines) + "\n"
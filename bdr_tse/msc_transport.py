@@ -1,109 +1,273 @@
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Mapping, NamedTuple, Optional, Tuple
 import os
 import re
 import os.path
 import time
 import mmap
+import functools
 import logging
 
-import construct
-
-from bdr_tse.exceptions import TimeoutException
+from bdr_tse.capture import RECORD_READ_BLOCK, RECORD_TIMEOUT, RECORD_WRITE_BLOCK
+from bdr_tse.exceptions import ProtocolError, TimeoutException
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_TIMEOUT = 10.0
 BLOCK_SIZE = 8192
+# Size of the read used to check whether the TSE has answered. Must be a multiple
+# of the sector size of the TSE because of O_DIRECT.
+PROBE_SIZE = 512
+# Number of poll counts that are remembered per command
+POLL_HISTORY_LENGTH = 1000
 
 # The token that we always send to the TSE in the header
 TOKEN = bytes([0xDE, 0xAD, 0xBE, 0xEF])
 
-HEADER_CON = "header" / construct.Const(
-    bytes(
-        [
-            0x41,
-            0x64,
-            0x56,
-            0x61,
-            0x6E,
-            0x63,
-            0x45,
-            0x44,
-            0x20,
-            0x53,
-            0x65,
-            0x43,
-            0x75,
-            0x52,
-            0x65,
-            0x20,
-            0x53,
-            0x44,
-            0x2F,
-            0x4D,
-            0x4D,
-            0x43,
-            0x20,
-            0x43,
-            0x41,
-            0x72,
-            0x64,
-            0x01,
-        ]
-    )
+HEADER = bytes(
+    [
+        0x41,
+        0x64,
+        0x56,
+        0x61,
+        0x6E,
+        0x63,
+        0x45,
+        0x44,
+        0x20,
+        0x53,
+        0x65,
+        0x43,
+        0x75,
+        0x52,
+        0x65,
+        0x20,
+        0x53,
+        0x44,
+        0x2F,
+        0x4D,
+        0x4D,
+        0x43,
+        0x20,
+        0x43,
+        0x41,
+        0x72,
+        0x64,
+        0x01,
+    ]
 )
 
-TOKEN_CON = "token" / construct.Const(TOKEN)
-RANDOM_TOKEN_CON = "random_token" / construct.Byte[4]
-
-MSC_TRANSPORT_DISABLE_SUSPEND_PACKET = construct.Padded(
-    BLOCK_SIZE,
-    construct.Struct(
-        HEADER_CON,
-        TOKEN_CON,
-        construct.Const(bytes([0x00, 0x02, 0x53, 0x44, 0x00, 0x00])),
-    ),
+# The construct definitions of the packets, see _structs
+_STRUCT_NAMES = frozenset(
+    {
+        "HEADER_CON",
+        "TOKEN_CON",
+        "RANDOM_TOKEN_CON",
+        "MSC_TRANSPORT_DISABLE_SUSPEND_PACKET",
+        "MSC_TRANSPORT_ENABLE_SUSPEND_PACKET",
+        "MSC_TRANSPORT_SUSPEND_RESPONSE_PACKET",
+        "MSC_TRANSPORT_COMMAND_PACKET",
+        "MSC_TRANSPORT_RESPONSE_PACKET",
+    }
 )
 
-MSC_TRANSPORT_ENABLE_SUSPEND_PACKET = construct.Padded(
-    BLOCK_SIZE,
-    construct.Struct(
-        HEADER_CON,
-        TOKEN_CON,
-        construct.Const(bytes([0x00, 0x02, 0x53, 0x45, 0x00, 0x00])),
-    ),
-)
 
-MSC_TRANSPORT_SUSPEND_RESPONSE_PACKET = construct.Padded(
-    BLOCK_SIZE,
-    construct.Struct(HEADER_CON, RANDOM_TOKEN_CON, construct.Const(bytes([0x00]))),
-)
+@functools.lru_cache(maxsize=None)
+def _structs() -> Dict[str, Any]:
+    """Build the construct definitions of the packets when they are first used.
+    :class:`MscFrameCodec` does the work of the transport without them.
+    """
+    import construct
+
+    HEADER_CON = "header" / construct.Const(HEADER)
 
-MSC_TRANSPORT_COMMAND_PACKET = construct.Padded(
-    BLOCK_SIZE,
-    construct.Struct(
-        HEADER_CON,
-        TOKEN_CON,
-        "command_data_length"
-        / construct.Rebuild(
-            construct.Int16ub, construct.len_(construct.this.command_data)
+    TOKEN_CON = "token" / construct.Const(TOKEN)
+    RANDOM_TOKEN_CON = "random_token" / construct.Byte[4]
+
+    MSC_TRANSPORT_DISABLE_SUSPEND_PACKET = construct.Padded(
+        BLOCK_SIZE,
+        construct.Struct(
+            HEADER_CON,
+            TOKEN_CON,
+            construct.Const(bytes([0x00, 0x02, 0x53, 0x44, 0x00, 0x00])),
         ),
-        construct.Const(bytes([0x00, 0x00])),
-        "command_data" / construct.Byte[construct.this.command_data_length],
-    ),
-)
+    )
 
-MSC_TRANSPORT_RESPONSE_PACKET = construct.Padded(
-    BLOCK_SIZE,
-    construct.Struct(
-        HEADER_CON,
-        RANDOM_TOKEN_CON,
-        "response_data" / construct.Prefixed(construct.Int16ub, construct.GreedyBytes),
-    ),
-)
+    MSC_TRANSPORT_ENABLE_SUSPEND_PACKET = construct.Padded(
+        BLOCK_SIZE,
+        construct.Struct(
+            HEADER_CON,
+            TOKEN_CON,
+            construct.Const(bytes([0x00, 0x02, 0x53, 0x45, 0x00, 0x00])),
+        ),
+    )
+
+    MSC_TRANSPORT_SUSPEND_RESPONSE_PACKET = construct.Padded(
+        BLOCK_SIZE,
+        construct.Struct(HEADER_CON, RANDOM_TOKEN_CON, construct.Const(bytes([0x00]))),
+    )
+
+    MSC_TRANSPORT_COMMAND_PACKET = construct.Padded(
+        BLOCK_SIZE,
+        construct.Struct(
+            HEADER_CON,
+            TOKEN_CON,
+            "command_data_length"
+            / construct.Rebuild(
+                construct.Int16ub, construct.len_(construct.this.command_data)
+            ),
+            construct.Const(bytes([0x00, 0x00])),
+            "command_data" / construct.Byte[construct.this.command_data_length],
+        ),
+    )
+
+    MSC_TRANSPORT_RESPONSE_PACKET = construct.Padded(
+        BLOCK_SIZE,
+        construct.Struct(
+            HEADER_CON,
+            RANDOM_TOKEN_CON,
+            "response_data"
+            / construct.Prefixed(construct.Int16ub, construct.GreedyBytes),
+        ),
+    )
+
+    return {
+        "HEADER_CON": HEADER_CON,
+        "TOKEN_CON": TOKEN_CON,
+        "RANDOM_TOKEN_CON": RANDOM_TOKEN_CON,
+        "MSC_TRANSPORT_DISABLE_SUSPEND_PACKET": MSC_TRANSPORT_DISABLE_SUSPEND_PACKET,
+        "MSC_TRANSPORT_ENABLE_SUSPEND_PACKET": MSC_TRANSPORT_ENABLE_SUSPEND_PACKET,
+        "MSC_TRANSPORT_SUSPEND_RESPONSE_PACKET": MSC_TRANSPORT_SUSPEND_RESPONSE_PACKET,
+        "MSC_TRANSPORT_COMMAND_PACKET": MSC_TRANSPORT_COMMAND_PACKET,
+        "MSC_TRANSPORT_RESPONSE_PACKET": MSC_TRANSPORT_RESPONSE_PACKET,
+    }
+
+
+def __getattr__(name: str):
+    # Makes the construct definitions available as module attributes
+    if name in _STRUCT_NAMES:
+        return _structs()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+# Offsets into an MSC block
+_TOKEN_OFFSET = len(HEADER)
+_LENGTH_OFFSET = _TOKEN_OFFSET + len(TOKEN)
+_RESPONSE_DATA_OFFSET = _LENGTH_OFFSET + 2
+_COMMAND_DATA_OFFSET = _LENGTH_OFFSET + 4
+
+MAX_COMMAND_DATA_LENGTH = BLOCK_SIZE - _COMMAND_DATA_OFFSET
+
+_SUSPEND_BODY = {
+    True: bytes([0x00, 0x02, 0x53, 0x45, 0x00, 0x00]),
+    False: bytes([0x00, 0x02, 0x53, 0x44, 0x00, 0x00]),
+}
+
+
+class MscFrameCodec:
+    """Builds command blocks and parses response blocks without going through
+    construct.
+
+    Produces exactly the same bytes as :data:`MSC_TRANSPORT_COMMAND_PACKET` and
+    the suspend packets, but renders the constant header and token into the
+    command buffer only once and afterwards only patches the length and the
+    command data. Responses are parsed into :class:`memoryview` slices of the
+    block that was read, so no data is copied.
+    """
+
+    def __init__(self, command_buf):
+        """
+        :param command_buf: A writable buffer of ``BLOCK_SIZE`` zero bytes that
+            command blocks are built in, e.g. an aligned :class:`mmap.mmap`.
+        """
+        self.command_buf = command_buf
+        command_buf[:_TOKEN_OFFSET] = HEADER
+        command_buf[_TOKEN_OFFSET:_LENGTH_OFFSET] = TOKEN
+        # Everything after this offset in command_buf is known to be zero
+        self._command_end = _LENGTH_OFFSET
+
+    def build_command(self, command_data):
+        """Build a command block carrying ``command_data`` in the command buffer.
+
+        :return: The command buffer.
+        """
+        length = len(command_data)
+        if length > MAX_COMMAND_DATA_LENGTH:
+            raise ValueError(
+                "Command data of {} bytes does not fit into a block".format(length)
+            )
+        buf = self.command_buf
+        buf[_LENGTH_OFFSET:_COMMAND_DATA_OFFSET] = length.to_bytes(2, "big") + bytes(2)
+        end = _COMMAND_DATA_OFFSET + length
+        buf[_COMMAND_DATA_OFFSET:end] = command_data
+        self._clear_from(end)
+        return buf
+
+    def build_suspend(self, suspend: bool):
+        """Build a block that enables or disables the suspend mode of the TSE in
+        the command buffer.
+
+        :return: The command buffer.
+        """
+        body = _SUSPEND_BODY[suspend]
+        end = _LENGTH_OFFSET + len(body)
+        self.command_buf[_LENGTH_OFFSET:end] = body
+        self._clear_from(end)
+        return self.command_buf
+
+    def _clear_from(self, end: int):
+        if end < self._command_end:
+            self.command_buf[end : self._command_end] = bytes(self._command_end - end)
+        self._command_end = end
+
+    @staticmethod
+    def parse_response(block) -> Tuple[memoryview, memoryview]:
+        """Parse a response block.
+
+        :param block: The block read from the TSE.
+        :return: A tuple of the random token and the response data, both as
+            slices of ``block``.
+        """
+        block = memoryview(block)
+        MscFrameCodec._check_header(block)
+        length = int.from_bytes(block[_LENGTH_OFFSET:_RESPONSE_DATA_OFFSET], "big")
+        end = _RESPONSE_DATA_OFFSET + length
+        if end > len(block):
+            raise ProtocolError("Response length {} exceeds the block".format(length))
+        return block[_TOKEN_OFFSET:_LENGTH_OFFSET], block[_RESPONSE_DATA_OFFSET:end]
+
+    @staticmethod
+    def parse_suspend_response(block):
+        """Check that ``block`` is a successful response to a suspend command."""
+        block = memoryview(block)
+        MscFrameCodec._check_header(block)
+        if block[_LENGTH_OFFSET] != 0x00:
+            raise ProtocolError("Invalid response to suspend command")
 
+    @staticmethod
+    def _check_header(block: memoryview):
+        if block[:_TOKEN_OFFSET] != HEADER:
+            raise ProtocolError("Invalid block header")
 
-def _format_hex_for_log(data: bytes, length=200) -> str:
-    return " ".join(re.findall("....", data.hex()[:length]))
+
+def _format_hex_for_log(data, length=200) -> str:
+    with memoryview(data) as view:
+        return " ".join(re.findall("....", view[: length // 2].hex()))
+
+
+class PollingProfile(NamedTuple):
+    """Describes how :class:`MscTransport` polls the TSE while waiting for a reply.
+
+    The TSE is first polled in a tight loop for ``spin_time`` seconds. After that,
+    the transport sleeps between polls, starting with ``initial_interval`` seconds
+    and multiplying the interval by ``backoff`` after every poll, up to
+    ``max_interval`` seconds.
+    """
+
+    spin_time: float = 0.002
+    initial_interval: float = 0.001
+    max_interval: float = 0.05
+    backoff: float = 2.0
 
 
 class MscTransport:
@@ -115,91 +279,220 @@ class MscTransport:
 
     CMD_FILENAME = "TSE-IO.bin"
 
-    def __init__(self, tse_path):
+    def __init__(
+        self,
+        tse_path,
+        polling_profiles: Optional[Mapping[Any, PollingProfile]] = None,
+        default_polling_profile: PollingProfile = PollingProfile(),
+        probe_size: Optional[int] = PROBE_SIZE,
+        capture=None,
+    ):
+        """
+        :param tse_path: The path where the TSE is mounted.
+        :param polling_profiles: A mapping of command to the
+            :class:`PollingProfile` to use when waiting for its response.
+        :param default_polling_profile: The :class:`PollingProfile` to use for
+            commands that have no entry in ``polling_profiles``.
+        :param probe_size: While waiting for a response, only read this many bytes
+            to check whether the TSE has answered, and read the full block only
+            once it has. ``None`` disables probing. Probing is disabled
+            automatically if the TSE rejects the partial read.
+        :param capture: A :class:`~bdr_tse.capture.CaptureRing` to record the
+            exchanged blocks into.
+        """
         self.tse_path = tse_path
+        self.capture = capture
+        self.polling_profiles = dict(polling_profiles or {})
+        self.default_polling_profile = default_polling_profile
+        # The number of polls that the most recent responses to each command
+        # needed, to allow tuning the polling profiles.
+        self.poll_counts: Dict[Any, Deque[int]] = defaultdict(
+            lambda: deque(maxlen=POLL_HISTORY_LENGTH)
+        )
+        # The number of polls needed by the most recent read
+        self.last_poll_count = 0
+        # The seconds until the TSE was ready in the most recent read
+        self.last_ready_time = 0.0
+        self.probe_size = probe_size
 
         # Get an aligned chunk of memory, required for O_DIRECT
         # See http://www.alexonlinux.com/direct-io-in-python
         self._aligned_buf = mmap.mmap(-1, BLOCK_SIZE)
-        # O_DIRECT is required to bypass OS buffers. Keeping the file open between
-        # read and write seems to be required.
-        self._fd = os.open(self._get_tse_cmd_filepath(), os.O_RDWR | os.O_DIRECT)
+        self._aligned_view = memoryview(self._aligned_buf)
+        # Commands are built in a separate buffer so that reads don't overwrite
+        # the pre-rendered header.
+        self._codec = MscFrameCodec(mmap.mmap(-1, BLOCK_SIZE))
+        self._fd = self._open_device()
         self.set_suspend(False)
 
     def close(self):
         """Suspend and close the connection to the TSE."""
         self.set_suspend(True)
-        os.close(self._fd)
+        self._close_device()
+        self._aligned_view.release()
         self._aligned_buf.close()
+        self._codec.command_buf.close()
 
     def _get_tse_cmd_filepath(self):
         return os.path.join(self.tse_path, MscTransport.CMD_FILENAME)
 
+    def _open_device(self) -> int:
+        # O_DIRECT is required to bypass OS buffers. Keeping the file open between
+        # read and write seems to be required.
+        return os.open(self._get_tse_cmd_filepath(), os.O_RDWR | os.O_DIRECT)
+
+    def _close_device(self):
+        os.close(self._fd)
+
     def set_suspend(self, suspend: bool, timeout=DEFAULT_TIMEOUT):
         """Sets the suspend mode of the TSE."""
-        packet = (
-            MSC_TRANSPORT_ENABLE_SUSPEND_PACKET
-            if suspend
-            else MSC_TRANSPORT_DISABLE_SUSPEND_PACKET
-        )
-        self._write_block(packet.build({}))
+        block = self._codec.build_suspend(suspend)
+        if self.capture is not None:
+            self.capture.record(
+                RECORD_WRITE_BLOCK,
+                block[: _LENGTH_OFFSET + len(_SUSPEND_BODY[suspend])],
+            )
+        self._write_block(block)
 
         # Ensure that the operation was completed successfully by parsing the response.
-        data = self._read_until_ready(timeout=timeout)
-        MSC_TRANSPORT_SUSPEND_RESPONSE_PACKET.parse(data)
+        data = self._read_until_ready(
+            timeout=timeout, profile=self.default_polling_profile
+        )
+        MscFrameCodec.parse_suspend_response(data)
 
     def write(self, command_data: bytes):
         """Write a block of command data to the TSE.
 
         :param command_data: The command data to write
         """
-        data = MSC_TRANSPORT_COMMAND_PACKET.build({"command_data": command_data})
-        self._write_block(data)
-
-    def read(self, timeout=DEFAULT_TIMEOUT):
+        block = self._codec.build_command(command_data)
+        if self.capture is not None:
+            self.capture.record(
+                RECORD_WRITE_BLOCK, block[: _COMMAND_DATA_OFFSET + len(command_data)]
+            )
+        self._write_block(block)
+
+    def read(self, timeout=DEFAULT_TIMEOUT, command=None) -> bytes:
         """Read a response to a command from the TSE. Will wait until a reply is
          ready.
 
         :param timeout: The timeout for waiting for a reply.
+        :param command: The command that the response belongs to. Used to select
+            the :class:`PollingProfile` and to record the number of polls needed.
         :return: The response data.
         """
-        data = self._read_until_ready(timeout=timeout)
-        packet = MSC_TRANSPORT_RESPONSE_PACKET.parse(data)
-        # TODO(Leon Handreke): Implement multi-fragment response
-
-        if packet.random_token == TOKEN:
-            # TODO(Leon Handreke): Better exception
-            raise Exception
+        return bytes(self.read_view(timeout=timeout, command=command))
 
-        return packet.response_data
+    def read_view(self, timeout=DEFAULT_TIMEOUT, command=None) -> memoryview:
+        """Like :meth:`read`, but returns the response data as a
+        :class:`memoryview` into the read buffer instead of copying it. The view is
+        only valid until the next I/O on this transport and must be released
+        before :meth:`close` is called.
+        """
+        profile = self.polling_profiles.get(command, self.default_polling_profile)
+        data = self._read_until_ready(timeout=timeout, profile=profile)
+        return self._parse_response(data, command)
 
-    def _write_block(self, data: bytes):
-        self._aligned_buf.seek(0)
-        self._aligned_buf.write(data)
+    def read_steps(self, timeout=DEFAULT_TIMEOUT, command=None):
+        """Like :meth:`read`, but as a generator that leaves waiting between polls
+        to the caller. The generator yields the number of seconds to wait before
+        it is advanced again and returns the response data once it is ready.
 
+        Advancing the generator does blocking I/O, only the waits are left out.
+        """
+        profile = self.polling_profiles.get(command, self.default_polling_profile)
+        data = yield from self._poll_until_ready(timeout=timeout, profile=profile)
+        return bytes(self._parse_response(data, command))
+
+    def _parse_response(self, data, command) -> memoryview:
+        if command is not None:
+            self.poll_counts[command].append(self.last_poll_count)
+        try:
+            random_token, response_data = MscFrameCodec.parse_response(data)
+            # TODO(Leon Handreke): Implement multi-fragment response
+
+            if random_token == TOKEN:
+                raise ProtocolError("Response carries our own token")
+        except ProtocolError as e:
+            if self.capture is not None:
+                self.capture.on_error(e)
+            raise
+
+        return response_data
+
+    def _write_block(self, data):
         os.lseek(self._fd, 0, os.SEEK_SET)
-        logger.debug("Write: " + _format_hex_for_log(data))
-        os.writev(self._fd, [self._aligned_buf])
-
-    def _read_block(self) -> bytes:
-        self._aligned_buf.seek(0)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Write: " + _format_hex_for_log(data))
+        os.writev(self._fd, [data])
 
+    def _read_block(self, length: int = BLOCK_SIZE) -> memoryview:
+        """Read the first ``length`` bytes of the block from the TSE."""
         os.lseek(self._fd, 0, os.SEEK_SET)
-        os.readv(self._fd, [self._aligned_buf])
+        data = self._aligned_view[:length]
+        bytes_read = os.readv(self._fd, [data])
+        if length != BLOCK_SIZE and bytes_read != length:
+            raise OSError("Short read of {} bytes".format(bytes_read))
 
-        self._aligned_buf.seek(0)
-        data = self._aligned_buf.read(BLOCK_SIZE)
-        logger.debug("Read: " + _format_hex_for_log(data))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Read: " + _format_hex_for_log(data))
 
         return data
 
-    def _read_until_ready(self, timeout) -> bytes:
-        max_time = time.time() + timeout
-        # TODO(Leon Handreke): Timeout
-        while time.time() < max_time:
-            data = self._read_block()
+    def _probe_block(self) -> bytes:
+        """Read just enough of the block to tell whether the TSE is busy."""
+        if self.probe_size is None:
+            return self._read_block()
+        try:
+            return self._read_block(self.probe_size)
+        except OSError as e:
+            logger.warning(
+                "Partial reads of %d bytes failed (%s), reading full blocks instead",
+                self.probe_size,
+                e,
+            )
+            self.probe_size = None
+            return self._read_block()
+
+    def _read_until_ready(self, timeout, profile: PollingProfile) -> bytes:
+        polls = self._poll_until_ready(timeout, profile)
+        try:
+            while True:
+                time.sleep(next(polls))
+        except StopIteration as e:
+            return e.value
+
+    def _poll_until_ready(self, timeout, profile: PollingProfile):
+        """Poll the TSE until it is ready and return the block read. Yields the
+        number of seconds to sleep between polls, once the spin time is over."""
+        start = time.monotonic()
+        max_time = start + timeout
+        spin_until = start + profile.spin_time
+        interval = profile.initial_interval
+        self.last_poll_count = 0
+
+        while True:
+            data = self._probe_block()
+            self.last_poll_count += 1
             if data[32:34] != bytes([0xFF, 0xFF]):
+                self.last_ready_time = time.monotonic() - start
+                if len(data) < BLOCK_SIZE:
+                    data = self._read_block()
+                if self.capture is not None:
+                    self._capture_read_block(data)
                 return data
-            time.sleep(0.05)
 
-        raise TimeoutException
+            now = time.monotonic()
+            if now >= max_time:
+                if self.capture is not None:
+                    self.capture.record(RECORD_TIMEOUT, b"")
+                    self.capture.on_error(TimeoutException())
+                raise TimeoutException
+            if now < spin_until:
+                continue
+            yield min(interval, max_time - now)
+            interval = min(interval * profile.backoff, profile.max_interval)
+
+    def _capture_read_block(self, data):
+        length = int.from_bytes(data[_LENGTH_OFFSET:_RESPONSE_DATA_OFFSET], "big")
+        self.capture.record(RECORD_READ_BLOCK, data[: _RESPONSE_DATA_OFFSET + length])
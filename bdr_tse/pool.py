@@ -0,0 +1,360 @@
+"""Spreading the transactions of many clients over several TSEs.
+
+A TSE can only sign so many transactions per second. :class:`TsePool` manages
+several TSEs and assigns each client ID (ERS) to one of them, mapping the client
+to the key of that TSE with :func:`~bdr_tse.TseConnector.map_ers_to_key`. All
+transactions of a client are then sent to its TSE. New clients are assigned to
+the healthy TSE that is least loaded at the time::
+
+    pool = TsePool.open(["/mnt/tse0", "/mnt/tse1"], admin_pin=b"...")
+    started = pool.start_transaction("POS-1", b"", "")
+
+The commands of each TSE are sent by its own :class:`~bdr_tse.worker.DeviceWorker`,
+so that the TSEs work in parallel when the pool is used from several threads.
+
+TSEs that fail repeatedly are taken out of rotation, and their clients are
+assigned to other TSEs when they start their next transaction. Transactions that
+were still open on the failed TSE cannot be finished elsewhere, so other
+commands are still sent to the TSE the client is assigned to. Use
+:meth:`TsePool.check_health` to bring recovered TSEs back.
+"""
+
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Set
+import logging
+import threading
+
+from bdr_tse.exceptions import (
+    NoHealthyDeviceError,
+    ProtocolError,
+    TimeoutException,
+)
+from bdr_tse.transport import Transport
+from bdr_tse.transport_errors import (
+    TransportErrorSECommunicationFailed,
+    TransportErrorSecureElementDisabled,
+    TransportErrorStorageFailure,
+    TransportErrorTransport,
+    TransportErrorUserNotAuthenticated,
+)
+from bdr_tse.tse_connector import TseConnector
+from bdr_tse.worker import DeviceWorker
+
+logger = logging.getLogger(__name__)
+
+#: Errors that count as a failure of the device rather than of the command
+DEVICE_ERRORS = (
+    OSError,
+    TimeoutException,
+    ProtocolError,
+    TransportErrorSECommunicationFailed,
+    TransportErrorSecureElementDisabled,
+    TransportErrorStorageFailure,
+    TransportErrorTransport,
+)
+
+
+class PoolDevice:
+    """A TSE of a :class:`TsePool`."""
+
+    def __init__(self, index: int, connector: TseConnector):
+        self.index = index
+        self.connector = connector
+        #: Whether the device is in rotation
+        self.healthy = True
+        #: The number of consecutive device errors
+        self.failures = 0
+        #: The number of commands currently being sent to the device
+        self.load = 0
+        #: The client IDs assigned to the device
+        self.clients: Set[str] = set()
+
+    @property
+    def serial_number(self) -> bytes:
+        """The serial number of the signing key of the device, as cached by the
+        connector."""
+        return self.connector.get_serial_number()
+
+    def __repr__(self):
+        return "PoolDevice(index={}, healthy={}, load={}, clients={})".format(
+            self.index, self.healthy, self.load, len(self.clients)
+        )
+
+
+class TsePool:
+    """Assigns clients to one of several TSEs and sends their transactions to it.
+
+    The pool can be used from any number of threads, as long as the connectors
+    can, e.g. connectors of a :class:`~bdr_tse.worker.DeviceWorker`.
+    """
+
+    def __init__(
+        self,
+        connectors: Sequence[TseConnector],
+        admin_pin: Optional[bytes] = None,
+        max_failures: int = 3,
+        assignments: Optional[Mapping[str, int]] = None,
+        health_check_interval: Optional[float] = None,
+    ):
+        """
+        :param connectors: The connectors of the TSEs.
+        :param admin_pin: The PIN of the Admin user, used to authenticate when
+            mapping a client to a TSE requires it.
+        :param max_failures: The number of consecutive device errors after which
+            a TSE is taken out of rotation, see :data:`DEVICE_ERRORS`.
+        :param assignments: Client IDs and the index of the TSE they were
+            assigned to before, see :attr:`assignments`. Their mapping is not
+            repeated.
+        :param health_check_interval: If given, :meth:`check_health` is called
+            in a background thread at this interval in seconds.
+        """
+        if not connectors:
+            raise ValueError("A pool needs at least one TSE")
+        self.devices = [PoolDevice(i, c) for i, c in enumerate(connectors)]
+        self.admin_pin = admin_pin
+        self.max_failures = max_failures
+        self._assignments: Dict[str, PoolDevice] = {}
+        self._lock = threading.Lock()
+        # Locks held while a client is being mapped to a device
+        self._mapping_locks: Dict[str, threading.Lock] = {}
+        self._on_close: List[Callable[[], None]] = []
+        for client_id, index in (assignments or {}).items():
+            device = self.devices[index]
+            self._assignments[client_id] = device
+            device.clients.add(client_id)
+
+        if health_check_interval is not None:
+            stop = threading.Event()
+            thread = threading.Thread(
+                target=self._check_health_until,
+                args=(stop, health_check_interval),
+                name="bdr-tse-pool-health",
+                daemon=True,
+            )
+            thread.start()
+            self._on_close.append(stop.set)
+
+    @classmethod
+    def open(cls, tse_paths: Iterable, polling_profiles=None, **kwargs) -> "TsePool":
+        """Open the TSEs mounted at ``tse_paths``, each with its own
+        :class:`~bdr_tse.worker.DeviceWorker`. The workers are closed with the
+        pool.
+
+        :param polling_profiles: Passed to each
+            :class:`~bdr_tse.transport.Transport`.
+
+        The other keyword arguments are passed to :class:`TsePool`.
+        """
+        workers = [
+            DeviceWorker(Transport(path, polling_profiles=polling_profiles))
+            for path in tse_paths
+        ]
+        pool = cls([worker.connector() for worker in workers], **kwargs)
+        pool._on_close.extend(worker.close for worker in workers)
+        return pool
+
+    def close(self):
+        for close in self._on_close:
+            close()
+        self._on_close = []
+
+    @property
+    def assignments(self) -> Dict[str, int]:
+        """The client IDs and the index of the TSE they are assigned to, e.g. to
+        restore them with the ``assignments`` parameter after a restart."""
+        with self._lock:
+            return {
+                client_id: device.index
+                for client_id, device in self._assignments.items()
+            }
+
+    def device_for(self, client_id: str, reassign: bool = True) -> PoolDevice:
+        """The device that the client is assigned to. Clients without a device
+        are assigned to the least loaded healthy device first.
+
+        :param reassign: Whether to assign the client to another device if its
+            device is not healthy, e.g. when it starts a transaction.
+        :raises NoHealthyDeviceError: If the client needs a device and no device
+            is healthy.
+        """
+        with self._lock:
+            device = self._assignments.get(client_id)
+            if device is not None and (device.healthy or not reassign):
+                return device
+            mapping_lock = self._mapping_locks.setdefault(client_id, threading.Lock())
+
+        with mapping_lock:
+            with self._lock:
+                # Another thread may have assigned the client in the meantime
+                device = self._assignments.get(client_id)
+                if device is not None and (device.healthy or not reassign):
+                    return device
+                device = self._least_loaded()
+                device.load += 1
+            try:
+                self._map(device, client_id)
+            finally:
+                with self._lock:
+                    device.load -= 1
+
+            with self._lock:
+                previous = self._assignments.get(client_id)
+                if previous is not None:
+                    previous.clients.discard(client_id)
+                    logger.warning(
+                        "Moving client %s from unhealthy TSE %d to TSE %d",
+                        client_id,
+                        previous.index,
+                        device.index,
+                    )
+                self._assignments[client_id] = device
+                device.clients.add(client_id)
+                del self._mapping_locks[client_id]
+        return device
+
+    def _least_loaded(self) -> PoolDevice:
+        healthy = [device for device in self.devices if device.healthy]
+        if not healthy:
+            raise NoHealthyDeviceError("No TSE of the pool is healthy")
+        return min(healthy, key=lambda d: (d.load, len(d.clients), d.index))
+
+    def _map(self, device: PoolDevice, client_id: str):
+        def map_ers_to_key():
+            device.connector.map_ers_to_key(client_id, device.serial_number)
+
+        try:
+            self._send(device, map_ers_to_key)
+        except TransportErrorUserNotAuthenticated:
+            if self.admin_pin is None:
+                raise
+            self._send(device, self._map_as_admin, device, client_id)
+
+    def _map_as_admin(self, device: PoolDevice, client_id: str):
+        connector = device.connector
+        connector.authenticate_user(TseConnector.UserId.ADMIN, self.admin_pin)
+        try:
+            connector.map_ers_to_key(client_id, device.serial_number)
+        finally:
+            connector.logout(TseConnector.UserId.ADMIN)
+
+    def _send(self, device: PoolDevice, fn: Callable, *args, **kwargs):
+        """Call ``fn``, keeping track of the load and the health of ``device``."""
+        try:
+            result = fn(*args, **kwargs)
+        except DEVICE_ERRORS:
+            self._record_failure(device)
+            raise
+        with self._lock:
+            device.failures = 0
+        return result
+
+    def _record_failure(self, device: PoolDevice):
+        with self._lock:
+            device.failures += 1
+            if device.healthy and device.failures >= self.max_failures:
+                device.healthy = False
+                logger.warning("Taking TSE %d out of rotation", device.index)
+
+    def call(self, client_id: str, method: str, *args, **kwargs):
+        """Call a method of the connector of the TSE that ``client_id`` is
+        assigned to. The client keeps its TSE even if the TSE is not healthy,
+        so that its open transactions are not sent to another TSE."""
+        device = self.device_for(client_id, reassign=False)
+        return self._call(device, method, *args, **kwargs)
+
+    def _call(self, device: PoolDevice, method: str, *args, **kwargs):
+        with self._lock:
+            device.load += 1
+        try:
+            return self._send(
+                device, getattr(device.connector, method), *args, **kwargs
+            )
+        finally:
+            with self._lock:
+                device.load -= 1
+
+    def start_transaction(
+        self,
+        client_id: str,
+        process_data: bytes,
+        process_type: str,
+        additional_data: bytes = bytes(),
+    ):
+        """Like :func:`~bdr_tse.TseConnector.start_transaction`, on the TSE of the
+        client. Clients whose TSE is not healthy are assigned to another TSE
+        first. The ``serial_number`` of the result identifies the TSE."""
+        return self._call(
+            self.device_for(client_id),
+            "start_transaction",
+            client_id,
+            process_data,
+            process_type,
+            additional_data,
+        )
+
+    def update_transaction(
+        self,
+        transaction_number: int,
+        client_id: str,
+        process_data: bytes,
+        process_type: str,
+    ):
+        """Like :func:`~bdr_tse.TseConnector.update_transaction`, on the TSE of the
+        client."""
+        return self.call(
+            client_id,
+            "update_transaction",
+            transaction_number,
+            client_id,
+            process_data,
+            process_type,
+        )
+
+    def finish_transaction(
+        self,
+        transaction_number: int,
+        client_id: str,
+        process_data: bytes,
+        process_type: str,
+        additional_data: bytes,
+    ):
+        """Like :func:`~bdr_tse.TseConnector.finish_transaction`, on the TSE of the
+        client."""
+        return self.call(
+            client_id,
+            "finish_transaction",
+            transaction_number,
+            client_id,
+            process_data,
+            process_type,
+            additional_data,
+        )
+
+    def _check_health_until(self, stop: threading.Event, interval: float):
+        while not stop.wait(interval):
+            try:
+                self.check_health()
+            except Exception:
+                logger.exception("Health check failed")
+
+    def check_health(self) -> List[bool]:
+        """Send a command to every TSE, putting those that answer back into
+        rotation and taking those that fail out of it.
+
+        :return: Whether each TSE is healthy now.
+        """
+        for device in self.devices:
+            try:
+                # Not cached by the connector, unlike the serial number
+                device.connector.get_pin_status()
+            except DEVICE_ERRORS as e:
+                logger.warning("Health check of TSE %d failed: %r", device.index, e)
+                with self._lock:
+                    device.failures = max(device.failures + 1, self.max_failures)
+                    device.healthy = False
+            else:
+                with self._lock:
+                    if not device.healthy:
+                        logger.info("Putting TSE %d back into rotation", device.index)
+                    device.failures = 0
+                    device.healthy = True
+        return [device.healthy for device in self.devices]
@@ -0,0 +1,147 @@
+from unittest import IsolatedAsyncioTestCase
+import asyncio
+import os
+import tempfile
+
+from bdr_tse import msc_transport, tse_connector
+from bdr_tse.aio import AsyncTseConnector
+from bdr_tse.backends import MemoryBackend
+from bdr_tse.capture import RECORD_WRITE_BLOCK, CaptureRing
+from bdr_tse.emulator import EmulatorTransport, TseEmulator
+from bdr_tse.metrics import TransportMetrics
+from bdr_tse.transport import TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ, TransportCommand
+from bdr_tse.transport_errors import (
+    TransportErrorNoTransaction,
+    TransportErrorSECommunicationFailed,
+)
+
+
+class TestAsyncTseConnector(IsolatedAsyncioTestCase):
+    def make_connector(self, backend_class=EmulatorTransport, **kwargs):
+        self.emulator = TseEmulator(**kwargs)
+        if backend_class is EmulatorTransport:
+            self.capture = CaptureRing()
+            backend = EmulatorTransport(
+                self.emulator,
+                capture=self.capture,
+                default_polling_profile=msc_transport.PollingProfile(
+                    spin_time=0.0, initial_interval=0.001, max_interval=0.005
+                ),
+            )
+        else:
+            backend = backend_class(self.emulator)
+        self.metrics = TransportMetrics()
+        tse = AsyncTseConnector(backend=backend, metrics=self.metrics)
+        self.addAsyncCleanup(tse.aclose)
+        return tse
+
+    async def test_transaction(self):
+        tse = self.make_connector()
+        started = await tse.start_transaction("POS-1", b"", "")
+        finished = await tse.finish_transaction(
+            started["transaction_number"], "POS-1", b"", "", b""
+        )
+        self.assertEqual(
+            finished["signature_counter"], started["signature_counter"] + 1
+        )
+        self.assertEqual(
+            self.metrics.snapshot()["FinishTransaction"]["total"]["count"], 1
+        )
+
+        with self.assertRaises(TransportErrorNoTransaction):
+            await tse.finish_transaction(1000, "POS-1", b"", "", b"")
+
+    async def test_polling_does_not_block(self):
+        tse = self.make_connector(latency={TransportCommand.StartTransaction: 0.05})
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.001)
+
+        ticker = asyncio.create_task(tick())
+        await tse.start_transaction("POS-1", b"", "")
+        ticker.cancel()
+        self.assertGreater(ticks, 10)
+
+    async def test_concurrent_commands(self):
+        tse = self.make_connector(backend_class=MemoryBackend, default_latency=0.001)
+        results = await asyncio.gather(
+            *(tse.start_transaction("POS-1", b"", "") for _ in range(5))
+        )
+        self.assertEqual(
+            sorted(r["transaction_number"] for r in results), [1, 2, 3, 4, 5]
+        )
+
+    async def test_export(self):
+        tse = self.make_connector(fragment_length=100)
+        await tse.start_transaction("POS-1", b"", "")
+        data = await tse.export_data()
+
+        fragments = [fragment async for fragment in tse.export_data_iter()]
+        self.assertGreater(len(fragments), 1)
+        self.assertEqual(b"".join(fragments), data)
+
+    async def test_export_to_file(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        path = os.path.join(tempdir.name, "export.tar")
+        tse = self.make_connector(fragment_length=100)
+        await tse.start_transaction("POS-1", b"", "")
+        result = await tse.export_to_file(path)
+        with open(path, "rb") as f:
+            self.assertEqual(len(f.read()), result["size"])
+
+        # A failed export keeps the previous file
+        self.emulator.inject_fault(
+            TransportCommand.ExportData, TransportErrorSECommunicationFailed
+        )
+        with self.assertRaises(TransportErrorSECommunicationFailed):
+            await tse.export_to_file(path)
+        self.assertEqual(os.path.getsize(path), result["size"])
+        self.assertEqual(os.listdir(tempdir.name), ["export.tar"])
+
+    async def test_cancel_aborts_fragmented_read(self):
+        tse = self.make_connector(
+            fragment_length=1000,
+            default_latency=0.5,
+            latency={
+                TransportCommand.StartTransaction: 0.0,
+                TransportCommand.ExportData: 0.0,
+            },
+        )
+        await tse.start_transaction("POS-1", b"", "")
+        first_fragment = asyncio.Event()
+
+        async def export():
+            async for _ in tse.export_data_iter():
+                first_fragment.set()
+
+        task = asyncio.create_task(export())
+        await first_fragment.wait()
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+        # The connector is usable again once the read was aborted
+        started = await tse.start_transaction("POS-1", b"", "")
+        self.assertEqual(started["transaction_number"], 2)
+        writes = [
+            r.data[msc_transport._COMMAND_DATA_OFFSET :]
+            for r in self.capture.records()
+            if r.record_type == RECORD_WRITE_BLOCK
+        ]
+        self.assertEqual(writes[-2], TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ)
+        snapshot = self.metrics.snapshot()["ExportData"]
+        self.assertEqual(snapshot["fragments"]["sum"], 1)
+
+    def test_same_commands(self):
+        for name, method in vars(tse_connector.TseConnector).items():
+            if hasattr(method, "__wrapped__"):
+                self.assertTrue(
+                    asyncio.iscoroutinefunction(getattr(AsyncTseConnector, name)),
+                    name,
+                )
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+
+from bdr_tse import tse_connector
+from bdr_tse.backends import (
+    RECORD_READ,
+    RECORD_WRITE,
+    CaptureRecord,
+    MemoryBackend,
+    RecordingBackend,
+    ReplayBackend,
+    write_capture_header,
+    write_capture_record,
+)
+from bdr_tse.emulator import TseEmulator
+from bdr_tse.exceptions import ProtocolError, TimeoutException
+from bdr_tse.transport import TransportCommand
+
+
+class TestMemoryBackend(TestCase):
+    def test_round_trip(self):
+        backend = MemoryBackend()
+        tse = tse_connector.TseConnector(backend=backend)
+
+        started = tse.start_transaction("POS-1", b"", "")
+        finished = tse.finish_transaction(
+            started["transaction_number"], "POS-1", b"", "", b""
+        )
+        self.assertEqual(finished["signature_counter"], 2)
+        self.assertEqual(
+            list(backend.poll_counts[TransportCommand.StartTransaction]), [1]
+        )
+
+    def test_unanswered_command_times_out(self):
+        emulator = TseEmulator()
+        emulator.inject_fault(TransportCommand.Start)
+        tse = tse_connector.TseConnector(backend=MemoryBackend(emulator))
+
+        with self.assertRaises(TimeoutException):
+            tse.start()
+
+
+class TestRecordReplay(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.path = os.path.join(self.tempdir.name, "session.cap")
+
+    def record_session(self):
+        backend = RecordingBackend(MemoryBackend(), self.path)
+        tse = tse_connector.TseConnector(backend=backend)
+        started = tse.start_transaction("POS-1", b"", "")
+        finished = tse.finish_transaction(
+            started["transaction_number"], "POS-1", b"", "", b""
+        )
+        backend.close()
+        return started, finished
+
+    def test_replay(self):
+        started, finished = self.record_session()
+
+        backend = ReplayBackend(self.path, speed=None)
+        self.addCleanup(backend.close)
+        tse = tse_connector.TseConnector(backend=backend)
+        self.assertEqual(tse.start_transaction("POS-1", b"", ""), started)
+        self.assertEqual(tse.finish_transaction(1, "POS-1", b"", "", b""), finished)
+        with self.assertRaises(ProtocolError):
+            tse.start()
+
+    def test_replay_detects_divergence(self):
+        self.record_session()
+
+        backend = ReplayBackend(self.path, speed=None)
+        self.addCleanup(backend.close)
+        tse = tse_connector.TseConnector(backend=backend)
+        with self.assertRaises(ProtocolError):
+            tse.start_transaction("POS-2", b"", "")
+
+    def test_replay_timing(self):
+        with open(self.path, "wb") as f:
+            write_capture_header(f)
+            write_capture_record(f, CaptureRecord(0.0, RECORD_WRITE, b"\x01"))
+            write_capture_record(f, CaptureRecord(0.2, RECORD_READ, b"\x02"))
+
+        backend = ReplayBackend(self.path, speed=10.0)
+        self.addCleanup(backend.close)
+        start = time.monotonic()
+        backend.write(b"\x01")
+        self.assertEqual(backend.read(), b"\x02")
+        self.assertGreaterEqual(time.monotonic() - start, 0.02)
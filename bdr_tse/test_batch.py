@@ -0,0 +1,72 @@
+from unittest import TestCase
+import io
+import json
+
+from bdr_tse.batch import run_batch
+from bdr_tse.emulator import EmulatorTransport, TseEmulator
+from bdr_tse.tse_connector import TseConnector
+
+
+class TestBatch(TestCase):
+    def setUp(self):
+        self.emulator = TseEmulator()
+        self.tse = TseConnector(backend=EmulatorTransport(self.emulator))
+
+    def run_batch(self, commands, **kwargs):
+        output = io.StringIO()
+        lines = [json.dumps(command) + "\n" for command in commands]
+        errors = run_batch(self.tse, lines, output, **kwargs)
+        return errors, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_commands(self):
+        errors, results = self.run_batch(
+            [
+                {"id": 1, "method": "start_transaction", "params": ["POS-1", "", ""]},
+                {
+                    "id": 2,
+                    "method": "finish_transaction",
+                    "params": {
+                        "transaction_number": 1,
+                        "client_id": "POS-1",
+                        "process_data": "6461746131",
+                        "process_type": "type",
+                        "additional_data": "",
+                    },
+                },
+                {"method": "get_serial_number"},
+                {
+                    "method": "authenticate_user",
+                    "params": [
+                        TseConnector.UserId.ADMIN.value,
+                        TseEmulator.DEFAULT_ADMIN_PIN.hex(),
+                    ],
+                },
+            ]
+        )
+        self.assertEqual(errors, 0)
+        self.assertEqual([r["id"] for r in results], [1, 2, None, None])
+        self.assertEqual(results[0]["result"]["transaction_number"], 1)
+        self.assertEqual(results[1]["result"]["signature_counter"], 2)
+        self.assertEqual(results[2]["result"], self.emulator.serial_number.hex())
+        self.assertEqual(
+            results[3]["result"]["authentication_result"],
+            TseConnector.AuthenticationResult.SUCCESS.value,
+        )
+
+    def test_errors(self):
+        commands = [
+            {"id": 1, "method": "finish_transaction", "params": [1, "", "", "", ""]},
+            {"id": 2, "method": "start_transaction", "params": ["POS-1", "zz", ""]},
+            {"id": 3, "method": "close"},
+            {"id": 4, "method": "get_serial_number"},
+        ]
+        errors, results = self.run_batch(commands)
+        self.assertEqual(errors, 3)
+        self.assertEqual(
+            [r.get("error", {}).get("type") for r in results],
+            ["TransportErrorNoTransaction", "Error", "ValueError", None],
+        )
+
+        errors, results = self.run_batch(commands, stop_on_error=True)
+        self.assertEqual(errors, 1)
+        self.assertEqual(len(results), 1)
@@ -0,0 +1,89 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from bdr_tse import msc_transport, tse_connector
+from bdr_tse.backends import ReplayBackend
+from bdr_tse.capture import (
+    RECORD_READ_BLOCK,
+    RECORD_TIMEOUT,
+    RECORD_WRITE_BLOCK,
+    CaptureRing,
+    iter_capture,
+)
+from bdr_tse.emulator import EmulatorTransport, TseEmulator
+from bdr_tse.exceptions import TimeoutException
+from bdr_tse.transport import TransportCommand, encode_transport_command
+
+
+class TestCaptureRing(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.path = os.path.join(self.tempdir.name, "capture.cap")
+
+    def make_transport(self, capture, **kwargs) -> EmulatorTransport:
+        self.emulator = TseEmulator(**kwargs)
+        transport = EmulatorTransport(
+            self.emulator,
+            capture=capture,
+            default_polling_profile=msc_transport.PollingProfile(
+                spin_time=0.0, initial_interval=0.001, max_interval=0.005
+            ),
+        )
+        self.addCleanup(transport.close)
+        return transport
+
+    def test_records_blocks(self):
+        capture = CaptureRing()
+        tse = tse_connector.TseConnector(backend=self.make_transport(capture))
+        tse.get_serial_number()
+
+        records = capture.records()
+        # Disabling suspend mode, then the command
+        self.assertEqual(
+            [r.record_type for r in records],
+            [RECORD_WRITE_BLOCK, RECORD_READ_BLOCK] * 2,
+        )
+        self.assertEqual(len(records[2].data), 36 + 6)
+        self.assertEqual(records[0].timestamp, 0.0)
+
+    def test_capacity(self):
+        capture = CaptureRing(capacity=3)
+        tse = tse_connector.TseConnector(backend=self.make_transport(capture))
+        for _ in range(3):
+            tse.get_serial_number()
+        self.assertEqual(len(capture), 3)
+
+    def test_replay(self):
+        capture = CaptureRing()
+        tse = tse_connector.TseConnector(
+            backend=self.make_transport(capture, fragment_length=100)
+        )
+        started = tse.start_transaction("POS-1", b"", "")
+        exported = tse.export_data()
+        capture.dump(self.path)
+
+        backend = ReplayBackend(self.path, speed=None)
+        self.addCleanup(backend.close)
+        tse = tse_connector.TseConnector(backend=backend)
+        self.assertEqual(tse.start_transaction("POS-1", b"", ""), started)
+        self.assertEqual(tse.export_data(), exported)
+
+    def test_dump_on_error(self):
+        capture = CaptureRing(
+            dump_path=os.path.join(self.tempdir.name, "error-{timestamp}.cap")
+        )
+        transport = self.make_transport(capture)
+
+        # The emulator does not answer, so that the read times out
+        self.emulator.inject_fault(TransportCommand.GetSerialNumbers)
+        transport.write(encode_transport_command(TransportCommand.GetSerialNumbers, []))
+        with self.assertLogs("bdr_tse.capture", "WARNING"):
+            with self.assertRaises(TimeoutException):
+                transport.read(timeout=0.01)
+
+        (filename,) = os.listdir(self.tempdir.name)
+        with open(os.path.join(self.tempdir.name, filename), "rb") as f:
+            records = list(iter_capture(f))
+        self.assertEqual(records[-1].record_type, RECORD_TIMEOUT)
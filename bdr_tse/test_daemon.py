@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+import os
+import stat
+import tempfile
+import threading
+
+from bdr_tse.daemon import COMMANDS, TseClient, TseServer
+from bdr_tse.emulator import EmulatorTransport, TseEmulator
+from bdr_tse.exceptions import RemoteError
+from bdr_tse.transport import Transport
+from bdr_tse.transport_errors import TransportErrorNoTransaction
+from bdr_tse.tse_connector import TseConnector
+from bdr_tse.worker import DeviceWorker
+
+
+class TestDaemon(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.path = os.path.join(tempdir.name, "bdr-tse.sock")
+
+        self.emulator = TseEmulator()
+        worker = DeviceWorker(Transport(backend=EmulatorTransport(self.emulator)))
+        self.addCleanup(worker.close)
+        server = TseServer(self.path, worker)
+        self.addCleanup(server.server_close)
+        thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+
+    def connect(self) -> TseClient:
+        client = TseClient(self.path, timeout=10)
+        self.addCleanup(client.close)
+        return client
+
+    def test_transaction(self):
+        tse = self.connect()
+        started = tse.start_transaction("POS-1", b"data", "type")
+        self.assertIsInstance(started["signature_value"], bytes)
+        finished = tse.finish_transaction(
+            transaction_number=started["transaction_number"],
+            client_id="POS-1",
+            process_data=b"data",
+            process_type="type",
+            additional_data=b"",
+        )
+        self.assertEqual(
+            finished["signature_counter"], started["signature_counter"] + 1
+        )
+
+    def test_enums(self):
+        tse = self.connect()
+        result = tse.authenticate_user(
+            TseConnector.UserId.TIME_ADMIN, TseEmulator.DEFAULT_TIME_ADMIN_PIN
+        )
+        self.assertEqual(
+            result["authentication_result"], TseConnector.AuthenticationResult.SUCCESS
+        )
+
+    def test_errors(self):
+        tse = self.connect()
+        with self.assertRaises(TransportErrorNoTransaction):
+            tse.finish_transaction(1000, "POS-1", b"", "", b"")
+        with self.assertRaises(RemoteError):
+            tse.call("start_transaction", "POS-1")
+        with self.assertRaises(RemoteError):
+            tse.call("_transport")
+        with self.assertRaises(AttributeError):
+            tse.close_device
+
+        # The connection is still usable
+        self.assertEqual(len(tse.get_serial_number()), 32)
+
+    def test_concurrent_clients(self):
+        def run(client_id):
+            tse = self.connect()
+            return [
+                tse.start_transaction(client_id, b"", "")["transaction_number"]
+                for _ in range(5)
+            ]
+
+        with ThreadPoolExecutor(4) as executor:
+            numbers = sum(executor.map(run, ["POS-{}".format(i) for i in range(4)]), [])
+        self.assertEqual(sorted(numbers), list(range(1, 21)))
+
+    def test_access(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        tse = self.connect()
+        with self.assertRaisesRegex(RemoteError, "PermissionError"):
+            tse.factory_reset()
+
+        with self.assertRaises(ValueError):
+            TseServer(self.path + "2", None, commands=COMMANDS | {"close"})
@@ -0,0 +1,133 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+import json
+import os
+import tempfile
+
+from bdr_tse.aio import AsyncTseConnector
+from bdr_tse.device_info import DeviceInfoCache
+from bdr_tse.emulator import ECDSA_PLAIN_SHA384_OID, EmulatorTransport, TseEmulator
+from bdr_tse.transport import GetConfigDataID, TransportCommand, TransportDataType
+from bdr_tse.transport_errors import TransportErrorParameterMismatch
+from bdr_tse.tse_connector import TseConnector
+
+
+class TestDeviceInfo(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.path = os.path.join(tempdir.name, "tse-info.json")
+        self.emulator = TseEmulator()
+
+    def connect(self, path=None) -> TseConnector:
+        return TseConnector(
+            backend=EmulatorTransport(self.emulator),
+            device_info=DeviceInfoCache(path),
+        )
+
+    def count(self, command) -> int:
+        return self.emulator.command_counts.get(command, 0)
+
+    def test_config_data(self):
+        tse = self.connect()
+        self.assertEqual(tse.get_signature_algorithm(), ECDSA_PLAIN_SHA384_OID)
+        self.assertEqual(tse.get_max_keys(), 1)
+        self.assertEqual(tse.get_max_clients(), 100)
+        self.assertEqual(tse.get_max_transactions(), 512)
+        self.assertEqual(tse.get_certification_id(), "BSI-K-TR-0000-0000")
+        self.assertEqual(tse.get_time_sync_interval(), 1800)
+        self.assertEqual(tse.get_config_data(GetConfigDataID.Version), "Emulator")
+
+        emulator = TseEmulator(
+            config_data={
+                GetConfigDataID.SignatureAlgorithm: (
+                    TransportDataType.STRING,
+                    "1.2.3",
+                )
+            }
+        )
+        del emulator.config_data[GetConfigDataID.MaxKeys]
+        tse = TseConnector(backend=EmulatorTransport(emulator))
+        self.assertEqual(tse.get_signature_algorithm(), "1.2.3")
+        with self.assertRaises(TransportErrorParameterMismatch):
+            tse.get_max_keys()
+
+    def test_memory_cache(self):
+        tse = self.connect()
+        for _ in range(3):
+            self.assertEqual(tse.get_serial_number(), self.emulator.serial_number)
+            self.assertEqual(tse.get_max_clients(), 100)
+        self.assertEqual(self.count(TransportCommand.GetSerialNumbers), 1)
+        self.assertEqual(self.count(TransportCommand.GetConfigData), 1)
+
+    def test_disk_cache(self):
+        tse = self.connect(self.path)
+        # Not persisted before the TSE is known
+        tse.get_serial_number()
+        self.assertFalse(os.path.exists(self.path))
+        tse.start()
+        tse.get_max_clients()
+        with open(self.path) as f:
+            self.assertEqual(list(json.load(f)), [self.emulator.serial_number.hex()])
+
+        tse = self.connect(self.path)
+        tse.start()
+        self.assertEqual(tse.get_serial_number(), self.emulator.serial_number)
+        self.assertEqual(tse.get_max_clients(), 100)
+        self.assertEqual(self.count(TransportCommand.GetSerialNumbers), 1)
+        self.assertEqual(self.count(TransportCommand.GetConfigData), 1)
+
+        # Another TSE does not share the information
+        other = TseEmulator(serial_number=bytes(32))
+        tse = TseConnector(
+            backend=EmulatorTransport(other), device_info=DeviceInfoCache(self.path)
+        )
+        tse.start()
+        self.assertEqual(tse.get_serial_number(), bytes(32))
+        with open(self.path) as f:
+            self.assertEqual(len(json.load(f)), 2)
+
+    def test_invalidation(self):
+        tse = self.connect(self.path)
+        tse.start()
+        tse.get_serial_number()
+        tse.authenticate_user(TseConnector.UserId.ADMIN, TseEmulator.DEFAULT_ADMIN_PIN)
+        tse.initialize()
+        tse.get_serial_number()
+        self.assertEqual(self.count(TransportCommand.GetSerialNumbers), 2)
+
+        tse.factory_reset()
+        self.emulator.serial_number = bytes(32)
+        self.assertEqual(tse.get_serial_number(), bytes(32))
+
+        tse.get_max_clients()
+        tse.device_info.invalidate()
+        tse.get_max_clients()
+        self.assertEqual(self.count(TransportCommand.GetConfigData), 2)
+
+    def test_version_change(self):
+        cache = DeviceInfoCache(self.path)
+        cache.bind(b"serial", "1.0")
+        cache.set("serial_number", b"key")
+
+        cache = DeviceInfoCache(self.path)
+        cache.bind(b"serial", "1.0")
+        self.assertEqual(cache.get("serial_number"), b"key")
+
+        # A new version, e.g. after a firmware update, drops the information
+        cache = DeviceInfoCache(self.path)
+        cache.bind(b"serial", "1.1")
+        self.assertIsNone(cache.get("serial_number"))
+        cache = DeviceInfoCache(self.path)
+        cache.bind(b"serial", "1.1")
+        self.assertIsNone(cache.get("serial_number"))
+
+
+class TestAsyncDeviceInfo(IsolatedAsyncioTestCase):
+    async def test_cache(self):
+        emulator = TseEmulator()
+        tse = AsyncTseConnector(backend=EmulatorTransport(emulator))
+        self.addAsyncCleanup(tse.aclose)
+        self.assertEqual(await tse.get_max_clients(), 100)
+        self.assertEqual(await tse.get_serial_number(), emulator.serial_number)
+        self.assertEqual(await tse.get_serial_number(), emulator.serial_number)
+        self.assertEqual(emulator.command_counts[TransportCommand.GetSerialNumbers], 1)
@@ -0,0 +1,148 @@
+from unittest import TestCase
+
+from bdr_tse import msc_transport, tse_connector
+from bdr_tse.emulator import EmulatorTransport, TseEmulator
+from bdr_tse.exceptions import TimeoutException
+from bdr_tse.log_messages import iter_log_messages
+from bdr_tse.transport import TransportCommand
+from bdr_tse.transport_errors import (
+    TransportErrorNoDataAvailable,
+    TransportErrorNoTransaction,
+    TransportErrorStorageFailure,
+    TransportErrorUserNotAuthenticated,
+)
+
+AuthenticationResult = tse_connector.TseConnector.AuthenticationResult
+UserId = tse_connector.TseConnector.UserId
+
+
+class EmulatorTestCase(TestCase):
+    def make_connector(self, **kwargs) -> tse_connector.TseConnector:
+        self.emulator = TseEmulator(**kwargs)
+        self.transport = EmulatorTransport(
+            self.emulator,
+            default_polling_profile=msc_transport.PollingProfile(
+                spin_time=0.0, initial_interval=0.001, max_interval=0.005
+            ),
+        )
+        self.addCleanup(self.transport.close)
+        return tse_connector.TseConnector(backend=self.transport)
+
+    def run_transactions(self, tse, count, client_id="POS-1"):
+        for _ in range(count):
+            started = tse.start_transaction(client_id, b"", "")
+            tse.finish_transaction(
+                started["transaction_number"],
+                client_id,
+                b"Beleg^10.00_0.00_0.00_0.00_0.00^10.00:Bar",
+                "Kassenbeleg-V1",
+                b"",
+            )
+
+
+class TestTseEmulator(EmulatorTestCase):
+    def test_transactions(self):
+        tse = self.make_connector()
+        self.assertEqual(tse.start()["serial"], self.emulator.serial_number)
+        self.assertEqual(tse.get_serial_number(), self.emulator.serial_number)
+
+        first = tse.start_transaction("POS-1", b"", "")
+        second = tse.start_transaction("POS-2", b"", "")
+        finished = tse.finish_transaction(
+            first["transaction_number"], "POS-1", b"data", "Kassenbeleg-V1", b""
+        )
+        self.assertEqual(
+            (first["transaction_number"], second["transaction_number"]), (1, 2)
+        )
+        self.assertEqual(
+            [
+                first["signature_counter"],
+                second["signature_counter"],
+                finished["signature_counter"],
+            ],
+            [1, 2, 3],
+        )
+        with self.assertRaises(TransportErrorNoTransaction):
+            tse.finish_transaction(1, "POS-1", b"", "", b"")
+
+    def test_authentication(self):
+        tse = self.make_connector(time_set=False)
+        with self.assertRaises(TransportErrorUserNotAuthenticated):
+            tse.update_time(1600000000)
+
+        result = tse.authenticate_user(UserId.TIME_ADMIN, b"wrong")
+        self.assertEqual(result["authentication_result"], AuthenticationResult.FAILED)
+        self.assertEqual(result["remaining_retries"], 2)
+        result = tse.authenticate_user(
+            UserId.TIME_ADMIN, TseEmulator.DEFAULT_TIME_ADMIN_PIN
+        )
+        self.assertEqual(result["authentication_result"], AuthenticationResult.SUCCESS)
+
+        tse.update_time(1600000000)
+        self.assertAlmostEqual(self.emulator.now(), 1600000000, delta=1)
+
+    def test_fragmented_export(self):
+        tse = self.make_connector(fragment_length=100)
+        self.run_transactions(tse, 3)
+
+        fragments = list(tse.export_data_iter())
+        self.assertGreater(len(fragments), 10)
+        self.assertEqual(b"".join(fragments), tse.export_data())
+        messages = list(iter_log_messages(fragments))
+        self.assertEqual([m.signature_counter for m in messages], list(range(1, 7)))
+        self.assertEqual(
+            [m.operation_type for m in messages[:2]],
+            ["StartTransaction", "FinishTransaction"],
+        )
+
+    def test_aborted_export(self):
+        tse = self.make_connector(fragment_length=100)
+        self.run_transactions(tse, 3)
+
+        fragments = tse.export_data_iter()
+        next(fragments)
+        fragments.close()
+        # The emulator accepts new commands after the abort
+        self.assertEqual(tse.get_serial_number(), self.emulator.serial_number)
+
+    def test_export_filters(self):
+        tse = self.make_connector()
+        self.run_transactions(tse, 2, client_id="POS-1")
+        self.run_transactions(tse, 1, client_id="POS-2")
+
+        messages = list(iter_log_messages(tse.export_data(client_id="POS-2")))
+        self.assertEqual([m.transaction_number for m in messages], [3, 3])
+        messages = list(iter_log_messages(tse.export_data(transaction_number=2)))
+        self.assertEqual([m.signature_counter for m in messages], [3, 4])
+
+    def test_export_data_paged(self):
+        tse = self.make_connector()
+        self.run_transactions(tse, 5)
+
+        pages = list(tse.export_data_paged(page_size=4))
+        self.assertEqual([len(list(iter_log_messages(p))) for p in pages], [4, 4, 2])
+        with self.assertRaises(TransportErrorNoDataAvailable):
+            tse.export_more_data(self.emulator.serial_number, 10)
+
+    def test_fault_injection(self):
+        tse = self.make_connector()
+        self.emulator.inject_fault(
+            TransportCommand.StartTransaction, TransportErrorStorageFailure
+        )
+        with self.assertRaises(TransportErrorStorageFailure):
+            tse.start_transaction("POS-1", b"", "")
+        self.assertEqual(
+            tse.start_transaction("POS-1", b"", "")["signature_counter"], 1
+        )
+
+        self.emulator.inject_fault(TransportCommand.GetSerialNumbers)
+        with self.assertRaises(TimeoutException):
+            self.transport.write(bytes([0x5C, 0x54, 0x00, 0x08, 0x00, 0x00]))
+            self.transport.read(timeout=0.02)
+
+    def test_latency(self):
+        tse = self.make_connector(latency={TransportCommand.StartTransaction: 0.02})
+        tse.start_transaction("POS-1", b"", "")
+        self.assertGreater(
+            self.transport.poll_counts[TransportCommand.StartTransaction][-1], 1
+        )
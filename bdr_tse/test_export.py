@@ -0,0 +1,126 @@
+import io
+import os
+import tarfile
+import tempfile
+from unittest import TestCase, mock
+
+from bdr_tse import msc_transport, tse_connector
+from bdr_tse.export import ExportCheckpoint, ExportFile, parse_log_filename
+from bdr_tse.test_transport import ScriptedMscTransport, export_response
+from bdr_tse.transport import TRANSPORT_RESULT, TransportDataType
+from bdr_tse.transport_errors import TransportErrorNoDataAvailable
+
+
+def make_tar(files) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name, data in files:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+class TestParseLogFilename(TestCase):
+    def test_transaction_log(self):
+        log_filename = parse_log_filename(
+            "Unixt_1564038420_Sig-63_Log-Tra_No-3_Finish_Client-POS_1_Fc-2.log"
+        )
+        self.assertEqual(log_filename.signature_counter, 63)
+        self.assertEqual(log_filename.log_type, "Tra")
+        self.assertEqual(log_filename.transaction_number, 3)
+        self.assertEqual(log_filename.operation, "Finish")
+        self.assertEqual(log_filename.client_id, "POS_1")
+
+    def test_system_log(self):
+        log_filename = parse_log_filename(
+            "Gent_20190725T120000Z_Sig-5_Log-Sys_UpdateTime.log"
+        )
+        self.assertEqual(log_filename.signature_counter, 5)
+        self.assertEqual(log_filename.log_type, "Sys")
+        self.assertIsNone(log_filename.transaction_number)
+
+    def test_other_files(self):
+        self.assertIsNone(parse_log_filename("info.csv"))
+        self.assertIsNone(parse_log_filename("0123abcd_X509.cer"))
+
+
+class TestExportDataPaged(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.checkpoint_path = os.path.join(self.tempdir.name, "checkpoint.json")
+
+    def make_connector(self, pages) -> tse_connector.TseConnector:
+        serial_numbers = TRANSPORT_RESULT.build(
+            [{"data_type": bytes([TransportDataType.BYTE_ARRAY]), "data": bytes(38)}]
+        )
+        responses = [len(serial_numbers).to_bytes(2, "big") + serial_numbers]
+        for page in pages:
+            if isinstance(page, Exception):
+                responses.append(page)
+            else:
+                responses.append(export_response(len(page), page))
+        self.msc = ScriptedMscTransport(responses)
+        with mock.patch.object(msc_transport, "MscTransport", return_value=self.msc):
+            return tse_connector.TseConnector("/nonexistent")
+
+    def test_resume_from_checkpoint(self):
+        first_page = make_tar(
+            [
+                ("Unixt_1_Sig-1_Log-Sys_Initialize.log", b""),
+                ("Unixt_2_Sig-2_Log-Tra_No-1_Start_Client-A.log", b""),
+            ]
+        )
+        second_page = make_tar(
+            [("Unixt_3_Sig-3_Log-Tra_No-1_Finish_Client-A.log", b"")]
+        )
+        tse = self.make_connector([first_page, second_page])
+
+        checkpoint = ExportCheckpoint.load(self.checkpoint_path)
+        pages = tse.export_data_paged(checkpoint, page_size=2)
+        self.assertEqual(next(pages), first_page)
+        # The checkpoint only advances once the page has been processed
+        self.assertFalse(os.path.exists(self.checkpoint_path))
+        self.assertEqual(list(pages), [second_page])
+
+        checkpoint = ExportCheckpoint.load(self.checkpoint_path)
+        self.assertEqual(checkpoint.last_signature_counter, 3)
+        self.assertEqual(checkpoint.last_transaction_number, 1)
+        self.assertEqual(self.msc.written[-1][-15:-7], (2).to_bytes(8, "big"))
+
+    def test_no_data_available(self):
+        tse = self.make_connector([TransportErrorNoDataAvailable()])
+
+        self.assertEqual(list(tse.export_data_paged(page_size=2)), [])
+
+
+class TestExportFile(TestCase):
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.dir = tempdir.name
+        self.path = os.path.join(self.dir, "export.tar")
+
+    def test_commit(self):
+        export = ExportFile(self.path)
+        export.open()
+        export.preallocate(10)
+        export.write(b"ab")
+        export.write(b"cd")
+        self.assertFalse(os.path.exists(self.path))
+        export.commit()
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"abcd")
+        self.assertEqual(export.result()["size"], 4)
+        self.assertEqual(os.listdir(self.dir), ["export.tar"])
+
+    def test_abort(self):
+        # Nothing to clean up before the file was created
+        ExportFile(self.path).abort()
+
+        export = ExportFile(self.path)
+        export.open()
+        export.write(b"ab")
+        export.abort()
+        self.assertEqual(os.listdir(self.dir), [])
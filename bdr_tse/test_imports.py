@@ -0,0 +1,86 @@
+from unittest import TestCase
+import subprocess
+import sys
+
+from click.testing import CliRunner
+
+from bdr_tse import cli
+
+
+def _imported_modules(module: str) -> set:
+    """The modules that importing ``module`` in a fresh interpreter imports."""
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, {}; print(' '.join(sys.modules))".format(module),
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return set(output.split())
+
+
+class TestImports(TestCase):
+    """Guards the startup time of the package and the CLI. The time itself is
+    measured by the import_package and import_cli benchmarks."""
+
+    def test_heavy_modules_are_imported_lazily(self):
+        for module in ("bdr_tse", "bdr_tse.cli"):
+            with self.subTest(module=module):
+                modules = _imported_modules(module)
+                self.assertIn(module, modules)
+                for lazy in ("construct", "tarfile", "bdr_tse.daemon"):
+                    self.assertNotIn(lazy, modules)
+
+    def test_structs_are_built_on_demand(self):
+        from bdr_tse import msc_transport, transport
+
+        self.assertEqual(
+            transport.TRANSPORT_RESULT.parse(bytes([0x01, 0x00, 0x01, 0x07]))[0].data,
+            7,
+        )
+        self.assertIs(
+            msc_transport.MSC_TRANSPORT_COMMAND_PACKET,
+            msc_transport.MSC_TRANSPORT_COMMAND_PACKET,
+        )
+        with self.assertRaises(AttributeError):
+            transport.NO_SUCH_PACKET
+
+
+class TestCli(TestCase):
+    def test_help_does_not_open_the_tse(self):
+        runner = CliRunner()
+        for args in (["batch", "--help"], ["get-serial-numbr"]):
+            with self.subTest(args=args):
+                result = runner.invoke(cli.cli, ["--tse_path", "/nonexistent"] + args)
+                self.assertNotIsInstance(result.exception, FileNotFoundError)
+        result = runner.invoke(
+            cli.cli, ["--tse_path", "/nonexistent", "batch", "--help"]
+        )
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("--stop_on_error", result.output)
+
+    def test_invalid_socket_mode(self):
+        result = CliRunner().invoke(
+            cli.cli,
+            [
+                "--tse_path",
+                "/nonexistent",
+                "serve",
+                "--socket",
+                "s",
+                "--socket_mode",
+                "644x",
+            ],
+        )
+        # A usage error, before the TSE is opened
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("not an octal mode", result.output)
+
+    def test_commands_open_the_tse(self):
+        result = CliRunner().invoke(
+            cli.cli, ["--tse_path", "/nonexistent", "get-serial-number"]
+        )
+        self.assertIsInstance(result.exception, FileNotFoundError)
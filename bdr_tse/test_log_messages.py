@@ -0,0 +1,151 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from bdr_tse import log_messages
+from bdr_tse.exceptions import ProtocolError
+from bdr_tse.log_messages import (
+    SYSTEM_LOG_OID,
+    TRANSACTION_LOG_OID,
+    LogIndex,
+    LogMessage,
+    decode_oid,
+    iter_log_messages,
+)
+from bdr_tse.test_export import make_tar
+
+ECDSA_PLAIN_SHA384_OID = "0.4.0.127.0.7.1.1.4.1.4"
+
+
+def make_transaction_log(
+    signature_counter, transaction_number, client_id, log_time, operation="Start"
+) -> LogMessage:
+    message = LogMessage()
+    message.version = 2
+    message.certified_data_type = TRANSACTION_LOG_OID
+    message.operation_type = operation + "Transaction"
+    message.client_id = client_id
+    message.process_data = b"Beleg^10.00_0.00_0.00_0.00_0.00^10.00:Bar"
+    message.process_type = "Kassenbeleg-V1"
+    message.transaction_number = transaction_number
+    message.serial_number = bytes(range(32))
+    message.signature_algorithm = ECDSA_PLAIN_SHA384_OID
+    message.signature_counter = signature_counter
+    message.log_time = log_time
+    message.signature_value = bytes(96)
+    return message
+
+
+def make_system_log(signature_counter, log_time) -> LogMessage:
+    message = LogMessage()
+    message.version = 2
+    message.certified_data_type = SYSTEM_LOG_OID
+    message.operation_type = "UpdateTime"
+    message.system_operation_data = b"\x30\x00"
+    message.serial_number = bytes(range(32))
+    message.signature_algorithm = ECDSA_PLAIN_SHA384_OID
+    message.signature_counter = signature_counter
+    message.log_time = log_time
+    message.signature_value = bytes(96)
+    return message
+
+
+def make_export(messages) -> bytes:
+    files = [("info.csv", b"")]
+    for m in messages:
+        if m.log_type == "Tra":
+            name = "Unixt_{}_Sig-{}_Log-Tra_No-{}_Start_Client-{}.log".format(
+                m.log_time, m.signature_counter, m.transaction_number, m.client_id
+            )
+        else:
+            name = "Unixt_{}_Sig-{}_Log-Sys_{}.log".format(
+                m.log_time, m.signature_counter, m.operation_type
+            )
+        files.append((name, m.encode()))
+    return make_tar(files)
+
+
+class TestLogMessage(TestCase):
+    def test_decode_oid(self):
+        self.assertEqual(
+            decode_oid(bytes.fromhex("04007f00070101040104")), ECDSA_PLAIN_SHA384_OID
+        )
+        self.assertEqual(decode_oid(bytes.fromhex("2a864886f70d")), "1.2.840.113549")
+
+    def test_round_trip(self):
+        message = LogMessage.decode(
+            make_transaction_log(300, 70000, "POS-1", 1600000000).encode()
+        )
+        self.assertEqual(message.log_type, "Tra")
+        self.assertEqual(message.signature_counter, 300)
+        self.assertEqual(message.transaction_number, 70000)
+        self.assertEqual(message.client_id, "POS-1")
+        self.assertEqual(message.log_time, 1600000000)
+        self.assertEqual(message.signature_algorithm, ECDSA_PLAIN_SHA384_OID)
+        self.assertEqual(message.process_type, "Kassenbeleg-V1")
+        self.assertEqual(message.signature_value, bytes(96))
+
+        message = LogMessage.decode(make_system_log(1, 1500000000).encode())
+        self.assertEqual(message.log_type, "Sys")
+        self.assertEqual(message.operation_type, "UpdateTime")
+        self.assertIsNone(message.transaction_number)
+
+    def test_generalized_time(self):
+        raw = make_system_log(1, 0).encode()
+        # Replace the INTEGER log time 0 by a GeneralizedTime
+        content = raw[3:].replace(
+            b"\x02\x01\x00\x04\x60", b"\x18\x0f20200913122640Z\x04\x60"
+        )
+        raw = log_messages._encode_tlv(0x30, content)
+        self.assertEqual(LogMessage.decode(raw).log_time, 1600000000)
+
+    def test_invalid(self):
+        with self.assertRaises(ProtocolError):
+            LogMessage.decode(b"\x04\x00")
+        with self.assertRaises(ProtocolError):
+            LogMessage.decode(make_system_log(1, 0).encode()[:-5])
+
+
+class TestLogIndex(TestCase):
+    def setUp(self):
+        self.messages = [make_system_log(1, 1000)]
+        for i in range(2, 30):
+            self.messages.append(
+                make_transaction_log(i, i // 2, "POS-{}".format(i % 3), 1000 + i)
+            )
+        self.export = make_export(self.messages)
+
+    def test_iter_log_messages_from_fragments(self):
+        fragments = [
+            self.export[i : i + 1000] for i in range(0, len(self.export), 1000)
+        ]
+        counters = [m.signature_counter for m in iter_log_messages(iter(fragments))]
+        self.assertEqual(counters, list(range(1, 30)))
+
+    def test_queries(self):
+        index = LogIndex.build(self.export)
+        self.assertEqual(len(index), 29)
+        self.assertEqual(
+            [e.signature_counter for e in index.by_signature_counter(5, 7)], [5, 6, 7]
+        )
+        self.assertEqual(
+            [e.signature_counter for e in index.by_transaction_number(3, 4)],
+            [6, 7, 8, 9],
+        )
+        self.assertEqual(
+            [e.signature_counter for e in index.by_log_time(1000, 1003)], [1, 2, 3]
+        )
+        self.assertEqual(
+            [e.signature_counter for e in index.by_client_id("POS-1", end_time=1010)],
+            [4, 7, 10],
+        )
+
+    def test_read_log_message_from_archive(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = os.path.join(tempdir, "export.tar")
+            with open(path, "wb") as f:
+                f.write(self.export)
+            index = LogIndex.build(path)
+            entry = index.by_signature_counter(12, 12)[0]
+            message = LogIndex.read_log_message(path, entry)
+        self.assertEqual(message.raw, self.messages[11].encode())
@@ -0,0 +1,65 @@
+from datetime import date, timezone
+from unittest import TestCase
+
+from bdr_tse.log_store import LogStore
+from bdr_tse.test_log_messages import make_export, make_system_log, make_transaction_log
+
+# 2020-09-13 12:26:40 UTC
+DAY_START = 1599955200 + 12 * 3600
+
+
+class FakeTseConnector:
+    def __init__(self, pages):
+        self.pages = pages
+        self.checkpoints = []
+
+    def export_data_paged(self, checkpoint, page_size):
+        self.checkpoints.append(checkpoint.last_signature_counter)
+        for page in self.pages:
+            yield page
+
+
+class TestLogStore(TestCase):
+    def setUp(self):
+        self.store = LogStore(":memory:")
+        self.addCleanup(self.store.close)
+        self.messages = [make_system_log(1, DAY_START)] + [
+            make_transaction_log(i, i, "POS-{}".format(i % 2), DAY_START + i * 3600)
+            for i in range(2, 20)
+        ]
+
+    def test_ingest_deduplicates(self):
+        self.assertEqual(self.store.ingest(make_export(self.messages[:10])), 10)
+        self.assertEqual(self.store.ingest(make_export(self.messages[5:])), 9)
+        self.assertEqual(self.store.last_signature_counter, 19)
+        self.assertEqual(self.store.last_transaction_number, 19)
+
+    def test_message_without_signature_counter(self):
+        message = make_transaction_log(None, 30, "POS-1", DAY_START)
+        with self.assertLogs("bdr_tse.log_store", "WARNING"):
+            added = self.store.ingest(make_export(self.messages[:3] + [message]))
+        self.assertEqual(added, 3)
+        self.assertEqual(self.store.last_signature_counter, 3)
+        self.assertEqual(self.store.last_transaction_number, 3)
+        self.assertEqual(self.store.find(transaction_number=30), [])
+
+    def test_sync_resumes(self):
+        tse = FakeTseConnector([make_export(self.messages[:4])])
+        self.assertEqual(self.store.sync(tse), 4)
+        tse.pages = [make_export(self.messages[4:])]
+        self.assertEqual(self.store.sync(tse), 15)
+        self.assertEqual(tse.checkpoints, [0, 4])
+
+    def test_find(self):
+        self.store.ingest(make_export(self.messages))
+
+        transactions = self.store.find_transactions(
+            "POS-1", date(2020, 9, 13), tz=timezone.utc
+        )
+        self.assertEqual([m.signature_counter for m in transactions], [3, 5, 7, 9, 11])
+        self.assertEqual(
+            [m.signature_counter for m in self.store.find(transaction_number=4)], [4]
+        )
+        self.assertEqual(
+            [m.signature_counter for m in self.store.find(log_type="Sys")], [1]
+        )
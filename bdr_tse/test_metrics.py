@@ -0,0 +1,86 @@
+from unittest import TestCase
+
+from bdr_tse import tse_connector
+from bdr_tse.backends import MemoryBackend
+from bdr_tse.emulator import EmulatorTransport, TseEmulator
+from bdr_tse.metrics import Histogram, TransportMetrics
+from bdr_tse.transport import TransportCommand
+from bdr_tse.transport_errors import TransportErrorStorageFailure
+
+
+class TestHistogram(TestCase):
+    def test_quantile(self):
+        histogram = Histogram([1, 2, 4])
+        for value in [0.5, 1.5, 1.5, 3, 10]:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.counts, [1, 2, 1, 1])
+        self.assertEqual(histogram.quantile(0.5), 1.75)
+        self.assertEqual(histogram.quantile(0.99), 4)
+        self.assertEqual(histogram.snapshot()["count"], 5)
+
+
+class TestTransportMetrics(TestCase):
+    def make_connector(self, emulator, backend_class=EmulatorTransport):
+        self.metrics = TransportMetrics()
+        backend = backend_class(emulator)
+        self.addCleanup(backend.close)
+        return tse_connector.TseConnector(backend=backend, metrics=self.metrics)
+
+    def test_stages_are_recorded(self):
+        tse = self.make_connector(TseEmulator())
+        tse.start_transaction("POS-1", b"", "")
+
+        snapshot = self.metrics.snapshot()["StartTransaction"]
+        self.assertEqual(
+            set(snapshot),
+            {
+                "encode",
+                "write",
+                "ready",
+                "read",
+                "parse",
+                "total",
+                "polls",
+                "fragments",
+            },
+        )
+        self.assertEqual(snapshot["fragments"]["sum"], 1)
+        self.assertGreaterEqual(snapshot["polls"]["sum"], 1)
+
+    def test_fragments(self):
+        tse = self.make_connector(TseEmulator(fragment_length=100))
+        tse.start_transaction("POS-1", b"", "")
+        data = tse.export_data()
+
+        snapshot = self.metrics.snapshot()["ExportData"]
+        self.assertEqual(snapshot["fragments"]["sum"], -(-(len(data) + 10) // 100))
+        self.assertNotIn("parse", snapshot)
+
+    def test_backend_without_polling(self):
+        emulator = TseEmulator()
+        emulator.inject_fault(
+            TransportCommand.StartTransaction, TransportErrorStorageFailure
+        )
+        tse = self.make_connector(emulator, backend_class=MemoryBackend)
+        with self.assertRaises(TransportErrorStorageFailure):
+            tse.start_transaction("POS-1", b"", "")
+
+        snapshot = self.metrics.snapshot()["StartTransaction"]
+        self.assertNotIn("ready", snapshot)
+        self.assertEqual(snapshot["total"]["count"], 1)
+
+    def test_prometheus(self):
+        tse = self.make_connector(TseEmulator())
+        tse.start_transaction("POS-1", b"", "")
+
+        text = self.metrics.to_prometheus()
+        self.assertIn("# TYPE bdr_tse_command_duration_seconds histogram", text)
+        self.assertIn(
+            'bdr_tse_command_duration_seconds_bucket{command="StartTransaction",'
+            'stage="encode",le="+Inf"} 1',
+            text,
+        )
+        self.assertIn(
+            'bdr_tse_command_fragments_count{command="StartTransaction"} 1', text
+        )
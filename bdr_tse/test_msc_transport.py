@@ -0,0 +1,171 @@
+import mmap
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+from bdr_tse import msc_transport
+from bdr_tse.exceptions import ProtocolError, TimeoutException
+
+BUSY_BLOCK = msc_transport.HEADER + bytes(4) + bytes([0xFF, 0xFF])
+
+
+def _response_block(response_data: bytes, random_token=(1, 2, 3, 4)) -> bytes:
+    return msc_transport.MSC_TRANSPORT_RESPONSE_PACKET.build(
+        {"random_token": list(random_token), "response_data": response_data}
+    )
+
+
+class FakeMscTransport(msc_transport.MscTransport):
+    """MscTransport that answers every read with the next of a list of scripted
+    blocks instead of talking to a TSE."""
+
+    def __init__(self, tse_path, **kwargs):
+        self.written_blocks = []
+        self.read_lengths = []
+        # Response to the initial set_suspend(False)
+        self.blocks = [_response_block(b"")]
+        super().__init__(tse_path, **kwargs)
+
+    def _write_block(self, data):
+        self.written_blocks.append(bytes(data))
+
+    def _read_block(self, length: int = msc_transport.BLOCK_SIZE) -> bytes:
+        self.read_lengths.append(length)
+        if len(self.blocks) > 1:
+            return self.blocks.pop(0)[:length]
+        return self.blocks[0][:length]
+
+
+class MscTransportTestCase(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tempdir.name, msc_transport.MscTransport.CMD_FILENAME)
+        with open(path, "wb") as f:
+            f.write(bytes(msc_transport.BLOCK_SIZE))
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def make_transport(self, **kwargs) -> FakeMscTransport:
+        transport = FakeMscTransport(self.tempdir.name, **kwargs)
+        self.addCleanup(os.close, transport._fd)
+        return transport
+
+
+class TestPolling(MscTransportTestCase):
+    def test_poll_counts_are_recorded_per_command(self):
+        transport = self.make_transport()
+        transport.blocks = [BUSY_BLOCK] * 3 + [_response_block(b"\x01\x02")]
+
+        self.assertEqual(transport.read(command=10), b"\x01\x02")
+        self.assertEqual(transport.read(command=10), b"\x01\x02")
+        self.assertEqual(list(transport.poll_counts[10]), [4, 1])
+
+    def test_timeout(self):
+        transport = self.make_transport(
+            default_polling_profile=msc_transport.PollingProfile(
+                spin_time=0.0, initial_interval=0.001, max_interval=0.002
+            ),
+        )
+        transport.blocks = [BUSY_BLOCK]
+
+        with self.assertRaises(TimeoutException):
+            transport.read(timeout=0.01)
+        self.assertGreater(transport.last_poll_count, 1)
+
+
+class TestProbe(MscTransportTestCase):
+    def test_full_block_is_read_once_ready(self):
+        transport = self.make_transport()
+        transport.blocks = [BUSY_BLOCK] * 2 + [_response_block(b"\x01")] * 2
+        transport.read_lengths.clear()
+
+        self.assertEqual(transport.read(), b"\x01")
+        self.assertEqual(
+            transport.read_lengths,
+            [msc_transport.PROBE_SIZE] * 3 + [msc_transport.BLOCK_SIZE],
+        )
+
+    def test_fallback_to_full_block_reads(self):
+        transport = self.make_transport()
+        transport.blocks = [_response_block(b"\x01")]
+        transport.read_lengths.clear()
+        read_block = transport._read_block
+
+        def _read_block(length=msc_transport.BLOCK_SIZE):
+            if length != msc_transport.BLOCK_SIZE:
+                raise OSError("Invalid argument")
+            return read_block(length)
+
+        transport._read_block = _read_block
+
+        self.assertEqual(transport.read(), b"\x01")
+        self.assertEqual(transport.read(), b"\x01")
+        self.assertIsNone(transport.probe_size)
+        self.assertEqual(transport.read_lengths, [msc_transport.BLOCK_SIZE] * 2)
+
+
+class TestMscFrameCodec(TestCase):
+    """Checks the codec against the construct definitions of the packets."""
+
+    def setUp(self):
+        self.codec = msc_transport.MscFrameCodec(
+            mmap.mmap(-1, msc_transport.BLOCK_SIZE)
+        )
+        self.addCleanup(self.codec.command_buf.close)
+        self.random = random.Random(42)
+
+    def test_build_command(self):
+        lengths = [0, 1, 200, msc_transport.MAX_COMMAND_DATA_LENGTH, 5, 0, 1000, 3]
+        for length in lengths:
+            command_data = bytes(self.random.getrandbits(8) for _ in range(length))
+            self.assertEqual(
+                bytes(self.codec.build_command(command_data)),
+                msc_transport.MSC_TRANSPORT_COMMAND_PACKET.build(
+                    {"command_data": command_data}
+                ),
+            )
+
+    def test_build_command_too_long(self):
+        with self.assertRaises(ValueError):
+            self.codec.build_command(bytes(msc_transport.MAX_COMMAND_DATA_LENGTH + 1))
+
+    def test_build_suspend(self):
+        self.codec.build_command(bytes(range(100)))
+        self.assertEqual(
+            bytes(self.codec.build_suspend(True)),
+            msc_transport.MSC_TRANSPORT_ENABLE_SUSPEND_PACKET.build({}),
+        )
+        self.assertEqual(
+            bytes(self.codec.build_suspend(False)),
+            msc_transport.MSC_TRANSPORT_DISABLE_SUSPEND_PACKET.build({}),
+        )
+        self.assertEqual(
+            bytes(self.codec.build_command(b"\x01")),
+            msc_transport.MSC_TRANSPORT_COMMAND_PACKET.build({"command_data": b"\x01"}),
+        )
+
+    def test_parse_response(self):
+        for length in [0, 1, 300, msc_transport.BLOCK_SIZE - 34]:
+            response_data = bytes(self.random.getrandbits(8) for _ in range(length))
+            random_token = [self.random.getrandbits(8) for _ in range(4)]
+            block = _response_block(response_data, random_token)
+
+            reference = msc_transport.MSC_TRANSPORT_RESPONSE_PACKET.parse(block)
+            token, data = msc_transport.MscFrameCodec.parse_response(block)
+            self.assertEqual(bytes(token), bytes(reference.random_token))
+            self.assertEqual(bytes(data), reference.response_data)
+
+    def test_parse_invalid_response(self):
+        with self.assertRaises(ProtocolError):
+            msc_transport.MscFrameCodec.parse_response(bytes(msc_transport.BLOCK_SIZE))
+        block = bytearray(_response_block(b""))
+        block[32:34] = (msc_transport.BLOCK_SIZE).to_bytes(2, "big")
+        with self.assertRaises(ProtocolError):
+            msc_transport.MscFrameCodec.parse_response(block)
+
+    def test_parse_suspend_response(self):
+        block = _response_block(b"")
+        msc_transport.MSC_TRANSPORT_SUSPEND_RESPONSE_PACKET.parse(block)
+        msc_transport.MscFrameCodec.parse_suspend_response(block)
@@ -0,0 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from bdr_tse import tse_connector
+from bdr_tse.backends import MemoryBackend
+from bdr_tse.emulator import TseEmulator
+from bdr_tse.exceptions import NoHealthyDeviceError, TimeoutException
+from bdr_tse.pool import TsePool
+from bdr_tse.transport import Transport, TransportCommand
+from bdr_tse.transport_errors import TransportErrorUserNotAuthenticated
+from bdr_tse.worker import DeviceWorker
+
+
+class TestTsePool(TestCase):
+    def make_pool(self, count=2, **kwargs) -> TsePool:
+        self.emulators = [
+            TseEmulator(serial_number=bytes([i]) * 32) for i in range(count)
+        ]
+        pool = TsePool(
+            [
+                tse_connector.TseConnector(backend=MemoryBackend(emulator))
+                for emulator in self.emulators
+            ],
+            **{"admin_pin": TseEmulator.DEFAULT_ADMIN_PIN, **kwargs},
+        )
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_assignment(self):
+        pool = self.make_pool()
+        clients = ["POS-{}".format(i) for i in range(4)]
+        for client_id in clients:
+            started = pool.start_transaction(client_id, b"", "")
+            pool.finish_transaction(
+                started["transaction_number"], client_id, b"", "", b""
+            )
+
+        self.assertEqual([len(d.clients) for d in pool.devices], [2, 2])
+        for emulator in self.emulators:
+            self.assertEqual(
+                set(emulator.ers_mappings.values()), {emulator.serial_number}
+            )
+            # Admin is logged out again after mapping
+            self.assertEqual(emulator.authenticated, set())
+
+        # Clients stay with their TSE
+        assignments = pool.assignments
+        started = pool.start_transaction("POS-0", b"", "")
+        self.assertEqual(
+            started["serial_number"],
+            self.emulators[assignments["POS-0"]].serial_number,
+        )
+
+    def test_restore_assignments(self):
+        pool = self.make_pool(assignments={"POS-0": 1})
+        pool.start_transaction("POS-0", b"", "")
+        self.assertEqual(self.emulators[1].transaction_number, 1)
+        self.assertEqual(self.emulators[1].ers_mappings, {})
+
+    def test_mapping_requires_admin(self):
+        pool = self.make_pool(admin_pin=None)
+        with self.assertRaises(TransportErrorUserNotAuthenticated):
+            pool.start_transaction("POS-0", b"", "")
+
+    def test_health(self):
+        pool = self.make_pool(max_failures=1)
+        pool.start_transaction("POS-0", b"", "")
+        self.emulators[0].inject_fault(TransportCommand.StartTransaction)
+        with self.assertRaises(TimeoutException):
+            pool.start_transaction("POS-0", b"", "")
+        self.assertFalse(pool.devices[0].healthy)
+
+        # The client moves to the other TSE
+        started = pool.start_transaction("POS-0", b"", "")
+        self.assertEqual(started["serial_number"], self.emulators[1].serial_number)
+        self.assertEqual(pool.assignments, {"POS-0": 1})
+
+        self.assertEqual(pool.check_health(), [True, True])
+        self.emulators[0].inject_fault(TransportCommand.GetPinStates)
+        self.emulators[1].inject_fault(TransportCommand.GetPinStates)
+        self.assertEqual(pool.check_health(), [False, False])
+        with self.assertRaises(NoHealthyDeviceError):
+            pool.start_transaction("POS-1", b"", "")
+
+    def test_open_transaction_stays_on_unhealthy_device(self):
+        pool = self.make_pool(max_failures=1)
+        started = pool.start_transaction("POS-0", b"", "")
+        number = started["transaction_number"]
+        self.emulators[0].inject_fault(TransportCommand.UpdateTransaction)
+        with self.assertRaises(TimeoutException):
+            pool.update_transaction(number, "POS-0", b"", "")
+        self.assertFalse(pool.devices[0].healthy)
+
+        # The transaction is finished on the TSE it was started on
+        finished = pool.finish_transaction(number, "POS-0", b"", "", b"")
+        self.assertEqual(finished["serial_number"], self.emulators[0].serial_number)
+        self.assertEqual(self.emulators[0].open_transactions, {})
+        self.assertEqual(self.emulators[1].ers_mappings, {})
+        self.assertEqual(pool.assignments, {"POS-0": 0})
+
+        # Only the next transaction moves to the other TSE
+        started = pool.start_transaction("POS-0", b"", "")
+        self.assertEqual(started["serial_number"], self.emulators[1].serial_number)
+
+    def test_threads(self):
+        workers = [
+            DeviceWorker(
+                Transport(
+                    backend=MemoryBackend(
+                        TseEmulator(
+                            serial_number=bytes([i]) * 32, default_latency=0.001
+                        )
+                    )
+                )
+            )
+            for i in range(2)
+        ]
+        for worker in workers:
+            self.addCleanup(worker.close)
+        pool = TsePool(
+            [worker.connector() for worker in workers],
+            admin_pin=TseEmulator.DEFAULT_ADMIN_PIN,
+        )
+
+        def run(client_id):
+            for _ in range(5):
+                started = pool.start_transaction(client_id, b"", "")
+                pool.finish_transaction(
+                    started["transaction_number"], client_id, b"", "", b""
+                )
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(run, ["POS-{}".format(i) for i in range(8)]))
+
+        self.assertEqual(
+            sorted(pool.assignments), ["POS-{}".format(i) for i in range(8)]
+        )
+        self.assertEqual([len(d.clients) for d in pool.devices], [4, 4])
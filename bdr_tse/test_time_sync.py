@@ -0,0 +1,170 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+import threading
+import time
+
+from bdr_tse.emulator import EmulatorTransport, TseEmulator
+from bdr_tse.time_sync import TimeSync
+from bdr_tse.tracing import TransportHook
+from bdr_tse.transport import Transport, TransportCommand
+from bdr_tse.tse_connector import TseConnector
+from bdr_tse.worker import DeviceWorker
+
+SYNC_COMMANDS = (
+    TransportCommand.AuthenticateUser,
+    TransportCommand.UpdateTime,
+    TransportCommand.Logout,
+)
+
+
+class CommandLog(TransportHook):
+    def __init__(self):
+        self.commands = []
+
+    def on_start(self, span):
+        self.commands.append(span.command)
+
+
+class TestTimeSync(TestCase):
+    def setUp(self):
+        self.emulator = TseEmulator(time_set=False, time_sync_interval=1)
+
+    def count(self, command) -> int:
+        return self.emulator.command_counts.get(command, 0)
+
+    def test_retry_when_time_not_set(self):
+        tse = TseConnector(backend=EmulatorTransport(self.emulator))
+        time_sync = TimeSync(
+            tse, TseEmulator.DEFAULT_TIME_ADMIN_PIN, clock=lambda: 1600000000
+        )
+        started = time_sync.call(tse.start_transaction, "POS-1", b"", "")
+        self.assertIn(started["transaction_number"], self.emulator.open_transactions)
+        self.assertEqual(self.count(TransportCommand.UpdateTime), 1)
+        self.assertAlmostEqual(
+            self.emulator.clock() + self.emulator.time_offset, 1600000000, delta=5
+        )
+        # TimeAdmin is logged out again
+        self.assertEqual(self.emulator.authenticated, set())
+
+    def test_sync_if_due(self):
+        tse = TseConnector(backend=EmulatorTransport(self.emulator))
+        time_sync = TimeSync(tse, TseEmulator.DEFAULT_TIME_ADMIN_PIN, margin=0.01)
+        self.assertTrue(time_sync.sync_if_due())
+        self.assertFalse(time_sync.sync_if_due())
+        self.assertEqual(time_sync.interval, 1)
+        time.sleep(0.02)
+        self.assertTrue(time_sync.sync_if_due())
+        self.assertEqual(self.count(TransportCommand.UpdateTime), 2)
+        self.assertEqual(self.count(TransportCommand.GetConfigData), 1)
+
+    def make_worker(self) -> DeviceWorker:
+        worker = DeviceWorker(Transport(backend=EmulatorTransport(self.emulator)))
+        self.addCleanup(worker.close)
+        self.log = CommandLog()
+        worker.connector().add_hook(self.log)
+        return worker
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def block(self, worker: DeviceWorker) -> threading.Event:
+        """Keep the worker busy until the returned event is set. Returns once
+        the worker is busy, so that jobs submitted afterwards are queued."""
+        started = threading.Event()
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def wait(transport):
+            started.set()
+            release.wait()
+
+        worker.submit(wait)
+        self.assertTrue(started.wait(5))
+        return release
+
+    def test_idle_sync_waits_for_queued_transactions(self):
+        worker = self.make_worker()
+        tse = worker.connector()
+        time_sync = TimeSync(
+            tse,
+            TseEmulator.DEFAULT_TIME_ADMIN_PIN,
+            worker=worker,
+            margin=0.01,
+            urgent_margin=100,
+        )
+        time_sync.sync()
+        # Read before the worker is blocked
+        self.assertEqual(time_sync.interval, 1)
+        time.sleep(0.02)
+        self.log.commands.clear()
+
+        release = self.block(worker)
+        with ThreadPoolExecutor(5) as executor:
+            try:
+                syncing = executor.submit(time_sync.sync_if_due)
+                self.wait_for(lambda: worker._idle_jobs)
+                started = [
+                    executor.submit(tse.start_transaction, "POS-1", b"", "")
+                    for _ in range(4)
+                ]
+                self.wait_for(lambda: len(worker._jobs) == 4)
+            finally:
+                # Otherwise the executor waits for the blocked worker forever
+                release.set()
+            self.assertTrue(syncing.result())
+            for future in started:
+                future.result()
+
+        self.assertEqual(
+            self.log.commands,
+            [TransportCommand.StartTransaction] * 4 + list(SYNC_COMMANDS),
+        )
+
+    def test_urgent_sync_does_not_wait_for_idle(self):
+        worker = self.make_worker()
+        time_sync = TimeSync(
+            worker.connector(),
+            TseEmulator.DEFAULT_TIME_ADMIN_PIN,
+            worker=worker,
+            margin=0.01,
+            urgent_margin=0.2,
+        )
+        time_sync.sync()
+        # Read before the worker is blocked
+        self.assertEqual(time_sync.interval, 1)
+        time.sleep(0.02)
+
+        release = self.block(worker)
+        # Keep the worker busy past the urgent deadline
+        threading.Timer(0.5, release.set).start()
+        with self.assertLogs("bdr_tse.time_sync", "WARNING"):
+            self.assertTrue(time_sync.sync_if_due())
+        self.assertEqual(self.count(TransportCommand.UpdateTime), 2)
+        self.assertEqual(len(worker._idle_jobs), 0)
+
+    def test_background(self):
+        worker = self.make_worker()
+        tse = worker.connector()
+        time_sync = TimeSync(
+            tse, TseEmulator.DEFAULT_TIME_ADMIN_PIN, worker=worker, margin=0.01
+        )
+        time_sync.start()
+        self.addCleanup(time_sync.stop)
+
+        deadline = time.monotonic() + 5
+        while self.count(TransportCommand.UpdateTime) < 3:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.005)
+        for _ in range(10):
+            started = time_sync.call(tse.start_transaction, "POS-1", b"", "")
+            tse.finish_transaction(started["transaction_number"], "POS-1", b"", "", b"")
+
+        # The commands of an update are never interleaved with a transaction
+        time_sync.stop()
+        commands = self.log.commands
+        for i, command in enumerate(commands):
+            if command == TransportCommand.AuthenticateUser:
+                self.assertEqual(tuple(commands[i : i + 3]), SYNC_COMMANDS)
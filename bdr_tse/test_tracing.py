@@ -0,0 +1,70 @@
+from unittest import TestCase
+
+from bdr_tse import tse_connector
+from bdr_tse.backends import MemoryBackend
+from bdr_tse.emulator import TseEmulator
+from bdr_tse.tracing import TransportHook
+from bdr_tse.transport import TransportCommand
+from bdr_tse.transport_errors import TransportErrorNoTransaction
+
+
+class RecordingHook(TransportHook):
+    def __init__(self):
+        self.events = []
+
+    def on_start(self, span):
+        self.events.append(("start", span.command))
+
+    def on_end(self, span):
+        self.events.append(("end", span))
+
+
+class FailingHook(TransportHook):
+    def on_start(self, span):
+        raise RuntimeError
+
+
+class TestTracing(TestCase):
+    def setUp(self):
+        self.tse = tse_connector.TseConnector(
+            backend=MemoryBackend(TseEmulator(fragment_length=100))
+        )
+        self.hook = RecordingHook()
+        self.tse.add_hook(self.hook)
+
+    def test_span(self):
+        self.tse.start_transaction("POS-1", b"data", "type")
+
+        (_, command), (_, span) = self.hook.events
+        self.assertEqual(command, TransportCommand.StartTransaction)
+        self.assertEqual(span.param_sizes, [5, 4, 4, 0])
+        self.assertEqual(span.outcome, "ok")
+        self.assertIsNone(span.error_class)
+        self.assertGreater(span.response_size, 0)
+        self.assertGreaterEqual(span.duration, 0)
+
+    def test_error(self):
+        with self.assertRaises(TransportErrorNoTransaction):
+            self.tse.finish_transaction(1, "POS-1", b"", "", b"")
+
+        span = self.hook.events[-1][1]
+        self.assertEqual(span.outcome, "error")
+        self.assertIs(span.error_class, TransportErrorNoTransaction)
+
+    def test_aborted_export(self):
+        self.tse.start_transaction("POS-1", b"", "")
+        fragments = self.tse.export_data_iter()
+        next(fragments)
+        self.assertEqual(len(self.hook.events), 3)
+        fragments.close()
+
+        span = self.hook.events[-1][1]
+        self.assertEqual(span.command, TransportCommand.ExportData)
+        self.assertEqual(span.outcome, "aborted")
+
+    def test_failing_hook_is_ignored(self):
+        self.tse.add_hook(FailingHook())
+        with self.assertLogs("bdr_tse.transport", "ERROR"):
+            self.tse.start_transaction("POS-1", b"", "")
+        self.tse.remove_hook(self.hook)
+        self.assertEqual(len(self.hook.events), 2)
@@ -1,6 +1,163 @@
-from unittest import TestCase
+from unittest import TestCase, mock
+
+from bdr_tse import msc_transport
+from bdr_tse.transport import (
+    TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ,
+    TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ,
+    TRANSPORT_COMMAND_PACKET,
+    TRANSPORT_RESULT,
+    Transport,
+    TransportCommand,
+    TransportDataType,
+    decode_transport_result,
+    encode_transport_command,
+)
+from bdr_tse.transport_errors import TransportErrorNoDataAvailable
+
+
+def _build_result(params) -> bytes:
+    return TRANSPORT_RESULT.build(
+        [{"data_type": bytes([p[0]]), "data": p[1]} for p in params]
+    )
 
 
 class TestTransport(TestCase):
     def test__encode(self):
-        pass
+        params = [
+            (TransportDataType.BYTE, 3),
+            (TransportDataType.BYTE_ARRAY, bytes(300)),
+            (TransportDataType.SHORT, 0x1234),
+            (TransportDataType.STRING, "POS-1"),
+            (TransportDataType.LONG_ARRAY, [1, 0xFFFFFFFF]),
+            (TransportDataType.BYTE_ARRAY, b""),
+        ]
+        reference = TRANSPORT_COMMAND_PACKET.build(
+            {
+                "command": TransportCommand.StartTransaction,
+                "command_data": [
+                    {"data_type": bytes([p[0]]), "data": p[1]} for p in params
+                ],
+            }
+        )
+        self.assertEqual(
+            encode_transport_command(TransportCommand.StartTransaction, params),
+            reference,
+        )
+        self.assertEqual(
+            encode_transport_command(TransportCommand.GetPinStates, []),
+            bytes([0x5C, 0x54])
+            + TransportCommand.GetPinStates.to_bytes(2, "big")
+            + bytes(2),
+        )
+
+
+class TestDecodeTransportResult(TestCase):
+    def assertDecodesLikeConstruct(self, data: bytes):
+        reference = TRANSPORT_RESULT.parse(data)
+        result = decode_transport_result(data)
+        self.assertEqual([p.data for p in result], [p.data for p in reference])
+
+    def test_start_transaction_response(self):
+        self.assertDecodesLikeConstruct(
+            _build_result(
+                [
+                    (TransportDataType.BYTE_ARRAY, (17).to_bytes(4, "big")),
+                    (TransportDataType.BYTE_ARRAY, (42).to_bytes(4, "big")),
+                    (TransportDataType.BYTE_ARRAY, (1600000000).to_bytes(8, "big")),
+                    (TransportDataType.BYTE_ARRAY, bytes(range(64))),
+                    (TransportDataType.BYTE_ARRAY, bytes(range(32))),
+                ]
+            )
+        )
+
+    def test_all_data_types(self):
+        self.assertDecodesLikeConstruct(
+            _build_result(
+                [
+                    (TransportDataType.BYTE, 3),
+                    (TransportDataType.SHORT, 0x1234),
+                    (TransportDataType.STRING, "Admin"),
+                    (TransportDataType.BYTE_ARRAY, b""),
+                    (TransportDataType.LONG_ARRAY, [1, 0xFFFFFFFF, 7]),
+                ]
+            )
+        )
+
+    def test_stops_at_undecodable_parameter(self):
+        data = _build_result(
+            [(TransportDataType.BYTE, 1), (TransportDataType.STRING, "abc")]
+        )
+        self.assertDecodesLikeConstruct(data + bytes([0x07, 0x00, 0x01, 0x00]))
+        self.assertDecodesLikeConstruct(data[:-1])
+        self.assertDecodesLikeConstruct(bytes([0x01, 0x00, 0x02, 0x00, 0x01]))
+
+    def test_view_does_not_copy(self):
+        data = bytearray(_build_result([(TransportDataType.BYTE_ARRAY, b"abc")]))
+        result = decode_transport_result(data)
+        data[3] = ord("x")
+        self.assertEqual(bytes(result[0].view), b"xbc")
+
+
+class ScriptedMscTransport:
+    """Stands in for MscTransport, answering reads with scripted responses."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.written = []
+
+    def write(self, command_data: bytes):
+        self.written.append(command_data)
+
+    def read(self, timeout=None, command=None) -> bytes:
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def export_response(total_length: int, fragment: bytes) -> bytes:
+    return bytes([0x90, 0x00]) + total_length.to_bytes(8, "big") + fragment
+
+
+class TestSendStream(TestCase):
+    def make_transport(self, responses) -> Transport:
+        self.msc = ScriptedMscTransport(responses)
+        with mock.patch.object(msc_transport, "MscTransport", return_value=self.msc):
+            return Transport("/nonexistent")
+
+    def test_fragments(self):
+        transport = self.make_transport([export_response(6, b"ab"), b"cd", b"ef"])
+
+        with transport.send_stream(TransportCommand.ExportData) as stream:
+            self.assertEqual(stream.total_length, 6)
+            self.assertEqual(list(stream), [b"ab", b"cd", b"ef"])
+            self.assertTrue(stream.complete)
+        self.assertEqual(
+            self.msc.written[1:], [TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ] * 2
+        )
+
+    def test_send_joins_fragments(self):
+        transport = self.make_transport([export_response(4, b"ab"), b"cd"])
+
+        self.assertEqual(transport.send(TransportCommand.ExportData), b"abcd")
+
+    def test_close_aborts_incomplete_read(self):
+        transport = self.make_transport([export_response(6, b"ab"), b"cd"])
+
+        with transport.send_stream(TransportCommand.ExportData) as stream:
+            next(stream)
+            next(stream)
+        self.assertEqual(self.msc.written[-1], TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ)
+        self.assertEqual(list(stream), [])
+
+    def test_error_aborts_read(self):
+        transport = self.make_transport(
+            [export_response(6, b"ab"), TransportErrorNoDataAvailable()]
+        )
+
+        with self.assertRaises(TransportErrorNoDataAvailable):
+            transport.send(TransportCommand.ExportData)
+        self.assertEqual(self.msc.written[-1], TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ)
+        self.assertEqual(
+            self.msc.written.count(TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ), 1
+        )
@@ -1,9 +1,14 @@
+import hashlib
 import logging
-from unittest import TestCase
+import os
+import tempfile
+from unittest import TestCase, mock
 
 TSE_PATH = "/media/leon/304C-D627"
 
-from bdr_tse import tse_connector
+from bdr_tse import msc_transport, tse_connector
+from bdr_tse.test_transport import ScriptedMscTransport, export_response
+from bdr_tse.transport_errors import TransportErrorSECommunicationFailed
 
 
 class TestTseConnector(TestCase):
@@ -15,3 +20,52 @@ class TestTseConnector(TestCase):
     def test_get_pin_status(self):
         print(self.tse.start())
         print(self.tse.get_pin_status())
+
+
+class TestExportToFile(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.path = os.path.join(self.tempdir.name, "export.tar")
+
+    def make_connector(self, responses) -> tse_connector.TseConnector:
+        self.msc = ScriptedMscTransport(responses)
+        with mock.patch.object(msc_transport, "MscTransport", return_value=self.msc):
+            return tse_connector.TseConnector("/nonexistent")
+
+    def test_export_to_file(self):
+        tse = self.make_connector([export_response(6, b"ab"), b"cd", b"ef"])
+        progress = []
+
+        result = tse.export_to_file(self.path, progress=lambda *p: progress.append(p))
+
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"abcdef")
+        self.assertEqual(result["size"], 6)
+        self.assertEqual(result["sha256"], hashlib.sha256(b"abcdef").hexdigest())
+        self.assertEqual(progress, [(2, 6), (4, 6), (6, 6)])
+
+    def test_failed_export_removes_file(self):
+        tse = self.make_connector(
+            [export_response(6, b"ab"), TransportErrorSECommunicationFailed()]
+        )
+
+        with self.assertRaises(TransportErrorSECommunicationFailed):
+            tse.export_to_file(self.path)
+        self.assertEqual(os.listdir(self.tempdir.name), [])
+
+    def test_failed_export_keeps_previous_file(self):
+        with open(self.path, "wb") as f:
+            f.write(b"previous")
+        tse = self.make_connector([TransportErrorSECommunicationFailed()])
+
+        with self.assertRaises(TransportErrorSECommunicationFailed):
+            tse.export_to_file(self.path)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), b"previous")
+        self.assertEqual(os.listdir(self.tempdir.name), ["export.tar"])
+
+    def test_unwritable_path(self):
+        tse = self.make_connector([])
+        with self.assertRaises(FileNotFoundError):
+            tse.export_to_file(os.path.join(self.tempdir.name, "missing", "x.tar"))
@@ -0,0 +1,128 @@
+from unittest import TestCase
+from unittest.mock import patch
+import time
+
+from bdr_tse.emulator import EmulatorTransport, TseEmulator
+from bdr_tse.transport import Transport, TransportCommand
+from bdr_tse.transport_errors import TransportErrorNoTransaction
+from bdr_tse.tse_connector import TseConnector
+from bdr_tse.update_buffer import UpdateBuffer
+from bdr_tse.worker import DeviceWorker
+
+
+class TestUpdateBuffer(TestCase):
+    def setUp(self):
+        self.emulator = TseEmulator()
+        self.tse = TseConnector(backend=EmulatorTransport(self.emulator))
+        self.number = self.tse.start_transaction("POS-1", b"", "type")[
+            "transaction_number"
+        ]
+
+    def updates(self):
+        """The process data of the updates the TSE logged."""
+        return [
+            message.process_data
+            for _, message in self.emulator.log_messages
+            if message.operation_type == "UpdateTransaction"
+        ]
+
+    def test_update_transaction(self):
+        response = self.tse.update_transaction(self.number, "POS-1", b"data", "type")
+        self.assertEqual(response["signature_counter"], 2)
+        self.assertEqual(response["serial_number"], self.emulator.serial_number)
+        self.assertEqual(self.updates(), [b"data"])
+        with self.assertRaises(TransportErrorNoTransaction):
+            self.tse.update_transaction(self.number, "POS-2", b"data", "type")
+
+    def test_merge(self):
+        buffer = UpdateBuffer(self.tse, max_delay=60)
+        for item in (b"a", b"b", b"c"):
+            self.assertEqual(buffer.update(self.number, "POS-1", item, "type"), [])
+        self.assertEqual(buffer.pending[self.number].count, 3)
+        self.assertEqual(self.updates(), [])
+
+        # Another process type is not merged
+        responses = buffer.update(self.number, "POS-1", b"d", "other")
+        self.assertEqual(len(responses), 1)
+        self.assertEqual(self.updates(), [b"abc"])
+
+        buffer.finish_transaction(self.number, "POS-1", b"", "type", b"")
+        self.assertEqual(self.updates(), [b"abc", b"d"])
+        self.assertEqual((buffer.received, buffer.sent), (4, 2))
+        self.assertEqual(buffer.pending, {})
+        self.assertEqual(self.emulator.open_transactions, {})
+
+    def test_max_size(self):
+        buffer = UpdateBuffer(self.tse, max_delay=60, max_size=4)
+        buffer.update(self.number, "POS-1", b"abc", "type")
+        # Would exceed max_size, so the pending update is sent first
+        buffer.update(self.number, "POS-1", b"de", "type")
+        buffer.update(self.number, "POS-1", b"fg", "type")
+        self.assertEqual(self.updates(), [b"abc", b"defg"])
+        self.assertEqual(buffer.pending, {})
+
+    def test_max_delay(self):
+        buffer = UpdateBuffer(self.tse, max_delay=0.01)
+        buffer.update(self.number, "POS-1", b"a", "type")
+        self.assertEqual(buffer.flush_due(), [])
+        self.assertAlmostEqual(buffer.next_flush_in(), 0.01, delta=0.01)
+        time.sleep(0.02)
+        self.assertEqual(len(buffer.flush_due()), 1)
+        self.assertIsNone(buffer.next_flush_in())
+        self.assertEqual(self.updates(), [b"a"])
+
+    def test_failed_update_is_kept(self):
+        buffer = UpdateBuffer(self.tse, max_delay=60)
+        buffer.update(self.number, "POS-1", b"a", "type")
+        with patch.object(
+            self.tse, "update_transaction", side_effect=TransportErrorNoTransaction
+        ):
+            with self.assertRaises(TransportErrorNoTransaction):
+                buffer.flush()
+        self.assertEqual(buffer.pending[self.number].process_data, b"a")
+        buffer.flush()
+        self.assertEqual(self.updates(), [b"a"])
+
+        buffer.update(self.number, "POS-1", b"b", "type")
+        buffer.discard(self.number)
+        self.assertEqual(buffer.flush(), [])
+
+    def test_failed_update_is_not_added(self):
+        buffer = UpdateBuffer(self.tse, max_delay=60, max_size=4)
+        buffer.update(self.number, "POS-1", b"ab", "type")
+        with patch.object(
+            self.tse, "update_transaction", side_effect=TransportErrorNoTransaction
+        ):
+            with self.assertRaises(TransportErrorNoTransaction):
+                buffer.update(self.number, "POS-1", b"cd", "type")
+        self.assertEqual(buffer.pending[self.number].process_data, b"ab")
+        self.assertEqual(buffer.received, 1)
+
+        # Repeating the update signs its data once
+        buffer.update(self.number, "POS-1", b"cd", "type")
+        self.assertEqual(self.updates(), [b"abcd"])
+
+    def test_due_update_of_transaction(self):
+        other = self.tse.start_transaction("POS-2", b"", "type")["transaction_number"]
+        buffer = UpdateBuffer(self.tse, max_delay=0.01)
+        buffer.update(self.number, "POS-1", b"a", "type")
+        buffer.update(other, "POS-2", b"x", "type")
+        time.sleep(0.02)
+        self.assertEqual(len(buffer.update(self.number, "POS-1", b"b", "type")), 1)
+        self.assertEqual(self.updates(), [b"ab"])
+        # Other transactions are left to flush_due
+        self.assertEqual(list(buffer.pending), [other])
+
+    def test_background(self):
+        worker = DeviceWorker(Transport(backend=EmulatorTransport(self.emulator)))
+        self.addCleanup(worker.close)
+        buffer = UpdateBuffer(worker.connector(), max_delay=0.01)
+        buffer.start()
+        self.addCleanup(buffer.stop)
+
+        buffer.update(self.number, "POS-1", b"a", "type")
+        deadline = time.monotonic() + 5
+        while self.emulator.command_counts.get(TransportCommand.UpdateTransaction) != 1:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.005)
+        self.assertEqual(self.updates(), [b"a"])
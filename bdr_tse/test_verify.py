@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+from unittest import TestCase, skipUnless
+
+try:
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, utils
+    from cryptography.x509.oid import NameOID
+except ImportError:
+    x509 = None
+
+from bdr_tse.log_messages import LogMessage
+from bdr_tse.test_log_messages import make_export, make_transaction_log
+from bdr_tse.verify import key_serial_number, verify_export
+
+
+def make_certificate(private_key) -> bytes:
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "TSE")])
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(private_key.public_key())
+        .serial_number(1)
+        .not_valid_before(datetime(2020, 1, 1))
+        .not_valid_after(datetime(2020, 1, 1) + timedelta(days=3650))
+        .sign(private_key, hashes.SHA256())
+    )
+    return certificate.public_bytes(serialization.Encoding.PEM)
+
+
+def sign(private_key, message: LogMessage) -> LogMessage:
+    """Sign message with an ecdsa-plain-SHA384 signature."""
+    message.serial_number = key_serial_number(private_key.public_key())
+    message.signature_value = bytes(96)
+    signed_data = LogMessage.decode(message.encode()).signed_data
+    r, s = utils.decode_dss_signature(
+        private_key.sign(signed_data, ec.ECDSA(hashes.SHA384()))
+    )
+    message.signature_value = r.to_bytes(48, "big") + s.to_bytes(48, "big")
+    return message
+
+
+@skipUnless(x509, "cryptography is not installed")
+class TestVerifyExport(TestCase):
+    def setUp(self):
+        self.private_key = ec.generate_private_key(ec.SECP384R1())
+        self.certificate = make_certificate(self.private_key)
+        self.serial_number = key_serial_number(self.private_key.public_key())
+
+    def test_valid_signatures(self):
+        messages = [
+            sign(self.private_key, make_transaction_log(i, i, "POS", 1000 + i))
+            for i in range(1, 8)
+        ]
+        result = verify_export(
+            make_export(messages),
+            self.certificate,
+            serial_number=self.serial_number,
+            max_workers=2,
+            chunk_size=3,
+        )
+        self.assertEqual(result.verified, 7)
+        self.assertTrue(result.ok)
+
+    def test_failures_and_gaps(self):
+        messages = [
+            sign(self.private_key, make_transaction_log(i, i, "POS", 1000 + i))
+            for i in [1, 2, 3, 6, 7, 10]
+        ]
+        # Tamper with a signed message
+        messages[1].process_data = b"Beleg^0.00"
+        result = verify_export(make_export(messages), self.certificate, max_workers=1)
+        self.assertEqual(result.verified, 5)
+        self.assertEqual(result.failures, [2])
+        self.assertEqual(result.gaps, [(4, 5), (8, 9)])
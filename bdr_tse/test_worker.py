@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+import threading
+
+from bdr_tse import msc_transport
+from bdr_tse.emulator import EmulatorTransport, TseEmulator
+from bdr_tse.transport import Transport, TransportCommand
+from bdr_tse.transport_errors import TransportErrorNoTransaction
+from bdr_tse.worker import DeviceWorker
+
+
+class TestDeviceWorker(TestCase):
+    def setUp(self):
+        self.emulator = TseEmulator(fragment_length=1000, default_latency=0.0005)
+        self.worker = DeviceWorker(
+            Transport(
+                backend=EmulatorTransport(
+                    self.emulator,
+                    default_polling_profile=msc_transport.PollingProfile(
+                        spin_time=0.001, initial_interval=0.0005, max_interval=0.002
+                    ),
+                )
+            )
+        )
+        self.addCleanup(self.worker.close)
+        self.tse = self.worker.connector()
+
+    def test_threads_share_the_tse(self):
+        def run_transactions(client_id):
+            for _ in range(10):
+                started = self.tse.start_transaction(client_id, b"", "")
+                self.tse.finish_transaction(
+                    started["transaction_number"], client_id, b"", "", b""
+                )
+            return client_id
+
+        with ThreadPoolExecutor(8) as executor:
+            clients = ["POS-{}".format(i) for i in range(8)]
+            self.assertEqual(list(executor.map(run_transactions, clients)), clients)
+
+        self.assertEqual(
+            self.emulator.command_counts[TransportCommand.FinishTransaction], 80
+        )
+        started = self.tse.start_transaction("POS-1", b"", "")
+        self.assertEqual(started["transaction_number"], 81)
+        self.assertEqual(started["signature_counter"], 161)
+
+    def test_batches(self):
+        started, release = threading.Event(), threading.Event()
+
+        def block(transport):
+            started.set()
+            release.wait()
+
+        self.worker.submit(block)
+        started.wait()
+        futures = [self.worker.submit(lambda transport, i: i, i) for i in range(5)]
+        release.set()
+
+        self.assertEqual([f.result() for f in futures], list(range(5)))
+        self.assertIn(5, self.worker.batch_sizes)
+
+    def test_idle_jobs_wait_for_other_jobs(self):
+        started, release = threading.Event(), threading.Event()
+        order = []
+
+        def block(transport):
+            started.set()
+            release.wait()
+
+        self.worker.submit(block)
+        started.wait()
+        idle = self.worker.submit_idle(lambda transport: order.append("idle"))
+        job = self.worker.submit(lambda transport: order.append("job"))
+        release.set()
+        idle.result()
+        job.result()
+        self.assertEqual(order, ["job", "idle"])
+
+        # Idle jobs that did not start are cancelled on close
+        self.worker.submit(block)
+        release.clear()
+        started.clear()
+        self.worker.submit(block)
+        started.wait()
+        idle = self.worker.submit_idle(lambda transport: order.append("idle"))
+        self.worker.close(timeout=0)
+        release.set()
+        self.worker.close()
+        self.assertTrue(idle.cancelled())
+
+    def test_errors(self):
+        with self.assertRaises(TransportErrorNoTransaction):
+            self.tse.finish_transaction(1000, "POS-1", b"", "", b"")
+
+    def test_stream(self):
+        self.tse.start_transaction("POS-1", b"", "")
+        data = self.tse.export_data()
+
+        fragments = list(self.tse.export_data_iter())
+        self.assertGreater(len(fragments), 1)
+        self.assertEqual(b"".join(fragments), data)
+
+        # Closing the stream early aborts it and frees the worker
+        iterator = self.tse.export_data_iter()
+        next(iterator)
+        iterator.close()
+        self.assertEqual(self.tse.export_data(), data)
+
+    def test_stream_in_job(self):
+        self.tse.start_transaction("POS-1", b"", "")
+        data = self.tse.export_data()
+
+        # More fragments than are read ahead, e.g. from a hook
+        self.emulator.fragment_length = 10
+        fragments = self.worker.submit(
+            lambda transport: list(self.tse.export_data_iter())
+        ).result(timeout=10)
+        self.assertGreater(len(fragments), 4)
+        self.assertEqual(b"".join(fragments), data)
+
+    def test_close(self):
+        self.worker.close()
+        with self.assertRaises(RuntimeError):
+            self.tse.get_serial_number()
@@ -0,0 +1,194 @@
+"""Keeping the time of the TSE set without delaying transactions.
+
+The TSE refuses to sign once its time was not updated within the time sync
+interval that it reports. Updating the time right before a transaction costs the
+transaction an authentication of the TimeAdmin and another command.
+:class:`TimeSync` updates the time in the background instead, well before the
+interval runs out::
+
+    worker = DeviceWorker(Transport("/media/tse"))
+    tse = worker.connector()
+    time_sync = TimeSync(tse, time_admin_pin=b"...", worker=worker)
+    time_sync.start()
+
+    started = time_sync.call(tse.start_transaction, "POS-1", b"", "")
+
+With a :class:`~bdr_tse.worker.DeviceWorker`, the commands of the update are
+submitted as one job with :meth:`~bdr_tse.worker.DeviceWorker.submit_idle`, so
+that they only reach the TSE when no other commands are waiting. Should the
+worker stay busy until ``urgent_margin`` of the interval has passed, the update
+is queued like any other command instead, so that the TSE does not stop signing.
+Without a worker, the connector must not be used by other threads, so call
+:meth:`TimeSync.sync_if_due` between transactions instead of starting the
+background thread.
+
+If the TSE rejects a command because its time is not set, e.g. after it lost
+power, :meth:`TimeSync.call` updates the time right away and retries the command.
+"""
+
+from typing import Callable, Optional
+import concurrent.futures
+import logging
+import threading
+import time
+
+from bdr_tse.transport_errors import TransportErrorTimeNotSet
+from bdr_tse.tse_connector import TseConnector
+from bdr_tse.worker import DeviceWorker
+
+logger = logging.getLogger(__name__)
+
+
+class TimeSync:
+    """Updates the time of a TSE before its time sync interval runs out."""
+
+    def __init__(
+        self,
+        connector: TseConnector,
+        time_admin_pin: bytes,
+        worker: Optional[DeviceWorker] = None,
+        margin: float = 0.5,
+        urgent_margin: float = 0.8,
+        retry_interval: float = 10.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        :param connector: The connector of the TSE.
+        :param time_admin_pin: The PIN of the TimeAdmin user.
+        :param worker: The worker that ``connector`` sends its commands through,
+            if any. The time is then only updated while the worker is idle.
+        :param margin: The fraction of the time sync interval after which the
+            time is updated.
+        :param urgent_margin: The fraction of the time sync interval after
+            which the time is updated without waiting for the worker to be idle.
+        :param retry_interval: The time in seconds to wait after a failed
+            update before the background thread tries again.
+        :param clock: Returns the current UNIX time, which is set on the TSE.
+        """
+        self.connector = connector
+        self.time_admin_pin = time_admin_pin
+        self.worker = worker
+        self.margin = margin
+        self.urgent_margin = urgent_margin
+        self.retry_interval = retry_interval
+        self.clock = clock
+        #: The :func:`time.monotonic` time of the last successful update
+        self.last_sync: Optional[float] = None
+        self._interval: Optional[int] = None
+        # Held while updating without a worker, which sends the commands of an
+        # update as one job instead
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def interval(self) -> int:
+        """The time sync interval of the TSE in seconds, read from the TSE once."""
+        if self._interval is None:
+            self._interval = self.connector.get_time_sync_interval()
+        return self._interval
+
+    def next_sync_in(self) -> float:
+        """The time in seconds until the time is due to be updated."""
+        if self.last_sync is None:
+            return 0.0
+        return max(0.0, self.last_sync + self.interval * self.margin - time.monotonic())
+
+    def urgent_in(self) -> float:
+        """The time in seconds until the time is updated without waiting for
+        the worker to be idle."""
+        if self.last_sync is None:
+            # It is unknown when the time was updated last
+            return 0.0
+        return max(
+            0.0,
+            self.last_sync + self.interval * self.urgent_margin - time.monotonic(),
+        )
+
+    def sync(self, idle: bool = False):
+        """Update the time of the TSE, authenticating as TimeAdmin for it.
+
+        :param idle: Only send the commands while the worker is idle, unless
+            the update becomes urgent while waiting, see :meth:`urgent_in`.
+        """
+        if self.worker is None:
+            with self._lock:
+                self._update()
+        elif idle and self.urgent_in() > 0:
+            future = self.worker.submit_idle(self._update_job)
+            try:
+                future.result(self.urgent_in())
+            except concurrent.futures.TimeoutError:
+                if not future.cancel():
+                    # Started in the meantime
+                    future.result()
+                else:
+                    logger.warning("The TSE is busy, updating its time anyway")
+                    self.worker.submit(self._update_job).result()
+        else:
+            self.worker.submit(self._update_job).result()
+        logger.debug("Updated the time of the TSE")
+
+    def _update_job(self, transport):
+        # The commands of the connector are sent right away in the worker thread
+        self._update()
+
+    def _update(self):
+        self.connector.authenticate_user(
+            TseConnector.UserId.TIME_ADMIN, self.time_admin_pin
+        )
+        try:
+            self.connector.update_time(int(self.clock()))
+        finally:
+            self.connector.logout(TseConnector.UserId.TIME_ADMIN)
+        self.last_sync = time.monotonic()
+
+    def sync_if_due(self) -> bool:
+        """Update the time if it is due.
+
+        :return: Whether the time was updated.
+        """
+        if self.next_sync_in() > 0:
+            return False
+        self.sync(idle=True)
+        return True
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Call a command like ``connector.start_transaction``. If the TSE
+        rejects it because its time is not set, update the time and retry."""
+        try:
+            return fn(*args, **kwargs)
+        except TransportErrorTimeNotSet:
+            logger.warning("The time of the TSE is not set, updating it")
+            self.sync()
+            return fn(*args, **kwargs)
+
+    def start(self):
+        """Update the time in a background thread whenever it is due. The
+        connector must be usable from other threads, e.g. a connector of
+        ``worker``."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="bdr-tse-time-sync", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        wait = 0.0
+        while not self._stop.wait(wait):
+            try:
+                self.sync_if_due()
+            except Exception:
+                logger.exception("Updating the time of the TSE failed")
+                wait = self.retry_interval
+            else:
+                wait = self.next_sync_in()
@@ -0,0 +1,101 @@
+"""Hooks for tracing the commands sent to the TSE.
+
+Register a :class:`TransportHook` with :meth:`~bdr_tse.transport.Transport.add_hook`
+to be called at the start and the end of every command, e.g. to forward the
+commands to a tracing system::
+
+    class TracingHook(TransportHook):
+        def on_start(self, span):
+            span.context["span"] = tracer.start_span(span.command.name)
+
+        def on_end(self, span):
+            span.context["span"].end()
+
+When no hooks are registered, commands are not traced at all.
+"""
+
+from typing import Any, Dict, List, Optional
+import time
+
+#: Values of :attr:`Span.outcome`
+OUTCOME_OK = "ok"
+OUTCOME_ERROR = "error"
+OUTCOME_ABORTED = "aborted"
+
+
+class Span:
+    """A command sent to the TSE, from encoding the command until the last
+    fragment of the response was read."""
+
+    __slots__ = (
+        "command",
+        "param_sizes",
+        "command_size",
+        "response_size",
+        "error",
+        "aborted",
+        "start_time",
+        "end_time",
+        "context",
+    )
+
+    def __init__(self, command, param_sizes: List[int]):
+        #: The :class:`~bdr_tse.transport.TransportCommand`
+        self.command = command
+        #: The sizes of the values of the parameters of the command, in bytes
+        self.param_sizes = param_sizes
+        #: The size of the encoded command, in bytes
+        self.command_size: Optional[int] = None
+        #: The size of the response data read from the TSE, in bytes
+        self.response_size: Optional[int] = None
+        #: The exception that the command failed with, e.g. one of the
+        #: exceptions of :data:`~bdr_tse.transport.TRANSPORT_ERROR_CODES`
+        self.error: Optional[BaseException] = None
+        #: Whether reading the response was aborted before it was complete
+        self.aborted = False
+        #: :func:`time.perf_counter` at the start and the end of the command
+        self.start_time = time.perf_counter()
+        self.end_time: Optional[float] = None
+        #: For hooks to keep their own state of the span in
+        self.context: Dict[str, Any] = {}
+
+    @property
+    def error_class(self) -> Optional[type]:
+        """The class of :attr:`error`."""
+        return type(self.error) if self.error is not None else None
+
+    @property
+    def outcome(self) -> str:
+        """One of ``ok``, ``error`` or ``aborted``."""
+        if self.error is not None:
+            return OUTCOME_ERROR
+        if self.aborted:
+            return OUTCOME_ABORTED
+        return OUTCOME_OK
+
+    @property
+    def duration(self) -> Optional[float]:
+        """The duration of the command in seconds, once it has ended."""
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+    def __repr__(self):
+        return "Span(command={!r}, outcome={!r}, duration={!r})".format(
+            self.command, self.outcome, self.duration
+        )
+
+
+class TransportHook:
+    """Base class of hooks that are called for every command sent to the TSE.
+
+    Hooks are called synchronously while the command is sent, so they should be
+    fast. Exceptions raised by hooks are logged and otherwise ignored.
+    """
+
+    def on_start(self, span: Span):
+        """Called before a command is sent."""
+
+    def on_end(self, span: Span):
+        """Called once the response to a command has been read completely, the
+        reading was aborted or the command failed."""
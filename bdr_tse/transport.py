@@ -1,14 +1,16 @@
-from typing import Tuple, List, Union
+from typing import Any, Deque, Dict, Mapping, Optional, Tuple, List, Union
 import enum
+import functools
 import logging
-
-import construct
+import time
 
 from bdr_tse import msc_transport
 from bdr_tse import exceptions
+from bdr_tse.backends import TransportBackend
+from bdr_tse.metrics import TransportMetrics
+from bdr_tse.tracing import Span, TransportHook
 from bdr_tse.transport_errors import *
 
-
 logger = logging.getLogger(__name__)
 
 TRANSPORT_ERROR_CODES = {
@@ -115,123 +117,537 @@ class TransportDataType:
 
 TransportDataTupleType = Tuple[TransportDataType, Union[bytes, int, str, List[int]]]
 
-TRANSPORT_DATA_PARAMETER = construct.Select(
-    # BYTE
-    construct.Struct(
-        "data_type" / construct.Const(bytes([TransportDataType.BYTE])),
-        construct.Const(bytes([0x00, 0x01])),
-        "data" / construct.Byte,
-    ),
-    # BYTE_ARRAY
-    construct.Struct(
-        "data_type" / construct.Const(bytes([TransportDataType.BYTE_ARRAY])),
-        "data" / construct.Prefixed(construct.Int16ub, construct.GreedyBytes),
-    ),
-    # SHORT
-    construct.Struct(
-        "data_type" / construct.Const(bytes([TransportDataType.SHORT])),
-        construct.Const(bytes([0x00, 0x02])),
-        "data" / construct.Int16ub,
-    ),
-    # STRING
-    construct.Struct(
-        "data_type" / construct.Const(bytes([TransportDataType.STRING])),
-        "data" / construct.Prefixed(construct.Int16ub, construct.GreedyString("ascii")),
-    ),
-    # LONG_ARRAY
-    construct.Struct(
-        "data_type" / construct.Const(bytes([TransportDataType.LONG_ARRAY])),
-        construct.Const(bytes([0x00, 0x02])),
-        "data"
+TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ = bytes([0xC5])
+TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ = bytes([0xC4])
+
+
+@functools.lru_cache(maxsize=None)
+def _structs() -> Dict[str, Any]:
+    """Build the construct definitions of the packets.
+
+    They are only built when first used, as importing construct and building
+    them takes a large part of the import time of the package. The transport
+    itself does not use them, see :func:`encode_transport_command` and
+    :func:`decode_transport_result`.
+    """
+    import construct
+
+    TRANSPORT_DATA_PARAMETER = construct.Select(
+        # BYTE
+        construct.Struct(
+            "data_type" / construct.Const(bytes([TransportDataType.BYTE])),
+            construct.Const(bytes([0x00, 0x01])),
+            "data" / construct.Byte,
+        ),
+        # BYTE_ARRAY
+        construct.Struct(
+            "data_type" / construct.Const(bytes([TransportDataType.BYTE_ARRAY])),
+            "data" / construct.Prefixed(construct.Int16ub, construct.GreedyBytes),
+        ),
+        # SHORT
+        construct.Struct(
+            "data_type" / construct.Const(bytes([TransportDataType.SHORT])),
+            construct.Const(bytes([0x00, 0x02])),
+            "data" / construct.Int16ub,
+        ),
+        # STRING
+        construct.Struct(
+            "data_type" / construct.Const(bytes([TransportDataType.STRING])),
+            "data"
+            / construct.Prefixed(construct.Int16ub, construct.GreedyString("ascii")),
+        ),
+        # LONG_ARRAY
+        construct.Struct(
+            "data_type" / construct.Const(bytes([TransportDataType.LONG_ARRAY])),
+            construct.Const(bytes([0x00, 0x02])),
+            "data"
+            / construct.Prefixed(
+                construct.Int16ub, construct.GreedyRange(construct.Int32ub)
+            ),
+        ),
+    )
+
+    TRANSPORT_COMMAND_PACKET = construct.Struct(
+        construct.Const(bytes([0x5C, 0x54])),
+        "command" / construct.Int16ub,
+        "command_data"
         / construct.Prefixed(
-            construct.Int16ub, construct.GreedyRange(construct.Int32ub)
+            construct.Int16ub, construct.GreedyRange(TRANSPORT_DATA_PARAMETER)
         ),
-    ),
-)
+    )
 
-TRANSPORT_COMMAND_PACKET = construct.Struct(
-    construct.Const(bytes([0x5C, 0x54])),
-    "command" / construct.Int16ub,
-    "command_data"
-    / construct.Prefixed(
-        construct.Int16ub, construct.GreedyRange(TRANSPORT_DATA_PARAMETER)
-    ),
+    TRANSPORT_ERROR_RESPONSE_PACKET = construct.Struct("error_code" / construct.Int16ub)
+
+    TRANSPORT_EXPORT_DATA_RESPONSE_PACKET = construct.Struct(
+        construct.Const(bytes([0x90, 0x00])),
+        "response_data_length"
+        / construct.Rebuild(
+            construct.Int64ub, construct.len_(construct.this.response_data)
+        ),
+        "response_data" / construct.GreedyBytes,
+    )
+
+    TRANSPORT_RESPONSE_PACKET = construct.Struct(
+        "response_data_length"
+        / construct.Rebuild(
+            construct.Int16ub, construct.len_(construct.this.response_data)
+        ),
+        "response_data" / construct.GreedyBytes,
+    )
+
+    TRANSPORT_RESULT = construct.GreedyRange(TRANSPORT_DATA_PARAMETER)
+
+    return {
+        "TRANSPORT_DATA_PARAMETER": TRANSPORT_DATA_PARAMETER,
+        "TRANSPORT_COMMAND_PACKET": TRANSPORT_COMMAND_PACKET,
+        "TRANSPORT_ERROR_RESPONSE_PACKET": TRANSPORT_ERROR_RESPONSE_PACKET,
+        "TRANSPORT_EXPORT_DATA_RESPONSE_PACKET": TRANSPORT_EXPORT_DATA_RESPONSE_PACKET,
+        "TRANSPORT_RESPONSE_PACKET": TRANSPORT_RESPONSE_PACKET,
+        "TRANSPORT_RESULT": TRANSPORT_RESULT,
+    }
+
+
+# The construct definitions of the packets, see _structs
+_STRUCT_NAMES = frozenset(
+    {
+        "TRANSPORT_DATA_PARAMETER",
+        "TRANSPORT_COMMAND_PACKET",
+        "TRANSPORT_ERROR_RESPONSE_PACKET",
+        "TRANSPORT_EXPORT_DATA_RESPONSE_PACKET",
+        "TRANSPORT_RESPONSE_PACKET",
+        "TRANSPORT_RESULT",
+    }
 )
 
-TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ = bytes([0xC5])
-TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ = bytes([0xC4])
 
-TRANSPORT_ERROR_RESPONSE_PACKET = construct.Struct("error_code" / construct.Int16ub)
+def __getattr__(name: str):
+    # Makes the construct definitions available as module attributes
+    if name in _STRUCT_NAMES:
+        return _structs()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+class TransportDataParameter:
+    """A single parameter of a response, as returned by
+    :func:`decode_transport_result`.
+
+    The parameter is only decoded when :attr:`data` is accessed. :attr:`view`
+    gives access to the raw value without copying it.
+    """
+
+    __slots__ = ("data_type", "_buf", "_start", "_end")
+
+    def __init__(self, data_type: int, buf: memoryview, start: int, end: int):
+        self.data_type = data_type
+        self._buf = buf
+        self._start = start
+        self._end = end
+
+    @property
+    def view(self) -> memoryview:
+        """The raw value of the parameter."""
+        return self._buf[self._start : self._end]
+
+    @property
+    def data(self) -> Union[bytes, int, str, List[int]]:
+        """The decoded value of the parameter, of the same type that
+        :data:`TRANSPORT_RESULT` would parse it to."""
+        view = self.view
+        if self.data_type == TransportDataType.BYTE_ARRAY:
+            return bytes(view)
+        elif self.data_type == TransportDataType.STRING:
+            return str(view, "ascii")
+        elif self.data_type == TransportDataType.LONG_ARRAY:
+            return [
+                int.from_bytes(view[i : i + 4], "big")
+                for i in range(0, len(view) - 3, 4)
+            ]
+        else:
+            return int.from_bytes(view, "big")
 
-TRANSPORT_EXPORT_DATA_RESPONSE_PACKET = construct.Struct(
-    construct.Const(bytes([0x90, 0x00])),
-    "response_data_length"
-    / construct.Rebuild(
-        construct.Int64ub, construct.len_(construct.this.response_data)
-    ),
-    "response_data" / construct.GreedyBytes,
-)
+    def __repr__(self):
+        return "TransportDataParameter(data_type={}, data={!r})".format(
+            self.data_type, self.data
+        )
 
-TRANSPORT_RESPONSE_PACKET = construct.Struct(
-    "response_data_length"
-    / construct.Rebuild(
-        construct.Int16ub, construct.len_(construct.this.response_data)
-    ),
-    "response_data" / construct.GreedyBytes,
-)
 
-TRANSPORT_RESULT = construct.GreedyRange(TRANSPORT_DATA_PARAMETER)
+# Fixed lengths of the data types that have them, the rest are length-prefixed
+_TRANSPORT_DATA_TYPE_LENGTHS = {
+    TransportDataType.BYTE: 1,
+    TransportDataType.SHORT: 2,
+}
+
+
+def _encode_parameter(data_type: int, data) -> bytes:
+    if data_type == TransportDataType.BYTE:
+        value = bytes([data])
+    elif data_type == TransportDataType.SHORT:
+        value = data.to_bytes(2, "big")
+    elif data_type == TransportDataType.STRING:
+        value = data.encode("ascii")
+    elif data_type == TransportDataType.LONG_ARRAY:
+        value = b"".join(v.to_bytes(4, "big") for v in data)
+        # LONG_ARRAY has a constant 0x0002 before the actual length
+        return bytes([data_type, 0x00, 0x02]) + len(value).to_bytes(2, "big") + value
+    elif data_type == TransportDataType.BYTE_ARRAY:
+        value = bytes(data)
+    else:
+        raise ValueError("Unknown data type {!r}".format(data_type))
+    return bytes([data_type]) + len(value).to_bytes(2, "big") + value
+
+
+def encode_transport_command(cmd, params: List[TransportDataTupleType]) -> bytes:
+    """Encode a command and its parameters.
+
+    Equivalent to building :data:`TRANSPORT_COMMAND_PACKET`, without going
+    through construct.
+    """
+    command_data = b"".join(_encode_parameter(p[0], p[1]) for p in params)
+    return (
+        bytes([0x5C, 0x54])
+        + cmd.to_bytes(2, "big")
+        + len(command_data).to_bytes(2, "big")
+        + command_data
+    )
+
+
+def decode_transport_result(data) -> List[TransportDataParameter]:
+    """Decode the parameters of a response.
+
+    Equivalent to ``TRANSPORT_RESULT.parse(data)``, but dispatches on the data
+    type tag of each parameter instead of trying every type in turn, and defers
+    decoding the values until they are accessed. Like :data:`TRANSPORT_RESULT`,
+    decoding stops at the first parameter that cannot be decoded.
+    """
+    buf = memoryview(data)
+    result = []
+    offset = 0
+    end = len(buf)
+    while offset + 3 <= end:
+        data_type = buf[offset]
+        length = int.from_bytes(buf[offset + 1 : offset + 3], "big")
+        start = offset + 3
+        if data_type in _TRANSPORT_DATA_TYPE_LENGTHS:
+            if length != _TRANSPORT_DATA_TYPE_LENGTHS[data_type]:
+                break
+        elif data_type == TransportDataType.LONG_ARRAY:
+            # LONG_ARRAY has a constant 0x0002 before the actual length
+            if length != 2 or start + 2 > end:
+                break
+            length = int.from_bytes(buf[start : start + 2], "big")
+            start += 2
+        elif data_type not in (TransportDataType.BYTE_ARRAY, TransportDataType.STRING):
+            break
+
+        if start + length > end:
+            break
+        result.append(TransportDataParameter(data_type, buf, start, start + length))
+        offset = start + length
+
+    return result
+
+
+# Transaction commands are usually answered within a few milliseconds, so poll
+# tightly for a little longer before backing off. Exports take long to prepare,
+# polling them tightly would only keep the USB bus busy.
+_TRANSACTION_POLLING_PROFILE = msc_transport.PollingProfile(
+    spin_time=0.01, initial_interval=0.001, max_interval=0.02
+)
+DEFAULT_POLLING_PROFILES = {
+    TransportCommand.StartTransaction: _TRANSACTION_POLLING_PROFILE,
+    TransportCommand.UpdateTransaction: _TRANSACTION_POLLING_PROFILE,
+    TransportCommand.FinishTransaction: _TRANSACTION_POLLING_PROFILE,
+    TransportCommand.ExportData: msc_transport.PollingProfile(
+        spin_time=0.0, initial_interval=0.01, max_interval=0.1
+    ),
+}
 
 
 class Transport:
-    def __init__(self, tse_path):
-        self._transport = msc_transport.MscTransport(tse_path)
+    def __init__(
+        self,
+        tse_path=None,
+        polling_profiles: Optional[
+            Mapping[TransportCommand, msc_transport.PollingProfile]
+        ] = None,
+        backend: Optional[TransportBackend] = None,
+        metrics: Optional[TransportMetrics] = None,
+    ):
+        """
+        :param tse_path: The path where the TSE is mounted.
+        :param polling_profiles: Overrides for the
+            :class:`~bdr_tse.msc_transport.PollingProfile` used for each command.
+            Commands not given here use :data:`DEFAULT_POLLING_PROFILES`.
+        :param backend: The :class:`~bdr_tse.backends.TransportBackend` that
+            exchanges command and response data with the TSE, instead of a
+            :class:`~bdr_tse.msc_transport.MscTransport` for ``tse_path``.
+            ``polling_profiles`` is ignored if a backend is given.
+        :param metrics: Record the latency of the commands into this
+            :class:`~bdr_tse.metrics.TransportMetrics`.
+        """
+        if backend is None:
+            backend = msc_transport.MscTransport(
+                tse_path,
+                polling_profiles={
+                    **DEFAULT_POLLING_PROFILES,
+                    **(polling_profiles or {}),
+                },
+            )
+        self._transport = backend
+        self.metrics = metrics
+        self._hooks: List[TransportHook] = []
+
+    def close(self):
+        """Close the backend."""
+        self._transport.close()
+
+    def add_hook(self, hook: TransportHook):
+        """Register a :class:`~bdr_tse.tracing.TransportHook` to be called for
+        every command."""
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: TransportHook):
+        self._hooks.remove(hook)
+
+    @property
+    def poll_counts(self) -> Dict[Any, Deque[int]]:
+        """The number of polls that the most recent responses to each command
+        needed. Empty if the backend does not record them."""
+        return getattr(self._transport, "poll_counts", {})
 
     def _encode(self, cmd, params: List[TransportDataTupleType]) -> bytes:
-        return TRANSPORT_COMMAND_PACKET.build(
-            {
-                "command": cmd,
-                "command_data": list(
-                    {"data_type": bytes([p[0]]), "data": p[1]} for p in params
-                ),
-            }
-        )
+        return encode_transport_command(cmd, params)
 
     def _decode(self, data):
-        return TRANSPORT_RESPONSE_PACKET.parse(data)
+        return _structs()["TRANSPORT_RESPONSE_PACKET"].parse(data)
 
     def send(self, cmd, params: List[TransportDataTupleType] = []):
+        stream = self.send_stream(cmd, params)
+        return self._result(stream, b"".join(stream))
+
+    def _result(self, stream, full_response_data: bytes):
+        """Decode the complete response data read from ``stream``."""
+        cmd = stream.command
+        if stream.is_export_data_response:
+            return full_response_data
+        elif self.metrics is None:
+            return decode_transport_result(full_response_data)
+        else:
+            start = time.perf_counter()
+            result = decode_transport_result(full_response_data)
+            self.metrics.observe(cmd, "parse", time.perf_counter() - start)
+            return result
+
+    def send_stream(
+        self, cmd, params: List[TransportDataTupleType] = []
+    ) -> "ResponseStream":
+        """Send a command and return its response as a :class:`ResponseStream`
+        that reads the fragments of the response data as they are consumed.
+
+        Unlike :meth:`send`, the response data is not decoded.
+        """
+        if self.metrics is not None or self._hooks:
+            return self._send_stream_observed(cmd, params)
         self._transport.write(self._encode(cmd, params))
-        raw_response = self._transport.read()
+        return self._response_stream(cmd, self._transport.read(command=cmd))
 
+    def _response_stream(self, cmd, raw_response: bytes) -> "ResponseStream":
+        # Every response starts with a 16-bit status
+        if len(raw_response) < 2:
+            raise exceptions.ProtocolError("Response too short")
+        status = int.from_bytes(raw_response[:2], "big")
         # Response is an error response
-        if int.from_bytes(raw_response[:2], "big") in range(0x8000, 0x9000):
-            error_response = TRANSPORT_ERROR_RESPONSE_PACKET.parse(raw_response)
-            logger.debug("Received response with error code %s", error_response)
-            raise TRANSPORT_ERROR_CODES.get(
-                error_response.error_code, exceptions.BdrTseException
-            )
-        # Response is an ExportData response
-        elif int.from_bytes(raw_response[:2], "big") == 0x9000:
-            response = TRANSPORT_EXPORT_DATA_RESPONSE_PACKET.parse(raw_response)
+        if status in range(0x8000, 0x9000):
+            logger.debug("Received response with error code %s", hex(status))
+            raise TRANSPORT_ERROR_CODES.get(status, exceptions.BdrTseException)()
+        # Response is an ExportData response, with a 64-bit length after the status
+        elif status == 0x9000:
+            if len(raw_response) < 10:
+                raise exceptions.ProtocolError("Response too short")
+            response_data_length = int.from_bytes(raw_response[2:10], "big")
+            response_data = raw_response[10:]
             is_export_data_response = True
         else:
-            response = TRANSPORT_RESPONSE_PACKET.parse(raw_response)
+            response_data_length = status
+            response_data = raw_response[2:]
             is_export_data_response = False
 
-        # NOTE(Leon Handreke): This may have to become a generator for better memory
-        # efficiency in the future.
-        full_response_data: bytes = response.response_data
-
-        while len(full_response_data) < response.response_data_length:
-            self._transport.write(TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ)
-            try:
-                full_response_data += self._transport.read()
-            except exceptions.BdrTseException as e:
-                self._transport.write(TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ)
-                raise e
+        return ResponseStream(
+            self._transport,
+            cmd,
+            response_data,
+            response_data_length,
+            is_export_data_response,
+        )
 
-        if is_export_data_response:
-            return full_response_data
+    def _send_stream_observed(
+        self, cmd, params: List[TransportDataTupleType]
+    ) -> "ResponseStream":
+        """Like :meth:`send_stream`, but records metrics and calls the hooks."""
+        metrics = self.metrics
+        span = None
+        if self._hooks:
+            span = Span(cmd, [_param_size(p) for p in params])
+            self._call_hooks("on_start", span)
+        start = time.perf_counter()
+        try:
+            command_data = self._encode(cmd, params)
+            encoded = time.perf_counter()
+            self._transport.write(command_data)
+            written = time.perf_counter()
+            raw_response = self._transport.read(command=cmd)
+            if metrics is not None:
+                metrics.observe(cmd, "encode", encoded - start)
+                metrics.observe(cmd, "write", written - encoded)
+                self._observe_read(cmd, time.perf_counter() - written)
+            if span is not None:
+                span.command_size = len(command_data)
+            stream = self._response_stream(cmd, raw_response)
+        except BaseException as e:
+            if metrics is not None:
+                metrics.observe(cmd, "total", time.perf_counter() - start)
+            if span is not None:
+                span.error = e
+                self._end_span(span)
+            raise
+
+        stream._start = start
+        stream._span = span
+        stream._on_finish = self._finish_stream
+        if stream.complete:
+            # Responses that fit into a single fragment don't read any further
+            stream._finish()
+        return stream
+
+    def _observe_read(self, cmd, duration: float):
+        """Record the metrics of reading a response, split into the time until
+        the response was ready and the time taken to read it, if the backend
+        reports it."""
+        ready = getattr(self._transport, "last_ready_time", None)
+        if ready is None:
+            self.metrics.observe(cmd, "read", duration)
         else:
-            return TRANSPORT_RESULT.parse(full_response_data)
+            self.metrics.observe(cmd, "ready", ready)
+            self.metrics.observe(cmd, "read", max(duration - ready, 0.0))
+            self.metrics.observe(cmd, "polls", self._transport.last_poll_count)
+
+    def _finish_stream(self, stream: "ResponseStream", error: Optional[BaseException]):
+        if self.metrics is not None:
+            self.metrics.observe(stream.command, "fragments", stream.fragment_count)
+            self.metrics.observe(
+                stream.command, "total", time.perf_counter() - stream._start
+            )
+        span = stream._span
+        if span is not None:
+            span.response_size = stream.received_length
+            span.error = error
+            span.aborted = not stream.complete
+            self._end_span(span)
+
+    def _end_span(self, span: Span):
+        span.end_time = time.perf_counter()
+        self._call_hooks("on_end", span)
+
+    def _call_hooks(self, method: str, span: Span):
+        for hook in self._hooks:
+            try:
+                getattr(hook, method)(span)
+            except Exception:
+                logger.exception("Hook %r failed", hook)
+
+
+def _param_size(param: TransportDataTupleType) -> int:
+    data_type, value = param
+    if data_type in _TRANSPORT_DATA_TYPE_LENGTHS:
+        return _TRANSPORT_DATA_TYPE_LENGTHS[data_type]
+    elif data_type == TransportDataType.LONG_ARRAY:
+        return 4 * len(value)
+    return len(value)
+
+
+class ResponseStream:
+    """Iterator over the fragments of the response data of a command, as returned
+    by :meth:`Transport.send_stream`.
+
+    The first fragment has already been read when the stream is created, the
+    others are requested from the TSE one by one while iterating. If the stream
+    is closed before all fragments have been read, or reading a fragment fails,
+    the fragmented read is aborted on the TSE. The stream can be used as a
+    context manager that closes it on exit.
+    """
+
+    def __init__(
+        self,
+        transport,
+        command,
+        first_fragment: bytes,
+        total_length: int,
+        is_export_data_response: bool,
+    ):
+        self._transport = transport
+        self._next_fragment: Optional[bytes] = first_fragment
+        self._closed = False
+        self.command = command
+        #: The length of the complete response data, as announced by the TSE
+        self.total_length = total_length
+        #: The length of the response data read from the TSE so far
+        self.received_length = len(first_fragment)
+        #: The number of fragments read from the TSE so far
+        self.fragment_count = 1
+        self.is_export_data_response = is_export_data_response
+        # Called with the stream and the error it failed with, if any, once it
+        # is complete or closed, to record metrics and end the span
+        self._on_finish = None
+        self._start = 0.0
+        self._span: Optional[Span] = None
+
+    @property
+    def complete(self) -> bool:
+        """Whether all fragments have been read from the TSE."""
+        return self.received_length >= self.total_length
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self._next_fragment is not None:
+            fragment, self._next_fragment = self._next_fragment, None
+            return fragment
+        if self._closed or self.complete:
+            self._finish()
+            raise StopIteration
+
+        self._transport.write(TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ)
+        try:
+            fragment = self._transport.read(command=self.command)
+        except exceptions.BdrTseException as e:
+            self._abort()
+            self._finish(e)
+            raise
+        self.received_length += len(fragment)
+        self.fragment_count += 1
+        return fragment
+
+    def _finish(self, error: Optional[BaseException] = None):
+        if self._on_finish is not None:
+            on_finish, self._on_finish = self._on_finish, None
+            on_finish(self, error)
+
+    def close(self):
+        """Stop reading the response, aborting the fragmented read on the TSE if
+        it is not complete yet."""
+        self._next_fragment = None
+        if not self._closed and not self.complete:
+            self._abort()
+        self._closed = True
+        self._finish()
+
+    def _abort(self):
+        self._closed = True
+        self._transport.write(TRANSPORT_COMMAND_ABORT_FRAGMENTED_READ)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
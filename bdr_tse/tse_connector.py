@@ -1,18 +1,117 @@
-from typing import Tuple
+from typing import Any, Callable, Iterator, Mapping, Optional, Tuple
 import enum
-
+import functools
+
+from bdr_tse.backends import TransportBackend
+from bdr_tse.device_info import DeviceInfoCache
+from bdr_tse.export import (
+    ExportCheckpoint,
+    ExportFile,
+    PagedExport,
+    export_data_params,
+)
+from bdr_tse.metrics import TransportMetrics
+from bdr_tse.msc_transport import PollingProfile
+from bdr_tse.tracing import TransportHook
 from bdr_tse.transport import (
     TransportCommand,
     Transport,
     TransportDataType,
     GetConfigDataID,
 )
+from bdr_tse.transport_errors import TransportErrorNoDataAvailable
 
 
-class TseConnector:
-    def __init__(self, tse_path):
-        self._transport = Transport(tse_path)
+def _command(method):
+    """Decorator for the command methods of :class:`TseConnector`.
+
+    Command methods are written as generators that yield ``(command, params)``
+    for every command to send to the TSE and receive the decoded response, so
+    that :class:`~bdr_tse.aio.AsyncTseConnector` can reuse them with an
+    asynchronous transport. The undecorated generator function is available as
+    ``__wrapped__``.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return _run_command(self._transport, method(self, *args, **kwargs))
+
+    return wrapper
+
 
+def _run_command(transport: Transport, command):
+    """Drive a command generator, see :func:`_command`, by sending its commands
+    with ``transport``.
+
+    :return: The return value of the generator.
+    """
+    try:
+        request = next(command)
+        while True:
+            try:
+                response = transport.send(*request)
+            except BaseException as e:
+                request = command.throw(e)
+            else:
+                request = command.send(response)
+    except StopIteration as e:
+        return e.value
+
+
+class TseConnector:
+    def __init__(
+        self,
+        tse_path=None,
+        polling_profiles: Optional[Mapping[TransportCommand, PollingProfile]] = None,
+        backend: Optional[TransportBackend] = None,
+        metrics: Optional[TransportMetrics] = None,
+        transport: Optional[Transport] = None,
+        device_info: Optional[DeviceInfoCache] = None,
+    ):
+        """
+        :param tse_path: The path where the TSE is mounted.
+        :param polling_profiles: Overrides for how the TSE is polled while waiting
+            for the response to a command, see
+            :class:`~bdr_tse.msc_transport.PollingProfile`.
+        :param backend: Talk to the TSE through this
+            :class:`~bdr_tse.backends.TransportBackend` instead of the TSE mounted
+            at ``tse_path``.
+        :param metrics: Record the latency of the commands sent to the TSE into
+            this :class:`~bdr_tse.metrics.TransportMetrics`.
+        :param transport: Send the commands with this transport instead of
+            creating one, e.g. a :class:`~bdr_tse.worker.WorkerTransport` to share
+            the TSE between threads. ``tse_path``, ``polling_profiles``,
+            ``backend`` and ``metrics`` are ignored if a transport is given.
+        :param device_info: Cache the information about the TSE that does not
+            change in this :class:`~bdr_tse.device_info.DeviceInfoCache`, e.g. to
+            persist it. By default, it is cached in memory.
+        """
+        if transport is None:
+            transport = Transport(
+                tse_path,
+                polling_profiles=polling_profiles,
+                backend=backend,
+                metrics=metrics,
+            )
+        self._transport = transport
+        #: The :class:`~bdr_tse.device_info.DeviceInfoCache` of the TSE
+        self.device_info = device_info if device_info is not None else DeviceInfoCache()
+
+    @property
+    def metrics(self) -> Optional[TransportMetrics]:
+        """The metrics that the latency of commands is recorded into, if any."""
+        return self._transport.metrics
+
+    def add_hook(self, hook: TransportHook):
+        """Register a :class:`~bdr_tse.tracing.TransportHook` that is called for
+        every command sent to the TSE."""
+        self._transport.add_hook(hook)
+
+    def remove_hook(self, hook: TransportHook):
+        """Unregister a hook registered with :func:`~TseConnector.add_hook`."""
+        self._transport.remove_hook(hook)
+
+    @_command
     def start(self):
         """Initializes the secure element and loads configuration data.
 
@@ -21,19 +120,22 @@ class TseConnector:
             * ``version``: The version of the TSE.
             * ``serial``: The serial number of the TSE.
         """
-        response = self._transport.send(TransportCommand.Start)
-        return {
+        response = yield TransportCommand.Start, []
+        result = {
             "version": response[0].data,
             "serial": response[1].data,
         }
+        self.device_info.bind(result["serial"], result["version"])
+        return result
 
+    @_command
     def get_pin_status(self):
         """Returns the PIN/PUK transport states.
 
         Note that the value True means that the PIN is still in transport state. A
         fully-initialized TSE will return all as False.
         """
-        response = self._transport.send(TransportCommand.GetPinStates)
+        response = yield TransportCommand.GetPinStates, []
         states = response[0].data
         return {
             "admin_pin_transport_state": bool(states[0]),
@@ -42,6 +144,7 @@ class TseConnector:
             "time_admin_puk_transport_state": bool(states[3]),
         }
 
+    @_command
     def initialize_pin_values(
         self,
         admin_puk: bytes,
@@ -57,7 +160,7 @@ class TseConnector:
         :param time_admin_pin: The PUK to set for the TimeAdmin account. Must be exactly 8 bytes long.
 
         """
-        self._transport.send(
+        yield (
             TransportCommand.InitializePins,
             [
                 (TransportDataType.BYTE_ARRAY, admin_puk),
@@ -67,22 +170,26 @@ class TseConnector:
             ],
         )
 
+    @_command
     def factory_reset(self):
         """Resets the TSE to factory state.
 
         Note that this is only possible with TSE Engineering Samples.
         """
         # Magic factory reset procedure pulled from decompiled factory reset tool JAR
-        self._transport.send(
+        yield (
             TransportCommand.FactoryReset,
             [(TransportDataType.BYTE_ARRAY, bytes([160, 0, 0, 1, 81, 83, 80, 65]))],
         )
-        self._transport.send(
-            TransportCommand.FactoryReset, [(TransportDataType.BYTE_ARRAY, bytes([0]))]
+        yield (
+            TransportCommand.FactoryReset,
+            [(TransportDataType.BYTE_ARRAY, bytes([0]))],
         )
-        self._transport.send(
-            TransportCommand.FactoryReset, [(TransportDataType.BYTE_ARRAY, bytes([0]))]
+        yield (
+            TransportCommand.FactoryReset,
+            [(TransportDataType.BYTE_ARRAY, bytes([0]))],
         )
+        self.device_info.invalidate()
 
     class AuthenticationResult(enum.IntEnum):
         SUCCESS = 0
@@ -95,6 +202,7 @@ class TseConnector:
         ADMIN = "Admin"
         TIME_ADMIN = "TimeAdmin"
 
+    @_command
     def authenticate_user(self, user_id: UserId, pin: bytes):
         """Authenticate a user.
 
@@ -106,7 +214,7 @@ class TseConnector:
             * ``remaining_retries``: The number of authentication retries left. Only
               relevant after having failed authentication.
         """
-        response = self._transport.send(
+        response = yield (
             TransportCommand.AuthenticateUser,
             [
                 (TransportDataType.STRING, user_id.value),
@@ -120,6 +228,7 @@ class TseConnector:
             "remaining_retries": response[1].data,
         }
 
+    @_command
     def unblock_user(self, user_id: UserId, puk: bytes, new_pin: bytes):
         """This command unblocks a user that has been blocked due to too much failed
         authentication attempts against the stored credentials (PIN). It
@@ -130,7 +239,7 @@ class TseConnector:
         :param new_pin: The new PIN to set for the user.
         :return: A ``TransportDataType.AuthenticationResult``
         """
-        response = self._transport.send(
+        response = yield (
             TransportCommand.UnblockUser,
             [
                 (TransportDataType.STRING, user_id.value),
@@ -140,28 +249,31 @@ class TseConnector:
         )
         return TseConnector.AuthenticationResult(response[0].data)
 
+    @_command
     def update_time(self, time_: int):
         """Update the system time of the TSE.
 
         :param time_: The time to set as a UNIX timestamp.
         """
-        self._transport.send(
+        yield (
             TransportCommand.UpdateTime,
             [
                 (TransportDataType.BYTE_ARRAY, time_.to_bytes(8, "big")),
             ],
         )
 
+    @_command
     def logout(self, user_id: UserId):
         """Log out an authenticated user."""
-        self._transport.send(
-            TransportCommand.Logout, [(TransportDataType.STRING, user_id.value)]
-        )
+        yield (TransportCommand.Logout, [(TransportDataType.STRING, user_id.value)])
 
+    @_command
     def initialize(self):
         """Initialize the TSE."""
-        self._transport.send(TransportCommand.Initialize)
+        yield TransportCommand.Initialize, []
+        self.device_info.invalidate()
 
+    @_command
     def get_serial_number(self):
         """Get the key serial number from the TSE.
 
@@ -172,13 +284,29 @@ class TseConnector:
         does not have the ability to generate new keys after initialization,
         there will only ever be one key. This function instead returns the serial
         number of this one key.
-        """
 
-        response = self._transport.send(TransportCommand.GetSerialNumbers)
-        # This data is apparently ASN.1 encoded, but the examples supplied by the
-        # vendor just use bytes [6:32+6] to avoid parsing it.
-        return response[0].data[6 : 32 + 6]
+        The serial number is cached in :attr:`device_info`.
+        """
+        serial_number = self.device_info.get("serial_number")
+        if serial_number is None:
+            response = yield TransportCommand.GetSerialNumbers, []
+            # This data is apparently ASN.1 encoded, but the examples supplied by
+            # the vendor just use bytes [6:32+6] to avoid parsing it.
+            serial_number = response[0].data[6 : 32 + 6]
+            self.device_info.set("serial_number", serial_number)
+        return serial_number
+
+    @_command
+    def get_certificates(self) -> bytes:
+        """Get the certificates of the TSE, including the certificate of the key
+        that signs the log messages.
+
+        :return: The certificates as returned by the TSE.
+        """
+        response = yield TransportCommand.GetCertificates, []
+        return response[0].data
 
+    @_command
     def start_transaction(
         self,
         client_id: str,
@@ -204,7 +332,7 @@ class TseConnector:
             * `signature_value`: The signature value of the in-progress transaction.
             * `serial_number`: The serial number of the key that was used to sign.
         """
-        response = self._transport.send(
+        response = yield (
             TransportCommand.StartTransaction,
             [
                 (TransportDataType.STRING, client_id),
@@ -221,6 +349,43 @@ class TseConnector:
             "serial_number": response[4].data,
         }
 
+    @_command
+    def update_transaction(
+        self,
+        transaction_number: int,
+        client_id: str,
+        process_data: bytes,
+        process_type: str,
+    ):
+        """Updates an open transaction with further process data, e.g. the items
+        added to an order. To update a transaction less often than its data
+        changes, see :class:`~bdr_tse.update_buffer.UpdateBuffer`.
+
+        :param transaction_number: The transaction number to update.
+        :param client_id: The client ID.
+        :param process_data: Process data for the update.
+        :param process_type: Process type for the update.
+
+        :return: A dictionary with items identical to that returned in
+            :func:`~TseConnector.finish_transaction`.
+        """
+        response = yield (
+            TransportCommand.UpdateTransaction,
+            [
+                (TransportDataType.BYTE_ARRAY, transaction_number.to_bytes(4, "big")),
+                (TransportDataType.STRING, client_id),
+                (TransportDataType.BYTE_ARRAY, process_data),
+                (TransportDataType.STRING, process_type),
+            ],
+        )
+        return {
+            "signature_counter": int.from_bytes(response[0].data, "big"),
+            "log_time": int.from_bytes(response[1].data, "big"),
+            "signature_value": response[2].data,
+            "serial_number": response[3].data,
+        }
+
+    @_command
     def finish_transaction(
         self,
         transaction_number: int,
@@ -240,7 +405,7 @@ class TseConnector:
         :return: A dictionary with items identical to that returned in
             :func:`~TseConnector.start_transaction`.
         """
-        response = self._transport.send(
+        response = yield (
             TransportCommand.FinishTransaction,
             [
                 (TransportDataType.BYTE_ARRAY, transaction_number.to_bytes(4, "big")),
@@ -257,13 +422,14 @@ class TseConnector:
             "serial_number": response[3].data,
         }
 
+    @_command
     def map_ers_to_key(self, client_id: str, key_serial_number: bytes):
         """This command maps an ERS to a specific key.
 
         :param client_id: The client ID.
         :param key_serial_number: The key serial number.
         """
-        self._transport.send(
+        yield (
             TransportCommand.MapERStoKey,
             [
                 (TransportDataType.STRING, client_id),
@@ -271,6 +437,7 @@ class TseConnector:
             ],
         )
 
+    @_command
     def export_data(
         self,
         client_id: str = None,
@@ -282,29 +449,136 @@ class TseConnector:
         max_records: int = None,
     ):
         """Exports data from the TSE."""
-        response = self._transport.send(
+        response = yield (
             TransportCommand.ExportData,
-            [
-                (TransportDataType.STRING, client_id or ""),
-                (
-                    TransportDataType.BYTE_ARRAY,
-                    (transaction_number or 0xFFFFFFFF).to_bytes(4, "big"),
-                ),
-                (
-                    TransportDataType.BYTE_ARRAY,
-                    (start_transaction_number or 0x00000000).to_bytes(4, "big"),
-                ),
-                (
-                    TransportDataType.BYTE_ARRAY,
-                    (end_transaction_number or 0xFFFFFFFF).to_bytes(4, "big"),
-                ),
-                (
-                    TransportDataType.BYTE_ARRAY,
-                    (start_date or 0x0000000000000000).to_bytes(8, "big"),
+            export_data_params(
+                client_id=client_id,
+                transaction_number=transaction_number,
+                start_transaction_number=start_transaction_number,
+                end_transaction_number=end_transaction_number,
+                start_date=start_date,
+                end_date=end_date,
+                max_records=max_records,
+            ),
+        )
+        return response
+
+    def export_data_iter(
+        self,
+        client_id: str = None,
+        transaction_number: int = None,
+        start_transaction_number: int = None,
+        end_transaction_number: int = None,
+        start_date: int = None,
+        end_date: int = None,
+        max_records: int = None,
+        progress: Callable[[int, int], None] = None,
+    ) -> Iterator[bytes]:
+        """Exports data from the TSE, yielding the exported data in fragments as
+        they are read from the TSE. Takes the same parameters as
+        :func:`~TseConnector.export_data`.
+
+        If the iterator is closed before it is exhausted, the export is aborted.
+
+        :param progress: Called with the number of bytes read so far and the total
+            number of bytes after every fragment.
+        """
+        with self._transport.send_stream(
+            TransportCommand.ExportData,
+            export_data_params(
+                client_id=client_id,
+                transaction_number=transaction_number,
+                start_transaction_number=start_transaction_number,
+                end_transaction_number=end_transaction_number,
+                start_date=start_date,
+                end_date=end_date,
+                max_records=max_records,
+            ),
+        ) as stream:
+            for fragment in stream:
+                if progress:
+                    progress(stream.received_length, stream.total_length)
+                yield fragment
+
+    def export_to_file(
+        self,
+        path,
+        client_id: str = None,
+        transaction_number: int = None,
+        start_transaction_number: int = None,
+        end_transaction_number: int = None,
+        start_date: int = None,
+        end_date: int = None,
+        max_records: int = None,
+        progress: Callable[[int, int], None] = None,
+    ):
+        """Exports data from the TSE into a file, writing each fragment to the
+        file as it is read from the TSE. Takes the same parameters as
+        :func:`~TseConnector.export_data_iter`.
+
+        The data is written to a temporary file next to ``path``, which is
+        preallocated to the size announced by the TSE. It replaces ``path`` once
+        the export succeeded, and is removed if the export fails, so that a file
+        at ``path`` is never left incomplete.
+
+        :param path: The path of the file to write the exported data to.
+        :return: A dictionary containing
+
+            * ``size``: The number of bytes written.
+            * ``sha256``: The SHA-256 hash of the exported data, as a hex string.
+            * ``duration``: The duration of the export in seconds.
+            * ``bytes_per_second``: The average export rate.
+        """
+        export = ExportFile(path)
+        export.open()
+        try:
+            with self._transport.send_stream(
+                TransportCommand.ExportData,
+                export_data_params(
+                    client_id=client_id,
+                    transaction_number=transaction_number,
+                    start_transaction_number=start_transaction_number,
+                    end_transaction_number=end_transaction_number,
+                    start_date=start_date,
+                    end_date=end_date,
+                    max_records=max_records,
                 ),
+            ) as stream:
+                export.preallocate(stream.total_length)
+                for fragment in stream:
+                    export.write(fragment)
+                    if progress:
+                        progress(stream.received_length, stream.total_length)
+            export.commit()
+        except BaseException:
+            export.abort()
+            raise
+        return export.result()
+
+    @_command
+    def export_more_data(
+        self,
+        key_serial_number: bytes,
+        previous_signature_counter: int,
+        max_records: int = None,
+    ) -> bytes:
+        """Exports the log messages that follow a given log message.
+
+        :param key_serial_number: The serial number of the key that signed the log
+            messages, see :func:`~TseConnector.get_serial_number`.
+        :param previous_signature_counter: The signature counter of the last log
+            message that has already been exported. Use 0 to start from the
+            beginning.
+        :param max_records: The maximum number of log messages to export.
+        :return: The exported data as a tar archive.
+        """
+        response = yield (
+            TransportCommand.ExportMoreData,
+            [
+                (TransportDataType.BYTE_ARRAY, key_serial_number),
                 (
                     TransportDataType.BYTE_ARRAY,
-                    (end_date or 0xFFFFFFFFFFFFFFFF).to_bytes(8, "big"),
+                    previous_signature_counter.to_bytes(8, "big"),
                 ),
                 (
                     TransportDataType.BYTE_ARRAY,
@@ -314,10 +588,116 @@ class TseConnector:
         )
         return response
 
+    def export_data_paged(
+        self, checkpoint: ExportCheckpoint = None, page_size: int = 1000
+    ) -> Iterator[bytes]:
+        """Exports data from the TSE in pages of at most ``page_size`` log messages,
+        using :func:`~TseConnector.export_more_data`.
+
+        Each page is yielded as a separate tar archive. Once the consumer asks for
+        the next page, the previous one is considered processed and ``checkpoint``
+        is advanced past it and saved, so that a later export with the same
+        checkpoint resumes after the last processed page.
+
+        :param checkpoint: The :class:`~bdr_tse.export.ExportCheckpoint` to resume
+            from. If ``None``, all data is exported.
+        :param page_size: The maximum number of log messages per page.
+        """
+        pages = PagedExport(checkpoint, page_size)
+        key_serial_number = self.get_serial_number()
+
+        while not pages.done:
+            try:
+                page = self.export_more_data(
+                    key_serial_number,
+                    pages.checkpoint.last_signature_counter,
+                    max_records=page_size,
+                )
+            except TransportErrorNoDataAvailable:
+                return
+            if pages.add(page):
+                yield page
+                pages.processed()
+
+    @_command
+    def get_config_data(self, config_id: GetConfigDataID):
+        """Gets an item of the configuration data of the TSE. The getters for
+        the individual items, like :func:`~TseConnector.get_max_clients`, decode
+        the values further.
+
+        The configuration data is cached in :attr:`device_info`.
+
+        :return: The value as returned by the TSE, as bytes, str or int
+            depending on the data type of the response.
+        """
+        return (yield from _config_data(self, config_id))
+
+    @_command
     def get_time_sync_interval(self) -> int:
         """Gets the required time sync interval in seconds."""
-        response = self._transport.send(
+        value = yield from _config_data(self, GetConfigDataID.TimeSyncInterval)
+        return _config_int(value)
+
+    @_command
+    def get_max_keys(self) -> int:
+        """Gets the maximum number of signing keys of the TSE."""
+        value = yield from _config_data(self, GetConfigDataID.MaxKeys)
+        return _config_int(value)
+
+    @_command
+    def get_max_clients(self) -> int:
+        """Gets the maximum number of clients that can be mapped to the key of
+        the TSE."""
+        value = yield from _config_data(self, GetConfigDataID.MaxClients)
+        return _config_int(value)
+
+    @_command
+    def get_max_transactions(self) -> int:
+        """Gets the maximum number of transactions that can be open at the same
+        time."""
+        value = yield from _config_data(self, GetConfigDataID.MaxTransactions)
+        return _config_int(value)
+
+    @_command
+    def get_signature_algorithm(self) -> str:
+        """Gets the signature algorithm of the TSE, as the dotted OID that log
+        messages and receipts refer to it by."""
+        value = yield from _config_data(self, GetConfigDataID.SignatureAlgorithm)
+        if isinstance(value, bytes):
+            # Imported here to keep tarfile out of the import of the package
+            from bdr_tse.log_messages import decode_oid
+
+            # A DER encoded OBJECT IDENTIFIER, or its bare content
+            if len(value) > 2 and value[0] == 0x06 and value[1] == len(value) - 2:
+                value = value[2:]
+            return decode_oid(value)
+        return value
+
+    @_command
+    def get_certification_id(self) -> str:
+        """Gets the ID of the BSI certification of the TSE."""
+        value = yield from _config_data(self, GetConfigDataID.CertificationId)
+        if isinstance(value, bytes):
+            return value.decode("ascii")
+        return value
+
+
+def _config_data(tse: TseConnector, config_id: GetConfigDataID):
+    """Command generator reading an item of the configuration data, from the
+    :class:`~bdr_tse.device_info.DeviceInfoCache` of ``tse`` if possible."""
+    name = "config_data.{}".format(GetConfigDataID(config_id).name)
+    value = tse.device_info.get(name)
+    if value is None:
+        response = yield (
             TransportCommand.GetConfigData,
-            [(TransportDataType.SHORT, GetConfigDataID.TimeSyncInterval)],
+            [(TransportDataType.SHORT, config_id)],
         )
-        return int.from_bytes(response[0].data, "big")
+        value = response[0].data
+        tse.device_info.set(name, value)
+    return value
+
+
+def _config_int(value: Any) -> int:
+    if isinstance(value, bytes):
+        return int.from_bytes(value, "big")
+    return value
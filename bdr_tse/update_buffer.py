@@ -0,0 +1,262 @@
+"""Coalescing the updates of long-running transactions.
+
+Transactions like the order of a restaurant table stay open for a long time and
+change with every item that is added. Sending an ``UpdateTransaction`` for each
+change takes a round trip to the TSE and a signature each time.
+:class:`UpdateBuffer` collects the updates of a transaction instead and sends
+them as one update once they are old or large enough, or right before the
+transaction is finished::
+
+    updates = UpdateBuffer(tse, max_delay=5.0)
+    started = tse.start_transaction("POS-1", b"", "Kassenbeleg-V1")
+    number = started["transaction_number"]
+    updates.update(number, "POS-1", b"1 coffee\\n", "Kassenbeleg-V1")
+    updates.update(number, "POS-1", b"1 cake\\n", "Kassenbeleg-V1")
+    updates.finish_transaction(number, "POS-1", b"...", "Kassenbeleg-V1", b"")
+
+By default, the process data of the updates is concatenated. Updates are only
+merged if they have the same client ID and process type, otherwise the pending
+update is sent first.
+
+The pending update of a transaction is checked against ``max_delay`` whenever
+the transaction is updated. To send pending updates of transactions that are not
+updated for a while, call :meth:`UpdateBuffer.flush_due` regularly, or start a
+background thread that does with :meth:`UpdateBuffer.start`. The connector must
+then be usable from several threads, e.g. a connector of a
+:class:`~bdr_tse.worker.DeviceWorker`.
+"""
+
+from typing import Callable, Dict, List, Optional
+import logging
+import threading
+import time
+
+from bdr_tse.tse_connector import TseConnector
+
+logger = logging.getLogger(__name__)
+
+
+class PendingUpdate:
+    """An update of a transaction that was not sent to the TSE yet."""
+
+    __slots__ = ("client_id", "process_data", "process_type", "since", "count")
+
+    def __init__(self, client_id: str, process_type: str, since: float):
+        self.client_id = client_id
+        self.process_type = process_type
+        self.process_data = b""
+        #: The :func:`time.monotonic` time of the first of the merged updates
+        self.since = since
+        #: The number of merged updates
+        self.count = 0
+
+
+def _concatenate(pending: bytes, process_data: bytes) -> bytes:
+    return pending + process_data
+
+
+class UpdateBuffer:
+    """Merges successive updates of a transaction and sends them together."""
+
+    def __init__(
+        self,
+        connector: TseConnector,
+        max_delay: float = 1.0,
+        max_size: int = 4096,
+        merge: Callable[[bytes, bytes], bytes] = _concatenate,
+    ):
+        """
+        :param connector: The connector of the TSE.
+        :param max_delay: The time in seconds after which a pending update is
+            sent, counted from the first update merged into it.
+        :param max_size: The size of the process data at which a pending update
+            is sent. The process data of a single update must fit into a
+            command, so keep this well below
+            :data:`~bdr_tse.msc_transport.MAX_COMMAND_DATA_LENGTH`.
+        :param merge: Merges the process data of the pending update and of a
+            new update.
+        """
+        self.connector = connector
+        self.max_delay = max_delay
+        self.max_size = max_size
+        self.merge = merge
+        #: The number of updates added to the buffer
+        self.received = 0
+        #: The number of updates sent to the TSE
+        self.sent = 0
+        self._pending: Dict[int, PendingUpdate] = {}
+        # Held while sending, so that the updates of a transaction are sent in
+        # order
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pending(self) -> Dict[int, PendingUpdate]:
+        """The pending updates, by transaction number."""
+        with self._lock:
+            return dict(self._pending)
+
+    def update(
+        self,
+        transaction_number: int,
+        client_id: str,
+        process_data: bytes,
+        process_type: str,
+    ) -> List[dict]:
+        """Add an update of a transaction, like
+        :func:`~bdr_tse.TseConnector.update_transaction`. The update is sent
+        right away, merged with the pending update of the transaction, if that
+        reaches ``max_size`` or is older than ``max_delay``.
+
+        If an error is raised, the update was not added and can be repeated.
+        Pending updates of other transactions are not sent, see
+        :meth:`flush_due`.
+
+        :return: The responses to the updates that were sent to the TSE because
+            of this call, if any.
+        """
+        results = []
+        with self._lock:
+            now = time.monotonic()
+            pending = self._pending.get(transaction_number)
+            if pending is not None and (
+                pending.client_id != client_id
+                or pending.process_type != process_type
+                or len(pending.process_data) + len(process_data) > self.max_size
+            ):
+                results.append(self._flush_one(transaction_number))
+                pending = None
+
+            merged = PendingUpdate(
+                client_id, process_type, now if pending is None else pending.since
+            )
+            merged.process_data = self.merge(
+                b"" if pending is None else pending.process_data, process_data
+            )
+            merged.count = 1 if pending is None else pending.count + 1
+            if (
+                len(merged.process_data) >= self.max_size
+                or merged.since <= now - self.max_delay
+            ):
+                # Sent before it replaces the pending update, so that the
+                # pending update is unchanged if sending fails
+                results.append(self._send(transaction_number, merged))
+                self._pending.pop(transaction_number, None)
+            else:
+                self._pending[transaction_number] = merged
+            self.received += 1
+        return results
+
+    def flush(self, transaction_number: Optional[int] = None) -> List[dict]:
+        """Send the pending update of ``transaction_number``, or all pending
+        updates.
+
+        :return: The responses to the updates.
+        """
+        with self._lock:
+            if transaction_number is None:
+                numbers = list(self._pending)
+            elif transaction_number in self._pending:
+                numbers = [transaction_number]
+            else:
+                numbers = []
+            return [self._flush_one(number) for number in numbers]
+
+    def flush_due(self) -> List[dict]:
+        """Send the pending updates that are older than ``max_delay``."""
+        with self._lock:
+            deadline = time.monotonic() - self.max_delay
+            return [
+                self._flush_one(number)
+                for number, pending in list(self._pending.items())
+                if pending.since <= deadline
+            ]
+
+    def discard(self, transaction_number: int):
+        """Drop the pending update of a transaction without sending it, e.g.
+        when sending it keeps failing."""
+        with self._lock:
+            self._pending.pop(transaction_number, None)
+
+    def finish_transaction(
+        self,
+        transaction_number: int,
+        client_id: str,
+        process_data: bytes,
+        process_type: str,
+        additional_data: bytes,
+    ) -> dict:
+        """Send the pending update of the transaction, then finish it like
+        :func:`~bdr_tse.TseConnector.finish_transaction`."""
+        with self._lock:
+            self.flush(transaction_number)
+            return self.connector.finish_transaction(
+                transaction_number,
+                client_id,
+                process_data,
+                process_type,
+                additional_data,
+            )
+
+    def _flush_one(self, transaction_number: int) -> dict:
+        pending = self._pending.pop(transaction_number)
+        try:
+            return self._send(transaction_number, pending)
+        except BaseException:
+            # Keep the update, so that it is not lost if the error is transient
+            self._pending[transaction_number] = pending
+            raise
+
+    def _send(self, transaction_number: int, pending: PendingUpdate) -> dict:
+        logger.debug(
+            "Sending %d updates of transaction %d", pending.count, transaction_number
+        )
+        result = self.connector.update_transaction(
+            transaction_number,
+            pending.client_id,
+            pending.process_data,
+            pending.process_type,
+        )
+        self.sent += 1
+        return result
+
+    def next_flush_in(self) -> Optional[float]:
+        """The time in seconds until the oldest pending update is due, or
+        ``None`` if no update is pending."""
+        with self._lock:
+            if not self._pending:
+                return None
+            oldest = min(pending.since for pending in self._pending.values())
+        return max(0.0, oldest + self.max_delay - time.monotonic())
+
+    def start(self):
+        """Send pending updates when they are due in a background thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="bdr-tse-update-buffer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread. Pending updates are not sent, see
+        :meth:`flush`."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        wait = self.max_delay
+        while not self._stop.wait(wait):
+            try:
+                self.flush_due()
+            except Exception:
+                logger.exception("Sending pending updates failed")
+                wait = self.max_delay
+                continue
+            wait = self.next_flush_in()
+            if wait is None:
+                wait = self.max_delay
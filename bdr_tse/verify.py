@@ -0,0 +1,229 @@
+"""Bulk verification of the signatures of exported log messages.
+
+Verification requires the ``cryptography`` package, installed with the
+``verify`` extra.
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, List, NamedTuple, Tuple
+import hashlib
+import logging
+import os
+
+from bdr_tse.log_messages import DataSource, iter_log_messages
+
+logger = logging.getLogger(__name__)
+
+# Hash algorithms of the ecdsa-plain-signatures from BSI TR-03111, by OID
+ECDSA_PLAIN_HASHES = {
+    "0.4.0.127.0.7.1.1.4.1.1": "SHA1",
+    "0.4.0.127.0.7.1.1.4.1.2": "SHA224",
+    "0.4.0.127.0.7.1.1.4.1.3": "SHA256",
+    "0.4.0.127.0.7.1.1.4.1.4": "SHA384",
+    "0.4.0.127.0.7.1.1.4.1.5": "SHA512",
+}
+
+# A unit of work: tuples of signature counter, hash name, signed data and signature
+_Chunk = List[Tuple[int, str, bytes, bytes]]
+
+# The public key of the worker process, loaded once by _init_worker
+_public_key = None
+
+
+class VerificationResult(NamedTuple):
+    """The result of :func:`verify_export`."""
+
+    #: The number of log messages with a valid signature
+    verified: int
+    #: The signature counters of the log messages with an invalid signature, or
+    #: that were not signed with the expected key
+    failures: List[int]
+    #: Ranges of missing signature counters, as inclusive (first, last) tuples
+    gaps: List[Tuple[int, int]]
+
+    @property
+    def ok(self) -> bool:
+        return not self.failures and not self.gaps
+
+
+def _import_cryptography():
+    try:
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec, utils
+    except ImportError:
+        raise ImportError(
+            "Signature verification requires the cryptography package, install "
+            "bdr_tse[verify]"
+        )
+    return x509, hashes, serialization, ec, utils
+
+
+def key_serial_number(public_key) -> bytes:
+    """The serial number of a key, i.e. the SHA-256 hash of the uncompressed
+    public key point, as reported by
+    :func:`~bdr_tse.TseConnector.get_serial_number`."""
+    _, _, serialization, _, _ = _import_cryptography()
+    return hashlib.sha256(
+        public_key.public_bytes(
+            serialization.Encoding.X962,
+            serialization.PublicFormat.UncompressedPoint,
+        )
+    ).digest()
+
+
+def load_signing_key(certificates: bytes, serial_number: bytes = None):
+    """Load the public key that signs log messages from the certificates of the
+    TSE.
+
+    :param certificates: One or more certificates, PEM or DER encoded, as
+        returned by :func:`~bdr_tse.TseConnector.get_certificates`.
+    :param serial_number: The serial number of the key. If given, the certificate
+        of this key is chosen, otherwise the first certificate.
+    :return: The public key.
+    """
+    x509, _, _, _, _ = _import_cryptography()
+    if b"-----BEGIN CERTIFICATE-----" in certificates:
+        chain = x509.load_pem_x509_certificates(certificates)
+    else:
+        chain = [x509.load_der_x509_certificate(certificates)]
+
+    for certificate in chain:
+        public_key = certificate.public_key()
+        if serial_number is None or key_serial_number(public_key) == serial_number:
+            return public_key
+    raise ValueError("No certificate for key {}".format(serial_number.hex()))
+
+
+def _init_worker(public_key_der: bytes):
+    global _public_key
+    _, _, serialization, _, _ = _import_cryptography()
+    _public_key = serialization.load_der_public_key(public_key_der)
+
+
+def _verify_chunk(chunk: _Chunk) -> List[int]:
+    """Verify a chunk of signatures with the public key of the worker process.
+
+    :return: The signature counters of the invalid signatures.
+    """
+    _, hashes, _, ec, utils = _import_cryptography()
+    from cryptography.exceptions import InvalidSignature
+
+    failures = []
+    for signature_counter, hash_name, signed_data, signature in chunk:
+        half = len(signature) // 2
+        der_signature = utils.encode_dss_signature(
+            int.from_bytes(signature[:half], "big"),
+            int.from_bytes(signature[half:], "big"),
+        )
+        try:
+            _public_key.verify(
+                der_signature, signed_data, ec.ECDSA(getattr(hashes, hash_name)())
+            )
+        except InvalidSignature:
+            failures.append(signature_counter)
+    return failures
+
+
+def _find_gaps(signature_counters: Iterable[int]) -> List[Tuple[int, int]]:
+    gaps = []
+    previous = None
+    for counter in sorted(signature_counters):
+        if previous is not None and counter > previous + 1:
+            gaps.append((previous + 1, counter - 1))
+        previous = counter
+    return gaps
+
+
+def verify_export(
+    source: DataSource,
+    certificates: bytes,
+    serial_number: bytes = None,
+    max_workers: int = None,
+    chunk_size: int = 1000,
+) -> VerificationResult:
+    """Verify the signatures of all log messages in exported data, in parallel
+    across a pool of processes.
+
+    :param source: The exported data, see
+        :func:`~bdr_tse.log_messages.iter_log_messages`.
+    :param certificates: The certificates of the TSE, see
+        :func:`~bdr_tse.TseConnector.get_certificates`.
+    :param serial_number: The serial number of the signing key, see
+        :func:`~bdr_tse.TseConnector.get_serial_number`. Log messages signed with
+        another key are reported as failures.
+    :param max_workers: The number of worker processes, defaults to the number
+        of CPUs.
+    :param chunk_size: The number of log messages verified per unit of work.
+    """
+    _, _, serialization, _, _ = _import_cryptography()
+    public_key = load_signing_key(certificates, serial_number)
+    if serial_number is None:
+        serial_number = key_serial_number(public_key)
+    public_key_der = public_key.public_bytes(
+        serialization.Encoding.DER,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+
+    failures: List[int] = []
+    signature_counters: List[int] = []
+    futures: List[Future] = []
+    verified = 0
+
+    def collect(future: Future):
+        nonlocal verified
+        chunk_failures = future.result()
+        failures.extend(chunk_failures)
+        verified -= len(chunk_failures)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    # Limit the chunks in flight so that the export is not read into memory
+    # faster than it can be verified
+    max_pending = 2 * max_workers
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_worker, initargs=(public_key_der,)
+    ) as executor:
+        chunk: _Chunk = []
+        for message in iter_log_messages(source):
+            signature_counters.append(message.signature_counter)
+            hash_name = ECDSA_PLAIN_HASHES.get(message.signature_algorithm)
+            if message.serial_number != serial_number or hash_name is None:
+                logger.warning("Cannot verify %r", message)
+                failures.append(message.signature_counter)
+                continue
+            chunk.append(
+                (
+                    message.signature_counter,
+                    hash_name,
+                    message.signed_data,
+                    message.signature_value,
+                )
+            )
+            verified += 1
+            if len(chunk) >= chunk_size:
+                futures.append(executor.submit(_verify_chunk, chunk))
+                chunk = []
+                while len(futures) >= max_pending:
+                    collect(futures.pop(0))
+        if chunk:
+            futures.append(executor.submit(_verify_chunk, chunk))
+        for future in futures:
+            collect(future)
+
+    return VerificationResult(
+        verified=verified,
+        failures=sorted(failures),
+        gaps=_find_gaps(signature_counters),
+    )
+
+
+def verify_tse_export(tse, source: DataSource, **kwargs) -> VerificationResult:
+    """Verify exported data against the signing key of a TSE, fetching its
+    certificates and key serial number from the TSE. Takes the same keyword
+    arguments as :func:`verify_export`.
+
+    :param tse: The :class:`~bdr_tse.TseConnector` the data was exported from.
+    """
+    return verify_export(
+        source, tse.get_certificates(), serial_number=tse.get_serial_number(), **kwargs
+    )
@@ -0,0 +1,277 @@
+"""Sharing a TSE between threads.
+
+A :class:`~bdr_tse.transport.Transport` must only be used by one thread at a
+time. A :class:`DeviceWorker` owns the transport of a TSE and sends the commands
+submitted from any thread one after the other in its own thread. Connectors that
+send their commands through the worker can be used from any number of
+threads::
+
+    worker = DeviceWorker(Transport("/mnt/tse"))
+    tse = worker.connector()
+    # tse can now be shared between threads
+    ...
+    worker.close()
+
+Commands that are submitted while the worker is busy are queued and taken from
+the queue as a batch once the device is free, so that the device is kept busy
+while commands are waiting. Maintenance like
+:class:`~bdr_tse.time_sync.TimeSync` is submitted with
+:meth:`DeviceWorker.submit_idle` and only runs when no commands are waiting.
+"""
+
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, List, Optional
+import logging
+import queue
+import threading
+
+from bdr_tse.metrics import TransportMetrics
+from bdr_tse.msc_transport import POLL_HISTORY_LENGTH
+from bdr_tse.tracing import TransportHook
+from bdr_tse.transport import Transport, TransportDataTupleType
+
+logger = logging.getLogger(__name__)
+
+# Fragments read ahead by the worker before it waits for the consumer of a stream
+STREAM_READ_AHEAD = 4
+
+_END = object()
+
+
+class DeviceWorker:
+    """Owns a :class:`~bdr_tse.transport.Transport` and calls functions with it
+    in a dedicated thread."""
+
+    def __init__(self, transport: Transport, name: str = "bdr-tse-device"):
+        """
+        :param transport: The transport of the TSE. It must not be used directly
+            anymore and is closed when the worker is closed.
+        :param name: The name of the thread.
+        """
+        self.transport = transport
+        # The number of jobs that the most recent batches contained
+        self.batch_sizes: Deque[int] = deque(maxlen=POLL_HISTORY_LENGTH)
+        self._jobs: Deque[tuple] = deque()
+        self._idle_jobs: Deque[tuple] = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Call ``fn(transport, *args, **kwargs)`` in the worker thread.
+
+        :return: A :class:`~concurrent.futures.Future` of the result. Jobs that
+            are cancelled before they started are skipped.
+        """
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # Called from a job, e.g. by a hook. Waiting for the queue would
+            # deadlock.
+            self._execute((future, fn, args, kwargs))
+            return future
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("DeviceWorker is closed")
+            self._jobs.append((future, fn, args, kwargs))
+            self._condition.notify()
+        return future
+
+    def submit_idle(self, fn: Callable, *args, **kwargs) -> Future:
+        """Like :meth:`submit`, but the job only starts when no jobs submitted
+        with :meth:`submit` are queued, so that it does not delay them. Jobs that
+        have not started when the worker is closed are cancelled.
+        """
+        future = Future()
+        if threading.current_thread() is self._thread:
+            self._execute((future, fn, args, kwargs))
+            return future
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("DeviceWorker is closed")
+            self._idle_jobs.append((future, fn, args, kwargs))
+            self._condition.notify()
+        return future
+
+    def connector(self):
+        """A :class:`~bdr_tse.TseConnector` that sends its commands through this
+        worker."""
+        from bdr_tse.tse_connector import TseConnector
+
+        return TseConnector(transport=WorkerTransport(self))
+
+    def close(self, timeout: Optional[float] = None):
+        """Send the jobs that are already queued, then close the transport and
+        stop the thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            idle_job = None
+            with self._condition:
+                while not self._jobs and not self._idle_jobs and not self._closed:
+                    self._condition.wait()
+                # Take all queued jobs at once, so that submitting threads
+                # don't compete with the worker for the lock between jobs
+                jobs, self._jobs = self._jobs, deque()
+                closed = self._closed
+                if not jobs and not closed and self._idle_jobs:
+                    # Check for other jobs again after every idle job
+                    idle_job = self._idle_jobs.popleft()
+
+            if jobs:
+                self.batch_sizes.append(len(jobs))
+            for job in jobs:
+                self._execute(job)
+            if idle_job is not None:
+                self._execute(idle_job)
+            if closed and not jobs:
+                break
+
+        with self._condition:
+            idle_jobs, self._idle_jobs = self._idle_jobs, deque()
+        for future, _, _, _ in idle_jobs:
+            future.cancel()
+
+        try:
+            self.transport.close()
+        except Exception:
+            logger.exception("Failed to close the transport")
+
+    def _execute(self, job: tuple):
+        future, fn, args, kwargs = job
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(self.transport, *args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
+
+class WorkerTransport:
+    """Sends commands through a :class:`DeviceWorker`. Offers the methods of
+    :class:`~bdr_tse.transport.Transport` that :class:`~bdr_tse.TseConnector`
+    uses, and can be used from any thread.
+
+    Hooks and metrics are those of the transport of the worker. Hooks are called
+    in the worker thread.
+    """
+
+    def __init__(self, worker: DeviceWorker):
+        self.worker = worker
+
+    @property
+    def metrics(self) -> Optional[TransportMetrics]:
+        return self.worker.transport.metrics
+
+    def add_hook(self, hook: TransportHook):
+        self.worker.submit(Transport.add_hook, hook).result()
+
+    def remove_hook(self, hook: TransportHook):
+        self.worker.submit(Transport.remove_hook, hook).result()
+
+    def send(self, cmd, params: List[TransportDataTupleType] = []):
+        return self.worker.submit(Transport.send, cmd, params).result()
+
+    def send_stream(
+        self, cmd, params: List[TransportDataTupleType] = []
+    ) -> "WorkerResponseStream":
+        """Like :meth:`~bdr_tse.transport.Transport.send_stream`. The worker reads
+        the fragments of the response ahead of the consumer and does not send
+        other commands until the stream is complete or closed.
+
+        Called from a job, the command is sent directly, as the worker cannot
+        read ahead of its own consumer."""
+        if threading.current_thread() is self.worker._thread:
+            return self.worker.transport.send_stream(cmd, params)
+        stream = WorkerResponseStream(cmd)
+        future = self.worker.submit(_read_stream, cmd, params, stream)
+        stream._start(future)
+        return stream
+
+    def close(self):
+        self.worker.close()
+
+
+def _read_stream(transport: Transport, cmd, params, proxy: "WorkerResponseStream"):
+    fragments = proxy._fragments
+    try:
+        with transport.send_stream(cmd, params) as stream:
+            fragments.put((stream.total_length, stream.is_export_data_response))
+            for fragment in stream:
+                if proxy._closed:
+                    break
+                fragments.put(fragment)
+    finally:
+        if not proxy._closed:
+            fragments.put(_END)
+
+
+class WorkerResponseStream:
+    """Iterator over the fragments of the response data of a command, as returned
+    by :meth:`WorkerTransport.send_stream`. Behaves like
+    :class:`~bdr_tse.transport.ResponseStream`."""
+
+    def __init__(self, command):
+        self.command = command
+        #: The length of the complete response data, as announced by the TSE
+        self.total_length = 0
+        #: The length of the response data read from the TSE so far
+        self.received_length = 0
+        self.is_export_data_response = False
+        self._fragments: queue.Queue = queue.Queue(maxsize=STREAM_READ_AHEAD)
+        self._future: Optional[Future] = None
+        self._closed = False
+        self._done = False
+
+    def _start(self, future: Future):
+        self._future = future
+        header = self._fragments.get()
+        if header is _END:
+            # The command failed, raise its exception
+            future.result()
+        self.total_length, self.is_export_data_response = header
+
+    @property
+    def complete(self) -> bool:
+        """Whether all fragments have been read from the TSE."""
+        return self.received_length >= self.total_length
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self._done:
+            raise StopIteration
+        fragment = self._fragments.get()
+        if fragment is _END:
+            self._done = True
+            self._future.result()
+            raise StopIteration
+        self.received_length += len(fragment)
+        return fragment
+
+    def close(self):
+        """Stop reading the response. The worker aborts the fragmented read on the
+        TSE if it is not complete yet."""
+        if self._done:
+            return
+        self._closed = self._done = True
+        # Unblock the worker if it is waiting for room for the next fragment
+        try:
+            while True:
+                self._fragments.get_nowait()
+        except queue.Empty:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
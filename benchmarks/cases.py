@@ -0,0 +1,409 @@
+"""The benchmark cases, shared by the standalone runner and the pytest-benchmark
+suite.
+
+Each case is a function that sets up the benchmark and returns a callable
+running one iteration of it, plus a cleanup callable.
+"""
+
+from typing import Callable, Dict, NamedTuple, Tuple
+import mmap
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+from bdr_tse import msc_transport, tse_connector
+from bdr_tse.backends import MemoryBackend
+from bdr_tse.daemon import TseClient, TseServer
+from bdr_tse.capture import CaptureRing
+from bdr_tse.emulator import EmulatorTransport
+from bdr_tse.tracing import TransportHook
+from bdr_tse.transport import (
+    TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ,
+    TRANSPORT_COMMAND_PACKET,
+    TRANSPORT_RESULT,
+    Transport,
+    TransportCommand,
+    TransportDataType,
+    decode_transport_result,
+)
+from bdr_tse.worker import DeviceWorker
+
+MB = 1024 * 1024
+# Export sizes that are benchmarked by default, and with large benchmarks enabled
+EXPORT_SIZES = [1 * MB]
+LARGE_EXPORT_SIZES = [100 * MB, 1024 * MB]
+
+Setup = Callable[[], Tuple[Callable[[], object], Callable[[], None]]]
+
+
+class Case(NamedTuple):
+    name: str
+    setup: Setup
+    #: Whether the case takes long enough to only be run on request
+    large: bool = False
+
+
+def _noop():
+    pass
+
+
+def _build_result(params) -> bytes:
+    return TRANSPORT_RESULT.build(
+        [{"data_type": bytes([p[0]]), "data": p[1]} for p in params]
+    )
+
+
+START_TRANSACTION_PARAMS = [
+    (TransportDataType.STRING, "POS-1"),
+    (TransportDataType.BYTE_ARRAY, b""),
+    (TransportDataType.STRING, ""),
+    (TransportDataType.BYTE_ARRAY, b""),
+]
+
+START_TRANSACTION_RESULT = _build_result(
+    [
+        (TransportDataType.BYTE_ARRAY, (17).to_bytes(4, "big")),
+        (TransportDataType.BYTE_ARRAY, (42).to_bytes(4, "big")),
+        (TransportDataType.BYTE_ARRAY, (1600000000).to_bytes(8, "big")),
+        (TransportDataType.BYTE_ARRAY, bytes(96)),
+        (TransportDataType.BYTE_ARRAY, bytes(32)),
+    ]
+)
+
+FINISH_TRANSACTION_RESULT = _build_result(
+    [
+        (TransportDataType.BYTE_ARRAY, (43).to_bytes(4, "big")),
+        (TransportDataType.BYTE_ARRAY, (1600000001).to_bytes(8, "big")),
+        (TransportDataType.BYTE_ARRAY, bytes(96)),
+        (TransportDataType.BYTE_ARRAY, bytes(32)),
+    ]
+)
+
+
+def encode():
+    transport = Transport(backend=MemoryBackend())
+    return (
+        lambda: transport._encode(
+            TransportCommand.StartTransaction, START_TRANSACTION_PARAMS
+        ),
+        _noop,
+    )
+
+
+def encode_construct():
+    def build():
+        return TRANSPORT_COMMAND_PACKET.build(
+            {
+                "command": TransportCommand.StartTransaction,
+                "command_data": [
+                    {"data_type": bytes([p[0]]), "data": p[1]}
+                    for p in START_TRANSACTION_PARAMS
+                ],
+            }
+        )
+
+    return build, _noop
+
+
+def decode():
+    transport = Transport(backend=MemoryBackend())
+    data = len(START_TRANSACTION_RESULT).to_bytes(2, "big") + START_TRANSACTION_RESULT
+    return lambda: transport._decode(data), _noop
+
+
+def _parse_construct(result: bytes) -> Setup:
+    def setup():
+        return lambda: TRANSPORT_RESULT.parse(result), _noop
+
+    return setup
+
+
+def _parse(result: bytes) -> Setup:
+    def setup():
+        return lambda: [p.data for p in decode_transport_result(result)], _noop
+
+    return setup
+
+
+def _import(module: str) -> Setup:
+    """Import ``module`` in a fresh interpreter, as a CLI invocation does."""
+
+    def setup():
+        command = [sys.executable, "-c", "import {}".format(module)]
+        return lambda: subprocess.run(command, check=True), _noop
+
+    return setup
+
+
+def msc_build_construct():
+    command_data = bytes(200)
+    return (
+        lambda: msc_transport.MSC_TRANSPORT_COMMAND_PACKET.build(
+            {"command_data": command_data}
+        ),
+        _noop,
+    )
+
+
+def msc_build():
+    codec = msc_transport.MscFrameCodec(mmap.mmap(-1, msc_transport.BLOCK_SIZE))
+    command_data = bytes(200)
+    return lambda: codec.build_command(command_data), codec.command_buf.close
+
+
+def _response_block() -> bytes:
+    return msc_transport.MSC_TRANSPORT_RESPONSE_PACKET.build(
+        {
+            "random_token": [1, 2, 3, 4],
+            "response_data": len(START_TRANSACTION_RESULT).to_bytes(2, "big")
+            + START_TRANSACTION_RESULT,
+        }
+    )
+
+
+def msc_parse_construct():
+    block = _response_block()
+    return lambda: msc_transport.MSC_TRANSPORT_RESPONSE_PACKET.parse(block), _noop
+
+
+def msc_parse():
+    block = _response_block()
+    return lambda: msc_transport.MscFrameCodec.parse_response(block), _noop
+
+
+class CannedBackend:
+    """Backend that answers every command with the same response, to measure
+    the cost of :meth:`~bdr_tse.transport.Transport.send` alone."""
+
+    def __init__(self, response: bytes):
+        self.response = response
+
+    def write(self, command_data: bytes):
+        pass
+
+    def read(self, timeout=None, command=None) -> bytes:
+        return self.response
+
+    def set_suspend(self, suspend, timeout=None):
+        pass
+
+    def close(self):
+        pass
+
+
+def _send(hook: bool) -> Setup:
+    def setup():
+        transport = Transport(
+            backend=CannedBackend(
+                len(START_TRANSACTION_RESULT).to_bytes(2, "big")
+                + START_TRANSACTION_RESULT
+            )
+        )
+        if hook:
+            transport.add_hook(TransportHook())
+        return (
+            lambda: transport.send(
+                TransportCommand.StartTransaction, START_TRANSACTION_PARAMS
+            ),
+            _noop,
+        )
+
+    return setup
+
+
+class ExportBackend:
+    """Backend that answers an export with ``size`` bytes of data, in fragments
+    of the maximum size, without any emulation overhead."""
+
+    FRAGMENT_LENGTH = msc_transport.BLOCK_SIZE - 34
+
+    def __init__(self, size: int):
+        self.size = size
+        self._fragment = bytes(self.FRAGMENT_LENGTH)
+        self._remaining = 0
+        self._first = False
+
+    def write(self, command_data: bytes):
+        if command_data != TRANSPORT_COMMAND_CONTINUE_FRAGMENTED_READ:
+            self._remaining = self.size
+            self._first = True
+
+    def read(self, timeout=None, command=None) -> bytes:
+        if self._first:
+            self._first = False
+            header = bytes([0x90, 0x00]) + self.size.to_bytes(8, "big")
+            length = min(self.FRAGMENT_LENGTH - len(header), self._remaining)
+            self._remaining -= length
+            return header + self._fragment[:length]
+        length = min(self.FRAGMENT_LENGTH, self._remaining)
+        self._remaining -= length
+        return self._fragment if length == self.FRAGMENT_LENGTH else bytes(length)
+
+    def set_suspend(self, suspend, timeout=None):
+        pass
+
+    def close(self):
+        pass
+
+
+def _export_join(size: int) -> Setup:
+    def setup():
+        tse = tse_connector.TseConnector(backend=ExportBackend(size))
+        return tse.export_data, _noop
+
+    return setup
+
+
+def _export_stream(size: int) -> Setup:
+    def setup():
+        tse = tse_connector.TseConnector(backend=ExportBackend(size))
+
+        def run():
+            for _ in tse.export_data_iter():
+                pass
+
+        return run, _noop
+
+    return setup
+
+
+def _transactions(tse: tse_connector.TseConnector):
+    def run():
+        started = tse.start_transaction("POS-1", b"", "")
+        tse.finish_transaction(
+            started["transaction_number"],
+            "POS-1",
+            b"Beleg^10.00_0.00_0.00_0.00_0.00^10.00:Bar",
+            "Kassenbeleg-V1",
+            b"",
+        )
+
+    return run
+
+
+def round_trip_memory():
+    return _transactions(tse_connector.TseConnector(backend=MemoryBackend())), _noop
+
+
+def _round_trip_emulator(capture: bool) -> Setup:
+    def setup():
+        transport = EmulatorTransport(capture=CaptureRing() if capture else None)
+        return (
+            _transactions(tse_connector.TseConnector(backend=transport)),
+            transport.close,
+        )
+
+    return setup
+
+
+class FileBackedTransport(EmulatorTransport):
+    """An :class:`~bdr_tse.emulator.EmulatorTransport` that exchanges its blocks
+    through a ``TSE-IO.bin`` file like :class:`~bdr_tse.msc_transport.MscTransport`
+    does with a TSE, so that the cost of the system calls is included.
+
+    The emulator answers each command block by writing its response block into
+    the file. ``O_DIRECT`` is not used, since many file systems do not support it.
+    """
+
+    def __init__(self, directory, **kwargs):
+        """
+        :param directory: The directory to create ``TSE-IO.bin`` in.
+        """
+        self.path = os.path.join(directory, msc_transport.MscTransport.CMD_FILENAME)
+        super().__init__(**kwargs)
+
+    def _open_device(self) -> int:
+        path = self.path
+        with open(path, "wb") as f:
+            f.write(bytes(msc_transport.BLOCK_SIZE))
+        return os.open(path, os.O_RDWR)
+
+    def _close_device(self):
+        os.close(self._fd)
+
+    def _write_block(self, data):
+        msc_transport.MscTransport._write_block(self, data)
+        block = os.pread(self._fd, msc_transport.BLOCK_SIZE, 0)
+        EmulatorTransport._write_block(self, block)
+        os.pwrite(self._fd, EmulatorTransport._read_block(self), 0)
+
+    _read_block = msc_transport.MscTransport._read_block
+
+
+def round_trip_worker():
+    worker = DeviceWorker(Transport(backend=EmulatorTransport()))
+    return _transactions(worker.connector()), worker.close
+
+
+def round_trip_daemon():
+    tempdir = tempfile.TemporaryDirectory()
+    path = os.path.join(tempdir.name, "bdr-tse.sock")
+    worker = DeviceWorker(Transport(backend=EmulatorTransport()))
+    server = TseServer(path, worker)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+    thread.start()
+    client = TseClient(path)
+
+    def cleanup():
+        client.close()
+        server.shutdown()
+        thread.join()
+        server.server_close()
+        worker.close()
+        tempdir.cleanup()
+
+    return _transactions(client), cleanup
+
+
+def round_trip_file():
+    tempdir = tempfile.TemporaryDirectory()
+    transport = FileBackedTransport(tempdir.name)
+
+    def cleanup():
+        transport.close()
+        tempdir.cleanup()
+
+    return _transactions(tse_connector.TseConnector(backend=transport)), cleanup
+
+
+CASES = [
+    Case("encode_construct", encode_construct),
+    Case("encode", encode),
+    Case("decode", decode),
+    Case(
+        "parse_start_transaction_construct",
+        _parse_construct(START_TRANSACTION_RESULT),
+    ),
+    Case("parse_start_transaction", _parse(START_TRANSACTION_RESULT)),
+    Case(
+        "parse_finish_transaction_construct",
+        _parse_construct(FINISH_TRANSACTION_RESULT),
+    ),
+    Case("parse_finish_transaction", _parse(FINISH_TRANSACTION_RESULT)),
+    Case("msc_build_construct", msc_build_construct),
+    Case("msc_build", msc_build),
+    Case("msc_parse_construct", msc_parse_construct),
+    Case("msc_parse", msc_parse),
+    Case("send", _send(hook=False)),
+    Case("send_with_hook", _send(hook=True)),
+    Case("round_trip_memory", round_trip_memory),
+    Case("round_trip_emulator", _round_trip_emulator(capture=False)),
+    Case("round_trip_emulator_capture", _round_trip_emulator(capture=True)),
+    Case("round_trip_worker", round_trip_worker),
+    Case("round_trip_daemon", round_trip_daemon),
+    Case("round_trip_file", round_trip_file),
+    Case("import_package", _import("bdr_tse")),
+    Case("import_cli", _import("bdr_tse.cli")),
+]
+for _size in EXPORT_SIZES + LARGE_EXPORT_SIZES:
+    _large = _size in LARGE_EXPORT_SIZES
+    CASES.append(
+        Case("export_join_{}mb".format(_size // MB), _export_join(_size), _large)
+    )
+    CASES.append(
+        Case("export_stream_{}mb".format(_size // MB), _export_stream(_size), _large)
+    )
+
+CASES_BY_NAME: Dict[str, Case] = {case.name: case for case in CASES}
@@ -0,0 +1,113 @@
+"""Run the benchmarks without pytest-benchmark and store the results as JSON.
+
+Run from the root of the repository::
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --output new.json --compare results.json
+
+Results are the seconds per iteration of each case.
+"""
+
+from datetime import datetime, timezone
+import json
+import platform
+import statistics
+import sys
+import timeit
+
+import click
+
+from benchmarks.cases import CASES, CASES_BY_NAME
+
+
+def run_case(case, repeat: int, min_time: float) -> dict:
+    run, cleanup = case.setup()
+    try:
+        timer = timeit.Timer(run)
+        # Calibrate the number of iterations so that each round takes at least
+        # min_time, like timeit's autorange
+        number = 1
+        while True:
+            elapsed = timer.timeit(number)
+            if elapsed >= min_time:
+                break
+            number *= 10 if elapsed < min_time / 10 else 2
+        rounds = [elapsed / number] + [
+            timer.timeit(number) / number for _ in range(repeat - 1)
+        ]
+    finally:
+        cleanup()
+    return {
+        "iterations": number,
+        "rounds": len(rounds),
+        "min": min(rounds),
+        "max": max(rounds),
+        "mean": statistics.mean(rounds),
+        "median": statistics.median(rounds),
+        "stdev": statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+    }
+
+
+def _format_time(seconds: float) -> str:
+    for unit, factor in (("s", 1), ("ms", 1e3), ("us", 1e6)):
+        if seconds * factor >= 1:
+            return "{:.3f} {}".format(seconds * factor, unit)
+    return "{:.1f} ns".format(seconds * 1e9)
+
+
+@click.command()
+@click.option("--output", type=click.Path(dir_okay=False), help="Write JSON here")
+@click.option(
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Compare against the results in this JSON file",
+)
+@click.option("--large", is_flag=True, help="Include the 100 MB and 1 GB exports")
+@click.option("--repeat", default=5, show_default=True, help="Rounds per case")
+@click.option(
+    "--min-time", default=0.2, show_default=True, help="Minimum seconds per round"
+)
+@click.argument("names", nargs=-1)
+def main(output, compare, large, repeat, min_time, names):
+    """Run the benchmark cases NAMES, or all of them."""
+    for name in names:
+        if name not in CASES_BY_NAME:
+            raise click.BadParameter("Unknown case {}".format(name))
+    cases = [
+        case
+        for case in CASES
+        if (case.name in names if names else large or not case.large)
+    ]
+
+    baseline = {}
+    if compare:
+        with open(compare) as f:
+            baseline = json.load(f)["benchmarks"]
+
+    results = {}
+    for case in cases:
+        result = results[case.name] = run_case(case, repeat, min_time)
+        line = "{:<40} {:>14}".format(case.name, _format_time(result["median"]))
+        if case.name in baseline:
+            line += "  {:+.1%}".format(
+                result["median"] / baseline[case.name]["median"] - 1
+            )
+        click.echo(line)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(
+                {
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "python": sys.version,
+                    "platform": platform.platform(),
+                    "machine": platform.machine(),
+                    "benchmarks": results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""The benchmark cases as a pytest-benchmark suite. Store results as JSON with
+``--benchmark-json``, e.g.::
+
+    pytest benchmarks --benchmark-json results.json
+
+The 100 MB and 1 GB exports only run with ``BDR_TSE_LARGE_BENCHMARKS=1``.
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from benchmarks.cases import CASES
+
+LARGE = bool(os.environ.get("BDR_TSE_LARGE_BENCHMARKS"))
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case.name for case in CASES])
+def test_benchmark(benchmark, case):
+    if case.large and not LARGE:
+        pytest.skip("Set BDR_TSE_LARGE_BENCHMARKS=1 to run large benchmarks")
+    run, cleanup = case.setup()
+    try:
+        benchmark(run)
+    finally:
+        cleanup()
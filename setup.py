@@ -8,6 +8,9 @@ setup(
         "click",
         "construct",
     ],
+    extras_require={
+        "verify": ["cryptography"],
+    },
     entry_points="""
         [console_scripts]
         bdr-tse=bdr_tse.cli:cli